@@ -3,24 +3,73 @@ from fastapi.responses import RedirectResponse
 from fastapi.security import OAuth2PasswordBearer
 
 from config.dependencies import get_link_service
-from middlewares.link_validation import validate_link_middleware
+from middlewares.link_validation import LINK_NOT_FOUND, find_short_url
 from middlewares.user_validation import validate_user_middleware
+from middlewares.redirect_fast_path import (
+    RedirectFastPathMiddleware,
+    REDIRECT_DURATION_HIT,
+    REDIRECT_DURATION_MISS,
+    REDIRECT_NOT_FOUND,
+)
+from middlewares.query_stats import QueryStatsMiddleware
 from services.link_service import LinkService
 load_dotenv()
 
-from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Request
-from routers import link, auth, click
+from contextlib import asynccontextmanager
+import time
+from fastapi import Depends, FastAPI, HTTPException, Request
+from routers import link, auth, click, stats, metrics
 from fastapi.middleware.cors import CORSMiddleware
-from models.models import Base
+from models.migrations import run_migrations
 import uvicorn
 from config.config import (
-    engine
+    engine,
+    async_engine,
+    REDIRECT_FAST_PATH,
+    QUERY_STATS_ENABLED,
+    CLICK_ARCHIVE_ENABLED
 )
+from services.click_archive import click_archiver
+from services.click_ingestion import click_pipeline
+from services.click_partitions import click_partition_maintainer
+from services.ip_enrichment import ip_enrichment_worker
+from services.link_filter import link_filter
+from services.rollup_service import rollup_compactor
+from services.token_denylist import token_denylist
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    ip_enrichment_worker.start()
+    click_pipeline.start()
+    rollup_compactor.start()
+    link_filter.start()
+    token_denylist.start()
+    click_partition_maintainer.start()
+    if CLICK_ARCHIVE_ENABLED:
+        click_archiver.start()
+    yield
+    click_archiver.stop()
+    click_partition_maintainer.stop()
+    token_denylist.stop()
+    link_filter.stop()
+    rollup_compactor.stop()
+    click_pipeline.stop()
+    ip_enrichment_worker.stop()
+    await async_engine.dispose()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = ["*"]
 
+# added before CORSMiddleware so it runs inside it and redirects keep their CORS headers
+if REDIRECT_FAST_PATH:
+    app.add_middleware(RedirectFastPathMiddleware)
+# wraps the fast path too, so redirects get Server-Timing as well
+if QUERY_STATS_ENABLED:
+    app.add_middleware(QueryStatsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -29,24 +78,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-Base.metadata.create_all(bind=engine)
+# creates missing tables too, under a lock shared by all workers
+run_migrations(engine)
 
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(link.router, prefix="/link", tags=["link"])
 app.include_router(click.router, prefix="/click", tags=["click"])
+app.include_router(stats.router, prefix="/stats", tags=["stats"])
+app.include_router(metrics.router, tags=["metrics"])
 
 @app.get("/{short_url}")
 async def redirect_to_long_url(
+    short_url: str,
     request: Request,
-    background_tasks: BackgroundTasks,
-    link = Depends(validate_link_middleware),  
     link_service: LinkService = Depends(get_link_service),
 ):
+    # records the same metrics as RedirectFastPathMiddleware, which serves this path unless REDIRECT_FAST_PATH is off
+    start = time.perf_counter()
+    link, cache_hit = await find_short_url(short_url, link_service.db)
+    if not link or link.expired:
+        REDIRECT_NOT_FOUND.inc()
+        raise HTTPException(status_code=404, detail=LINK_NOT_FOUND)
     try:
-        link_service.redirect_to_url(link, request, background_tasks)
-        return RedirectResponse(url=link.long_url)
+        long_url = await link_service.redirect_to_url(link, request)
+        response = RedirectResponse(url=long_url)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    (REDIRECT_DURATION_HIT if cache_hit else REDIRECT_DURATION_MISS).observe(time.perf_counter() - start)
+    return response
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
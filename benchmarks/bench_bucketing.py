@@ -0,0 +1,84 @@
+import argparse
+from datetime import datetime, timedelta
+import random
+import time
+
+from services.bucketing import fill_series, truncate
+
+
+# Gap-filling loops ClickService used before the shared bucketing engine, kept for comparison
+def legacy_days(query, start_date, end_date):
+    daily_clicks = []
+    current_date = end_date
+    while current_date >= start_date:
+        formatted_date = current_date.strftime('%Y-%m-%d')
+        daily_clicks.append(next((clicks for date, clicks in query if date == formatted_date), 0))
+        current_date -= timedelta(days=1)
+    return daily_clicks
+
+
+def legacy_weeks(query, start_date, end_date):
+    weekly_clicks = []
+    query_dict = {result[0]: result[1] for result in query}
+    current_date = end_date
+    while current_date >= start_date:
+        week_start = current_date - timedelta(days=current_date.weekday())
+        week_end = week_start + timedelta(days=6)
+        weekly_clicks.append(sum(
+            clicks for date, clicks in query_dict.items()
+            if week_start <= datetime.strptime(date, '%Y-%m-%dT%H:%M:%S+0000') <= week_end
+        ))
+        current_date -= timedelta(weeks=1)
+    return weekly_clicks
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="gap filling: legacy loops vs services.bucketing.fill_series")
+    parser.add_argument("--clicks", type=int, default=2_000_000, help="clicks behind the 45-day series")
+    parser.add_argument("--week-rows", type=int, default=100_000, help="per-second rows fed to the legacy week loop")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=45)
+
+    hours = [(bucket, 0) for bucket, _ in reversed(fill_series([], start_date, end_date, "hour"))]
+    counts = [0] * len(hours)
+    for _ in range(min(args.clicks, 200_000)):
+        counts[rng.randrange(len(hours))] += args.clicks // min(args.clicks, 200_000)
+    hourly_rows = [(bucket, clicks) for (bucket, _), clicks in zip(hours, counts) if clicks]
+    print(f"45-day hourly series: {len(hourly_rows)} non-empty buckets, {sum(counts)} clicks")
+    print(f"  fill_series hour  : {timed(lambda: fill_series(hourly_rows, start_date, end_date, 'hour'), args.repeat):8.2f} ms")
+
+    daily = {}
+    for bucket, clicks in hourly_rows:
+        day = truncate(bucket, "day")
+        daily[day] = daily.get(day, 0) + clicks
+    daily_rows = sorted(daily.items())
+    legacy_daily_rows = [(day.strftime('%Y-%m-%d'), clicks) for day, clicks in daily_rows]
+    print(f"  legacy day        : {timed(lambda: legacy_days(legacy_daily_rows, start_date, end_date), args.repeat):8.2f} ms")
+    print(f"  fill_series day   : {timed(lambda: fill_series(daily_rows, start_date, end_date, 'day'), args.repeat):8.2f} ms")
+
+    week_start = end_date - timedelta(weeks=6)
+    second_rows = sorted(
+        week_start + timedelta(seconds=rng.randrange(6 * 7 * 86400)) for _ in range(args.week_rows)
+    )
+    legacy_week_rows = [(ts.strftime('%Y-%m-%dT%H:%M:%S+0000'), 1) for ts in second_rows]
+    second_rows = [(ts, 1) for ts in second_rows]
+    print(f"week series over {args.week_rows} per-second rows")
+    print(f"  legacy week       : {timed(lambda: legacy_weeks(legacy_week_rows, week_start, end_date), 1):8.2f} ms")
+    print(f"  fill_series week  : {timed(lambda: fill_series(second_rows, week_start, end_date, 'week'), args.repeat):8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import func, select
+
+from models.models import Click as ClickModel
+from services.click_archive import ClickArchive
+from services.click_service import ClickService
+from services.link_service import LinkService
+import services.click_service as click_service
+import services.link_service as link_service
+from benchmarks.seed import create_session_factory, create_async_session_factory, seed_links, seed_clicks
+
+
+async def timed_queries(AsyncSession, link_id, repeat):
+    timings = {}
+    async with AsyncSession() as db:
+        for label, query in (
+            ("countries, all time", lambda: ClickService(db).clicks_by_country(link_id)),
+            ("unique clicks count", lambda: LinkService(db).get_unique_clicks(link_id, count_only=True)),
+        ):
+            best, result = float("inf"), None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                result = await query()
+                best = min(best, time.perf_counter() - start)
+            timings[label] = (best, result)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analytics over the hot clicks table vs Parquet archive plus hot table")
+    parser.add_argument("--database-url")
+    parser.add_argument("--clicks", type=int, default=500_000)
+    parser.add_argument("--days", type=int, default=365, help="clicks are spread over this many days")
+    parser.add_argument("--archive-after-days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    database_url = args.database_url or f"sqlite:///{os.path.join(directory, 'archive.db')}"
+    engine, Session = create_session_factory(database_url)
+    with Session() as db:
+        _, (link_id,) = seed_links(db)
+        start = time.perf_counter()
+        seed_clicks(db, link_id, args.clicks, days=args.days)
+    print(f"seeded {args.clicks} clicks over {args.days} days in {time.perf_counter() - start:.1f}s ({database_url})")
+
+    # the services read the module-level archive, swap in one under the temp directory
+    archive = ClickArchive(os.path.join(directory, "click_archive"), session_factory=Session, after_days=args.archive_after_days)
+    click_service.click_archive = archive
+    link_service.click_archive = archive
+
+    async def run():
+        async_engine, AsyncSession = create_async_session_factory(database_url)
+        before = await timed_queries(AsyncSession, link_id, args.repeat)
+        start = time.perf_counter()
+        archived = await asyncio.to_thread(archive.archive_clicks)
+        elapsed = time.perf_counter() - start
+        after = await timed_queries(AsyncSession, link_id, args.repeat)
+        await async_engine.dispose()
+        return before, after, archived, elapsed
+
+    before, after, archived, elapsed = asyncio.run(run())
+    with Session() as db:
+        hot = db.scalar(select(func.count(ClickModel.id)))
+    stats = archive.stats()
+    print(f"archived {archived} clicks older than {args.archive_after_days} days in {elapsed:.1f}s: "
+          f"{stats['files']} files over {stats['months']} months, {stats['bytes'] / 2**20:.1f} MiB; {hot} clicks left in the table")
+    for label, (seconds, result) in before.items():
+        seconds_after, result_after = after[label]
+        same = "same result" if result == result_after or (isinstance(result, dict) and result["metrics"] == result_after["metrics"]) else "RESULT DIFFERS"
+        print(f"  {label:<20}: table only {seconds * 1000:8.1f} ms   archive + table {seconds_after * 1000:8.1f} ms   {same}")
+
+
+if __name__ == "__main__":
+    main()
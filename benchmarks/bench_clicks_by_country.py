@@ -0,0 +1,63 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from models.models import Click as ClickModel, IPInfo as IPInfoModel
+from services.click_service import ClickService
+from benchmarks.seed import create_session_factory, create_async_session_factory, seed_links, seed_clicks
+
+
+# The per-click implementation this endpoint used before the GROUP BY rewrite, kept for comparison
+def legacy_clicks_by_country(db, link_id):
+    clicks = db.query(ClickModel).filter(ClickModel.link_id == link_id).all()
+    country_clicks = {}
+    for click in clicks:
+        country_record = db.query(IPInfoModel).filter(IPInfoModel.click_id == click.id).first()
+        country = country_record.country if country_record else None
+        if country:
+            country_clicks[country] = country_clicks.get(country, 0) + 1
+    return country_clicks
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="clicks_by_country: N+1 lookups vs one GROUP BY")
+    parser.add_argument("--clicks", type=int, default=1_000_000)
+    parser.add_argument("--database-url")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-legacy", action="store_true", help="the legacy path issues one query per click")
+    args = parser.parse_args()
+
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine, Session = create_session_factory(database_url)
+    db = Session()
+    _, (link_id,) = seed_links(db)
+    start = time.perf_counter()
+    seed_clicks(db, link_id, args.clicks)
+    print(f"seeded {args.clicks} clicks in {time.perf_counter() - start:.1f}s ({database_url})")
+
+    async_engine, AsyncSession = create_async_session_factory(database_url)
+    loop = asyncio.new_event_loop()
+    async_db = AsyncSession()
+    service = ClickService(async_db)
+    new = timed(lambda: loop.run_until_complete(service.clicks_by_country(link_id)), args.repeat)
+    loop.run_until_complete(async_db.close())
+    loop.run_until_complete(async_engine.dispose())
+    print(f"grouped query : {new * 1000:10.1f} ms")
+    if not args.skip_legacy:
+        old = timed(lambda: legacy_clicks_by_country(db, link_id), 1)
+        print(f"legacy N+1    : {old * 1000:10.1f} ms  ({old / new:.0f}x slower)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import os
+import secrets
+import tempfile
+import time
+
+from fastapi import HTTPException
+
+from middlewares.link_validation import resolve_short_url
+from services.link_filter import CuckooFilter, LinkFilter
+import middlewares.link_validation as link_validation
+from benchmarks.seed import create_session_factory, create_async_session_factory, seed_links
+
+
+async def resolve_misses(AsyncSession, codes):
+    start = time.perf_counter()
+    async with AsyncSession() as db:
+        for code in codes:
+            try:
+                await resolve_short_url(code, db)
+            except HTTPException:
+                pass
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="404s for unknown short codes: DB lookup vs cuckoo filter")
+    parser.add_argument("--database-url")
+    parser.add_argument("--links", type=int, default=200_000)
+    parser.add_argument("--misses", type=int, default=20_000)
+    parser.add_argument("--filter-keys", type=int, default=1_000_000, help="keys for the standalone filter measurement")
+    args = parser.parse_args()
+
+    keys = [secrets.token_urlsafe(5) for _ in range(args.filter_keys)]
+    cuckoo = CuckooFilter(len(keys))
+    start = time.perf_counter()
+    for key in keys:
+        cuckoo.add(key)
+    elapsed = time.perf_counter() - start
+    assert all(key in cuckoo for key in keys), "filter lost a key"
+    probes = [secrets.token_urlsafe(6) for _ in range(args.misses)]
+    start = time.perf_counter()
+    false_positives = sum(probe in cuckoo for probe in probes)
+    lookup = (time.perf_counter() - start) / len(probes)
+    stats = cuckoo.stats()
+    print(f"filter build          : {len(keys)} keys in {elapsed:.2f}s, {stats['memory_bytes'] / 2**20:.1f} MiB, load {stats['load_factor']}")
+    print(f"filter lookups        : {lookup * 1e6:.2f} us, false positives {false_positives / len(probes):.6f} (estimated {stats['estimated_false_positive_rate']:.6f})")
+
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'filter.db')}"
+    engine, Session = create_session_factory(database_url)
+    with Session() as db:
+        seed_links(db, users=1, links_per_user=args.links)
+    async_engine, AsyncSession = create_async_session_factory(database_url)
+
+    # resolve_short_url consults the module-level filter, swap in one that is never built
+    link_validation.link_filter = LinkFilter(Session, enabled=False)
+    without_filter = asyncio.run(resolve_misses(AsyncSession, probes))
+    asyncio.run(async_engine.dispose())
+    # started as in the app, so the periodic refresh runs during the misses and is counted
+    link_filter = LinkFilter(Session)
+    link_filter.start()
+    while link_filter.rebuilds == 0:
+        time.sleep(0.01)
+    link_validation.link_filter = link_filter
+    refreshes = link_filter.refreshes
+    with_filter = asyncio.run(resolve_misses(AsyncSession, probes))
+    refreshes = link_filter.refreshes - refreshes
+    link_filter.stop()
+    asyncio.run(async_engine.dispose())
+
+    print(f"404 via DB lookup     : {without_filter / len(probes) * 1e6:8.1f} us per miss ({args.links} links)")
+    print(
+        f"404 via filter        : {with_filter / len(probes) * 1e6:8.1f} us per miss, {link_filter.false_positives} lookups "
+        f"and {refreshes} refresh queries ({with_filter:.2f}s at {link_filter.refresh_interval}s intervals) reached the DB"
+    )
+
+
+if __name__ == "__main__":
+    main()
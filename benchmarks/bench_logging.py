@@ -0,0 +1,80 @@
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from config.logging_config import TEXT_FORMAT, configure_logging
+
+
+class SlowStream:
+    # a file whose writes take a while, like a congested pipe or a busy disk
+    def __init__(self, path, delay):
+        self._file = open(path, "a")
+        self.delay = delay
+
+    def write(self, data):
+        if self.delay:
+            time.sleep(self.delay)
+        return self._file.write(data)
+
+    def flush(self):
+        self._file.flush()
+
+
+def caller_latencies(logger, records, event):
+    latencies = []
+    for i in range(records):
+        start = time.perf_counter()
+        logger.info(f"IPInfo created successfully for click_id {i} with ip 10.0.0.1", extra={"event": event, "click_id": i})
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies
+
+
+def report(label, latencies):
+    p50 = latencies[len(latencies) // 2] * 1e6
+    p99 = latencies[int(len(latencies) * 0.99)] * 1e6
+    print(f"  {label:<18}: {sum(latencies) / len(latencies) * 1e6:8.1f} us mean   p50 {p50:8.1f} us   p99 {p99:8.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time spent in the logging call: direct handlers vs the queue")
+    parser.add_argument("--records", type=int, default=20_000)
+    parser.add_argument("--sink-delay-ms", type=float, default=0.05, help="time each write to the sink takes")
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+    delay = args.sink_delay_ms / 1000
+    print(f"{args.records} records per run, sink writes take {args.sink_delay_ms} ms")
+
+    # the previous setup: formatting and writing happen on the calling thread
+    direct = logging.getLogger("bench.direct")
+    direct.propagate = False
+    handler = logging.StreamHandler(SlowStream(os.path.join(directory, "direct.log"), delay))
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    direct.addHandler(handler)
+    direct.setLevel(logging.INFO)
+    report("direct handler", caller_latencies(direct, args.records, "bench"))
+
+    for label, sampling in (("queue", {}), ("queue, sampled", {"bench": "10/s"})):
+        logger, pipeline = configure_logging(
+            f"bench.{label}",
+            level="INFO",
+            stream_level="INFO",
+            file_path=None,
+            file_level="ERROR",
+            fmt="json",
+            queue_size=args.records,
+            sampling=sampling,
+            levels={},
+        )
+        logger.propagate = False
+        pipeline.listener.handlers[0].setStream(SlowStream(os.path.join(directory, f"{label}.log"), delay))
+        report(label, caller_latencies(logger, args.records, "bench"))
+        pipeline.stop()
+        stats = pipeline.stats()
+        print(f"  {'':<18}  dropped {stats['dropped']}, sampled out {stats['suppressed']}")
+
+
+if __name__ == "__main__":
+    main()
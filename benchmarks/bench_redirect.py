@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.load_test import percentile
+
+
+async def drive(client, paths, requests, concurrency):
+    latencies, errors = [], 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            response = await client.get(paths[i % len(paths)])
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 307:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return requests / elapsed, percentile(latencies, 0.50), percentile(latencies, 0.99), errors
+
+
+async def run(app, stacks, paths, args):
+    from config.config import async_engine
+
+    transport = httpx.ASGITransport(app=app, client=("203.0.113.7", 50000))
+    results = {name: [] for name in stacks}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(args.rounds):
+            for name, stack in stacks.items():
+                app.middleware_stack = stack
+                # warm the link cache so rounds compare request handling, not the first queries
+                await drive(client, paths, len(paths), args.concurrency)
+                results[name].append(await drive(client, paths, args.requests, args.concurrency))
+    await async_engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GET /{short_url}: routed endpoint vs ASGI fast path, in process")
+    parser.add_argument("--database-url")
+    parser.add_argument("--links", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3, help="alternating rounds per path, best one is reported")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(directory, 'redirect.db')}"
+    os.environ.setdefault("CLICK_SPILL_PATH", os.path.join(directory, "clicks.spill.jsonl"))
+    # config reads the environment on import
+    from app import app
+    from config.config import SessionLocal
+    from middlewares.redirect_fast_path import RedirectFastPathMiddleware
+    from services.click_ingestion import click_pipeline
+    from services.link_filter import link_filter
+    from benchmarks.seed import seed_links
+
+    with SessionLocal() as db:
+        (user_id,), _ = seed_links(db, links_per_user=args.links)
+    paths = [f"/b{user_id}x{i}" for i in range(args.links)]
+    link_filter.rebuild()
+    click_pipeline.start()
+
+    stacks = {"fast path": app.build_middleware_stack()}
+    app.user_middleware = [m for m in app.user_middleware if m.cls is not RedirectFastPathMiddleware]
+    stacks["routed"] = app.build_middleware_stack()
+
+    results = asyncio.run(run(app, stacks, paths, args))
+    click_pipeline.stop()
+
+    print(f"{args.requests} redirects per round over {args.links} links, concurrency {args.concurrency}")
+    for name, rounds in results.items():
+        rps, p50, p99, errors = max(rounds)
+        print(f"  {name:<10}: {rps:8.1f} req/s   p50 {p50 * 1000:6.2f} ms   p99 {p99 * 1000:6.2f} ms   {errors} errors")
+
+
+if __name__ == "__main__":
+    main()
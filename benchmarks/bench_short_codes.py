@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import string
+import tempfile
+import time
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from models.models import Link as LinkModel
+from services.short_code_allocator import CounterAllocator, RandomAllocator
+from benchmarks.seed import create_session_factory, create_async_session_factory, seed_links
+
+# every worker process must scramble with the same key for their codes to be comparable
+BENCH_KEY = "bench"
+
+# The generator LinkService used before the allocator, kept for comparison: one SELECT per
+# candidate, and an unchecked 8-character code after two collisions
+async def legacy_short_url(db):
+    characters = string.ascii_letters + string.digits
+    for _ in range(2):
+        short_url = "".join(random.choice(characters) for _ in range(7))
+        exists = (await db.execute(select(LinkModel.id).filter(LinkModel.short_url == short_url).limit(1))).first()
+        if not exists:
+            return short_url
+    return "".join(random.choice(characters) for _ in range(8))
+
+
+async def generate(database_url, codes, block_size, chunk):
+    engine, _ = create_async_session_factory(database_url)
+    allocator = CounterAllocator(engine, block_size=block_size, sequence="bench", key=BENCH_KEY)
+    allocated = []
+    start = time.perf_counter()
+    while len(allocated) < codes:
+        allocated.extend(await allocator.allocate_many(min(chunk, codes - len(allocated))))
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    return allocated, elapsed, allocator.leases
+
+
+def worker(database_url, codes, block_size, queue):
+    allocated, _, leases = asyncio.run(generate(database_url, codes, block_size, 1))
+    queue.put((allocated, leases))
+
+
+async def insert_links(database_url, user_id, links, mode):
+    engine, AsyncSession = create_async_session_factory(database_url)
+    allocator = RandomAllocator() if mode == "random" else CounterAllocator(engine, sequence=f"bench-{mode}", key=BENCH_KEY)
+    statements = 0
+    start = time.perf_counter()
+    async with AsyncSession() as db:
+        for i in range(links):
+            while True:
+                if mode == "legacy":
+                    short_url = await legacy_short_url(db)
+                    statements += 1
+                else:
+                    short_url = await allocator.allocate()
+                row = {
+                    "bitlink": f"http://localhost:8000/{short_url}", "short_url": short_url, "long_url": f"example.com/{mode}/{i}",
+                    "title": "bench", "user_id": user_id, "expired": False,
+                }
+                statements += 1
+                try:
+                    await db.execute(insert(LinkModel), row)
+                    await db.commit()
+                    break
+                except IntegrityError:
+                    await db.rollback()
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    return elapsed, statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description="short code allocation: counter blocks vs random codes")
+    parser.add_argument("--database-url")
+    parser.add_argument("--codes", type=int, default=2_000_000, help="codes generated by one counter allocator")
+    parser.add_argument("--block-size", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=4, help="processes leasing blocks from the same sequence")
+    parser.add_argument("--worker-codes", type=int, default=50000)
+    parser.add_argument("--links", type=int, default=5000, help="links inserted per insert mode")
+    args = parser.parse_args()
+
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'codes.db')}"
+    engine, Session = create_session_factory(database_url)
+    db = Session()
+    (user_id,), _ = seed_links(db)
+
+    allocated, elapsed, leases = asyncio.run(generate(database_url, args.codes, args.block_size, args.block_size))
+    assert len(set(allocated)) == len(allocated), "counter allocator produced a duplicate code"
+    print(f"counter allocate_many : {len(allocated)} unique codes in {elapsed:.2f}s ({len(allocated) / elapsed:,.0f}/s, {leases} leases)")
+    del allocated
+
+    queue = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(database_url, args.worker_codes, 1000, queue))
+        for _ in range(args.workers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+    codes = [code for allocated, _ in results for code in allocated]
+    assert len(set(codes)) == len(codes), "workers allocated overlapping codes"
+    print(f"counter, {args.workers} workers   : {len(codes)} unique codes in {elapsed:.2f}s, {sum(leases for _, leases in results)} leases")
+
+    for mode in ("legacy", "random", "counter"):
+        elapsed, statements = asyncio.run(insert_links(database_url, user_id, args.links, mode))
+        print(f"insert {mode:<8}       : {args.links} links in {elapsed:.2f}s ({args.links / elapsed:,.0f}/s), {statements / args.links:.2f} statements per link")
+
+    with engine.connect() as connection:
+        total, distinct = connection.execute(select(func.count(), func.count(LinkModel.short_url.distinct()))).one()
+    print(f"links table           : {total} rows, {distinct} distinct short codes")
+
+
+if __name__ == "__main__":
+    main()
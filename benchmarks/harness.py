@@ -0,0 +1,275 @@
+import argparse
+import asyncio
+from datetime import datetime, timezone
+import itertools
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+from sqlalchemy import select
+
+from benchmarks.load_test import percentile
+
+# End-to-end benchmark of the main endpoints. Seeds a database, drives the app either
+# in process through ASGI or through a uvicorn subprocess with concurrent clients, and
+# writes throughput, latency percentiles and per-request query counts as JSON.
+#
+#   python -m benchmarks.harness --clicks 1000000 --output before.json
+#   python -m benchmarks.harness --mode uvicorn --reuse --compare before.json
+
+UNITS = ["minute", "hour", "day", "week", "month"]
+ENDPOINTS = ["redirect", "shorten", *(f"clicks_{unit}" for unit in UNITS), "countries", "unique"]
+
+
+SERVER_TIMING_DB = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+
+def seed(SessionLocal, args):
+    from models.models import User as UserModel, Link as LinkModel
+    from benchmarks.seed import seed_links, seed_clicks
+
+    with SessionLocal() as db:
+        users = db.execute(select(UserModel.id, UserModel.username).filter(UserModel.username.like("bench-user-%"))).all()
+        if not users:
+            start = time.perf_counter()
+            user_ids, link_ids = seed_links(db, users=args.users, links_per_user=args.links_per_user)
+            hot = link_ids[:args.hot_links]
+            for link_id in hot:
+                seed_clicks(db, link_id, args.clicks // len(hot), distinct_ips=args.distinct_ips, seed=link_id)
+            print(f"seeded {len(user_ids)} users, {len(link_ids)} links, {args.clicks} clicks in {time.perf_counter() - start:.1f}s")
+            users = db.execute(select(UserModel.id, UserModel.username).filter(UserModel.id.in_(user_ids))).all()
+        elif not args.reuse:
+            sys.exit("database already holds bench users; pass --reuse or a fresh --database-url")
+        user = users[0]
+        links = db.execute(
+            select(LinkModel.id, LinkModel.short_url).filter(LinkModel.user_id == user.id).order_by(LinkModel.id)
+        ).all()
+    return user, links
+
+
+def endpoint_requests(name, headers, links, args):
+    # an endless supply of (method, url, kwargs) for one endpoint
+    hot = links[:args.hot_links]
+    if name == "redirect":
+        return ((("GET", f"/{link.short_url}", {}) for link in itertools.cycle(links)), 307)
+    if name == "shorten":
+        run = uuid.uuid4().hex[:8]
+        return ((
+            ("POST", "/link/shorten", {"headers": headers, "json": {"title": "bench", "long_url": f"example.com/{run}/{i}"}})
+            for i in itertools.count()
+        ), 200)
+    if name.startswith("clicks_"):
+        unit = name.split("_", 1)[1]
+        return (((
+            "GET", f"/click/api/bitlinks/{link.id}/clicks", {"headers": headers, "params": {"unit": unit}}
+        ) for link in itertools.cycle(hot)), 200)
+    if name == "countries":
+        return ((("GET", f"/click/api/bitlinks/{link.id}/countries", {"headers": headers}) for link in itertools.cycle(hot)), 200)
+    if name == "unique":
+        return (((
+            "GET", f"/link/api/bitlinks/{link.id}/clicks/unique", {"headers": headers, "params": {"limit": 100}}
+        ) for link in itertools.cycle(hot)), 200)
+    raise ValueError(f"Unknown endpoint {name!r}")
+
+
+async def drive(client, requests, expected_status, count, concurrency):
+    latencies, errors = [], 0
+    # summed from the Server-Timing header the app adds when QUERY_STATS_ENABLED is on
+    queries, db_time, timed = 0, 0.0, 0
+    counter = iter(range(count))
+
+    async def worker():
+        nonlocal errors, queries, db_time, timed
+        for _ in counter:
+            method, url, kwargs = next(requests)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                if response.status_code != expected_status:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+                response = None
+            latencies.append(time.perf_counter() - start)
+            match = response is not None and SERVER_TIMING_DB.search(response.headers.get("server-timing", ""))
+            if match:
+                db_time += float(match.group(1))
+                queries += int(match.group(2))
+                timed += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    server_timing = {"queries": queries / timed, "db_ms": db_time / timed} if timed else None
+    return time.perf_counter() - start, sorted(latencies), errors, server_timing
+
+
+async def pool_checkouts(client):
+    response = await client.get("/stats/pool")
+    return response.json()["request"].get("checkouts") if response.status_code == 200 else None
+
+
+async def run_endpoints(client, headers, links, args):
+    results = {}
+    for name in args.endpoints:
+        requests, expected_status = endpoint_requests(name, headers, links, args)
+        await drive(client, requests, expected_status, args.warmup, args.concurrency)
+        checkouts = await pool_checkouts(client)
+        elapsed, latencies, errors, server_timing = await drive(client, requests, expected_status, args.requests, args.concurrency)
+        checkouts_after = await pool_checkouts(client)
+        result = {
+            "requests": args.requests,
+            "errors": errors,
+            "throughput": round(args.requests / elapsed, 1),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+            "queries_per_request": round(server_timing["queries"], 2) if server_timing else None,
+            "db_ms_per_request": round(server_timing["db_ms"], 3) if server_timing else None,
+            "checkouts_per_request": (
+                round((checkouts_after - checkouts) / args.requests, 2)
+                if checkouts is not None and checkouts_after is not None else None
+            ),
+        }
+        results[name] = result
+        print_result(name, result)
+    return results
+
+
+async def run_asgi(headers, links, args):
+    from app import app
+    from config.config import async_engine
+
+    transport = httpx.ASGITransport(app=app, client=("203.0.113.7", 50000))
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+            results = await run_endpoints(client, headers, links, args)
+    await async_engine.dispose()
+    return results
+
+
+async def run_uvicorn(headers, links, args):
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        base_url = f"http://127.0.0.1:{args.port}"
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning"],
+            env=os.environ.copy(),
+        )
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+            deadline = time.monotonic() + 60
+            while True:
+                try:
+                    (await client.get("/openapi.json")).raise_for_status()
+                    break
+                except httpx.HTTPError:
+                    if time.monotonic() > deadline or (server and server.poll() is not None):
+                        raise RuntimeError(f"server at {base_url} did not come up")
+                    await asyncio.sleep(0.2)
+            return await run_endpoints(client, headers, links, args)
+    finally:
+        if server:
+            server.terminate()
+            server.wait(30)
+
+
+def print_result(name, result):
+    queries = result["queries_per_request"]
+    print(
+        f"  {name:<14} {result['throughput']:9.1f} req/s  p50 {result['p50_ms']:8.2f}  p95 {result['p95_ms']:8.2f}"
+        f"  p99 {result['p99_ms']:8.2f} ms  queries {queries if queries is not None else '-':>5}  errors {result['errors']}"
+    )
+
+
+def print_comparison(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["endpoints"]
+    print(f"compared with {baseline_path}:")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        change = lambda key: (result[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+        print(f"  {name:<14} throughput {change('throughput'):+7.1f}%  p50 {change('p50_ms'):+7.1f}%  p99 {change('p99_ms'):+7.1f}%")
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="throughput and latency of the main endpoints")
+    parser.add_argument("--database-url", help="defaults to a throwaway SQLite file")
+    parser.add_argument("--reuse", action="store_true", help="use bench data already seeded into --database-url")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--links-per-user", type=int, default=100)
+    parser.add_argument("--clicks", type=int, default=100_000, help="clicks with IP info, spread over the hot links")
+    parser.add_argument("--hot-links", type=int, default=10, help="links the analytics endpoints are queried for")
+    parser.add_argument("--distinct-ips", type=int, default=5000)
+    parser.add_argument("--mode", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--base-url", help="uvicorn mode: drive a server that is already running")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument("--requests", type=int, default=2000, help="timed requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=100, help="untimed requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(directory, 'harness.db')}"
+    os.environ.setdefault("CLICK_SPILL_PATH", os.path.join(directory, "clicks.spill.jsonl"))
+    # config reads the environment on import
+    from config.config import engine, SessionLocal
+    from models.models import Base
+    from models.migrations import run_migrations
+    from services.auth_service import create_access_token, TokenUser
+
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    user, links = seed(SessionLocal, args)
+    engine.dispose()
+    headers = {"Authorization": f"Bearer {create_access_token(TokenUser(user.id, user.username, None, None))}"}
+
+    print(f"{args.mode}: {args.requests} requests per endpoint, concurrency {args.concurrency}")
+    runner = run_asgi if args.mode == "asgi" else run_uvicorn
+    results = asyncio.run(runner(headers, links, args))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "meta": {
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "revision": git_revision(),
+                    "mode": args.mode,
+                    "database": engine.dialect.name,
+                    "users": args.users,
+                    "links_per_user": args.links_per_user,
+                    "clicks": args.clicks,
+                    "concurrency": args.concurrency,
+                    "workers": args.workers if args.mode == "uvicorn" else None,
+                },
+                "endpoints": results,
+            }, f, indent=2)
+        print(f"results written to {args.output}")
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import time
+import uuid
+
+import httpx
+
+# Drives a running server (e.g. `uvicorn app:app --workers 1`) with concurrent requests.
+# To compare builds, start each one in turn on the same database and run this against it.
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+async def prepare(client, links):
+    credentials = {"username": f"load-{uuid.uuid4().hex[:8]}", "password": "load-test"}
+    (await client.post("/auth/register", json=credentials)).raise_for_status()
+    response = await client.post("/auth/login", data=credentials)
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    created = []
+    for i in range(links):
+        response = await client.post(
+            "/link/shorten", json={"title": f"load {i}", "long_url": f"example.com/load/{i}"}, headers=headers
+        )
+        response.raise_for_status()
+        created.append(response.json())
+    return headers, created
+
+
+def scenario_requests(scenario, headers, links):
+    redirects = [("GET", "/" + link["link"].rsplit("/", 1)[1], {}) for link in links]
+    analytics = [("GET", f"/click/api/bitlinks/{link['id']}/clicks?unit=day", headers) for link in links]
+    if scenario == "redirect":
+        return redirects
+    if scenario == "analytics":
+        return analytics
+    # mixed traffic: mostly redirects with some dashboard reads
+    return redirects * 9 + analytics
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        headers, links = await prepare(client, args.links)
+        requests = scenario_requests(args.scenario, headers, links)
+        latencies, errors = [], 0
+        counter = iter(range(args.requests))
+
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                method, path, request_headers = requests[i % len(requests)]
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, headers=request_headers)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{args.scenario}: {args.requests} requests, concurrency {args.concurrency}, {errors} errors")
+    print(f"  throughput : {args.requests / elapsed:10.1f} req/s")
+    for label, p in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)):
+        print(f"  {label}        : {percentile(latencies, p) * 1000:10.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="concurrent load against a running server")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--scenario", choices=["redirect", "analytics", "mixed"], default="redirect")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--links", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=30)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
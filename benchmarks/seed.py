@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+import random
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from config.config import async_database_url
+
+from models.models import Base, User as UserModel, Link as LinkModel, Click as ClickModel, IPInfo as IPInfoModel
+
+COUNTRIES = ["US", "DE", "GB", "FR", "IN", "BR", "JP", "CA", "AU", "NL", "PK", "ES", "IT", "MX", "SE"]
+USER_AGENTS = [f"Mozilla/5.0 bench-agent-{i}" for i in range(50)]
+
+
+def create_session_factory(database_url):
+    engine = create_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def create_async_session_factory(database_url):
+    # services take AsyncSession; seeding stays on the sync engine
+    engine = create_async_engine(async_database_url(database_url))
+    return engine, async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+
+def seed_links(db, users=1, links_per_user=1):
+    user_rows = [{"username": f"bench-user-{i}", "password": "x"} for i in range(users)]
+    user_ids = db.execute(insert(UserModel).returning(UserModel.id, sort_by_parameter_order=True), user_rows).scalars().all()
+    link_rows = [
+        {
+            "bitlink": f"http://localhost:8000/b{user_id}x{i}",
+            "short_url": f"b{user_id}x{i}",
+            "long_url": f"example.com/{user_id}/{i}",
+            "title": f"bench {i}",
+            "user_id": user_id,
+            "expired": False,
+            "created_at": datetime.now(),
+        }
+        for user_id in user_ids
+        for i in range(links_per_user)
+    ]
+    link_ids = db.execute(insert(LinkModel).returning(LinkModel.id, sort_by_parameter_order=True), link_rows).scalars().all()
+    db.commit()
+    return user_ids, link_ids
+
+
+def seed_clicks(db, link_id, clicks, days=45, distinct_ips=5000, with_ip_info=True, chunk_size=20000, seed=0):
+    rng = random.Random(seed)
+    now = datetime.now()
+    span = days * 86400
+    ips = [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(distinct_ips)]
+    ip_country = {ip: rng.choice(COUNTRIES) for ip in ips}
+
+    written = 0
+    while written < clicks:
+        n = min(chunk_size, clicks - written)
+        rows = []
+        for _ in range(n):
+            rows.append({
+                "link_id": link_id,
+                "ip": rng.choice(ips),
+                "user_agent": rng.choice(USER_AGENTS),
+                "timestamp": now - timedelta(seconds=rng.randrange(span)),
+            })
+        ids = db.execute(insert(ClickModel).returning(ClickModel.id, sort_by_parameter_order=True), rows).scalars().all()
+        if with_ip_info:
+            db.execute(insert(IPInfoModel), [
+                {"click_id": click_id, "ip": row["ip"], "country": ip_country[row["ip"]], "city": "bench"}
+                for click_id, row in zip(ids, rows)
+            ])
+        db.commit()
+        written += n
+    return written
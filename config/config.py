@@ -1,39 +1,224 @@
 from fastapi import Depends
 from fastapi.security import OAuth2PasswordBearer
 from requests import Session
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-import logging
+from sqlalchemy.pool import NullPool
 import os
 
+from config.logging_config import configure_logging, parse_mapping
+from config.pool import TimedAsyncAdaptedQueuePool, TimedQueuePool
+from config.query_stats import instrument_engine
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 SECRET_KEY = os.getenv("SECRET_KEY", "secret")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 
+# access tokens carry sub (user id), iat, exp and jti and are verified without a database lookup
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+# bcrypt cost factor; stored hashes with another cost are rehashed on the next successful login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# hash/verify calls allowed to run or wait at once before login and register answer 503
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", "64"))
+
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
 REDIRECT_URL = os.getenv("REDIRECT_URL", "http://localhost:8000")
 
-engine = create_engine(DATABASE_URL)
+LINK_CACHE_SIZE = int(os.getenv("LINK_CACHE_SIZE", "10000"))
+LINK_CACHE_TTL = float(os.getenv("LINK_CACHE_TTL", "300"))
+
+# count and time the SQL each request runs: Server-Timing header, plus a warning with the
+# normalized statements for requests over SLOW_REQUEST_QUERIES queries or SLOW_REQUEST_MS
+QUERY_STATS_ENABLED = os.getenv("QUERY_STATS_ENABLED", "true").lower() in ("1", "true", "yes")
+SLOW_REQUEST_QUERIES = int(os.getenv("SLOW_REQUEST_QUERIES", "20"))
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+
+# serve GET /{short_url} from a raw ASGI middleware instead of the routed endpoint
+REDIRECT_FAST_PATH = os.getenv("REDIRECT_FAST_PATH", "true").lower() in ("1", "true", "yes")
+
+# in-memory filter of active short codes that answers 404 for unknown codes without a query
+LINK_FILTER_ENABLED = os.getenv("LINK_FILTER_ENABLED", "true").lower() in ("1", "true", "yes")
+LINK_FILTER_CAPACITY = int(os.getenv("LINK_FILTER_CAPACITY", "1000000"))
+# seconds between picking up links created by other workers, which is how long another
+# worker's new link can answer 404 here, and between full rebuilds
+LINK_FILTER_REFRESH_INTERVAL = float(os.getenv("LINK_FILTER_REFRESH_INTERVAL", "1"))
+LINK_FILTER_REBUILD_INTERVAL = float(os.getenv("LINK_FILTER_REBUILD_INTERVAL", "3600"))
+LINK_FILTER_REFRESH_OVERLAP = int(os.getenv("LINK_FILTER_REFRESH_OVERLAP", "1000"))
+
+# seconds between loading tokens revoked by other workers, which is how long a token
+# logged out on one worker stays usable on the others
+TOKEN_DENYLIST_REFRESH_INTERVAL = float(os.getenv("TOKEN_DENYLIST_REFRESH_INTERVAL", "5"))
+
+CLICK_QUEUE_SIZE = int(os.getenv("CLICK_QUEUE_SIZE", "100000"))
+CLICK_BATCH_SIZE = int(os.getenv("CLICK_BATCH_SIZE", "500"))
+CLICK_FLUSH_INTERVAL_MS = int(os.getenv("CLICK_FLUSH_INTERVAL_MS", "200"))
+# one of: block, drop_oldest, spill
+CLICK_OVERFLOW_POLICY = os.getenv("CLICK_OVERFLOW_POLICY", "spill")
+CLICK_BLOCK_TIMEOUT = float(os.getenv("CLICK_BLOCK_TIMEOUT", "1"))
+CLICK_SPILL_PATH = os.getenv("CLICK_SPILL_PATH", "clicks.spill.jsonl")
+
+# minute rollups older than this are folded into hour and day rollups
+ROLLUP_MINUTE_RETENTION_MINUTES = int(os.getenv("ROLLUP_MINUTE_RETENTION_MINUTES", "120"))
+ROLLUP_COMPACTION_INTERVAL = float(os.getenv("ROLLUP_COMPACTION_INTERVAL", "300"))
+
+# clicks older than CLICK_ARCHIVE_AFTER_DAYS are moved, with their IP info, into Parquet files
+# under CLICK_ARCHIVE_PATH/month=YYYY-MM and deleted from clicks and ip_info; analytics read both
+CLICK_ARCHIVE_ENABLED = os.getenv("CLICK_ARCHIVE_ENABLED", "false").lower() in ("1", "true", "yes")
+CLICK_ARCHIVE_PATH = os.getenv("CLICK_ARCHIVE_PATH", "click_archive")
+CLICK_ARCHIVE_AFTER_DAYS = int(os.getenv("CLICK_ARCHIVE_AFTER_DAYS", "90"))
+CLICK_ARCHIVE_BATCH_SIZE = int(os.getenv("CLICK_ARCHIVE_BATCH_SIZE", "100000"))
+CLICK_ARCHIVE_INTERVAL = float(os.getenv("CLICK_ARCHIVE_INTERVAL", "3600"))
+CLICK_ARCHIVE_COMPRESSION = os.getenv("CLICK_ARCHIVE_COMPRESSION", "zstd")
+
+# on PostgreSQL clicks is partitioned by month: partitions are created CLICK_PARTITION_MONTHS_AHEAD
+# months in advance, and with CLICK_RETENTION_MONTHS set, months older than that are dropped
+# (rows are deleted on SQLite); 0 keeps everything
+CLICK_PARTITION_MONTHS_AHEAD = int(os.getenv("CLICK_PARTITION_MONTHS_AHEAD", "3"))
+CLICK_RETENTION_MONTHS = int(os.getenv("CLICK_RETENTION_MONTHS", "0"))
+CLICK_PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("CLICK_PARTITION_MAINTENANCE_INTERVAL", "3600"))
+
+# "counter" leases blocks of a shared sequence and encodes them as base62,
+# "random" draws codes from secrets and retries on a unique constraint conflict.
+# The counter permutation is keyed by SHORT_CODE_KEY, without which codes are random.
+SHORT_CODE_KEY = os.getenv("SHORT_CODE_KEY", "")
+SHORT_CODE_ALLOCATOR = os.getenv("SHORT_CODE_ALLOCATOR", "counter" if SHORT_CODE_KEY else "random")
+SHORT_CODE_LENGTH = int(os.getenv("SHORT_CODE_LENGTH", "7"))
+SHORT_CODE_BLOCK_SIZE = int(os.getenv("SHORT_CODE_BLOCK_SIZE", "1000"))
+SHORT_CODE_MAX_ATTEMPTS = int(os.getenv("SHORT_CODE_MAX_ATTEMPTS", "5"))
+
+# items per dedup query / multi-row insert of POST /link/shorten/bulk, and items read per request
+BULK_SHORTEN_CHUNK_SIZE = int(os.getenv("BULK_SHORTEN_CHUNK_SIZE", "1000"))
+BULK_SHORTEN_MAX_ITEMS = int(os.getenv("BULK_SHORTEN_MAX_ITEMS", "100000"))
+
+UNIQUE_CLICKS_CHUNK_SIZE = int(os.getenv("UNIQUE_CLICKS_CHUNK_SIZE", "5000"))
+# rows fetched per server-side cursor round trip, and encoded per chunk, by click exports
+CLICK_EXPORT_CHUNK_SIZE = int(os.getenv("CLICK_EXPORT_CHUNK_SIZE", "5000"))
+
+# {ip} is substituted with the address being looked up
+IPINFO_URL = os.getenv("IPINFO_URL", "https://ipinfo.io/{ip}/json")
+IPINFO_TOKEN = os.getenv("IPINFO_TOKEN")
+IPINFO_TIMEOUT = float(os.getenv("IPINFO_TIMEOUT", "5"))
+IPINFO_WORKERS = int(os.getenv("IPINFO_WORKERS", "16"))
+# lookups per second against the provider, 0 disables the limit
+IPINFO_RATE_LIMIT = float(os.getenv("IPINFO_RATE_LIMIT", "50"))
+IPINFO_CACHE_SIZE = int(os.getenv("IPINFO_CACHE_SIZE", "100000"))
+IPINFO_CACHE_TTL = float(os.getenv("IPINFO_CACHE_TTL", "86400"))
+IPINFO_QUEUE_SIZE = int(os.getenv("IPINFO_QUEUE_SIZE", "100000"))
+IPINFO_BATCH_SIZE = int(os.getenv("IPINFO_BATCH_SIZE", "200"))
+IPINFO_FLUSH_INTERVAL_MS = int(os.getenv("IPINFO_FLUSH_INTERVAL_MS", "500"))
+
+# "http" queries IPINFO_URL, "offline" answers from the local GEOIP_DATABASE_PATH file
+GEOIP_BACKEND = os.getenv("GEOIP_BACKEND", "http")
+GEOIP_DATABASE_PATH = os.getenv("GEOIP_DATABASE_PATH", "geoip.csv")
+GEOIP_RELOAD_INTERVAL = float(os.getenv("GEOIP_RELOAD_INTERVAL", "30"))
+# where a CSV database is compiled to; empty means "<GEOIP_DATABASE_PATH>.bin"
+GEOIP_CACHE_PATH = os.getenv("GEOIP_CACHE_PATH", "")
+
+# Pool settings apply to the async (request) engine and the sync (background) engine alike
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# seconds before a pooled connection is replaced, -1 keeps connections forever
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# prepared statements cached per connection by the driver (asyncpg, sqlite3/aiosqlite)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+
+# Request handlers use the async engine; background threads, migrations and scripts keep the sync one
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def async_database_url(url):
+    url = make_url(url)
+    return url.set(drivername=_ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
+
+
+def is_memory_sqlite(url):
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def engine_options(url, is_async=False):
+    url = make_url(url)
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if is_memory_sqlite(url):
+        # in-memory SQLite lives in a single connection, so there is no pool to size
+        return options
+    options.update(
+        poolclass=TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"cached_statements": DB_STATEMENT_CACHE_SIZE}
+    elif url.get_driver_name() == "asyncpg":
+        options["connect_args"] = {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    return options
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the single writer; NORMAL only syncs at checkpoints
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.close()
+
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# Configure logging
-logger = logging.getLogger("app")
-logger.setLevel(logging.DEBUG)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, is_async=True))
+# Short code block leases run while the calling request still holds its pooled connection.
+# Taking the lease connection from the same pool deadlocks once every connection belongs
+# to a request waiting on a lease, so leases open their own connection (one per block).
+sequence_engine = async_engine if is_memory_sqlite(ASYNC_DATABASE_URL) else create_async_engine(ASYNC_DATABASE_URL, poolclass=NullPool)
+for _sync_engine in {engine, async_engine.sync_engine, sequence_engine.sync_engine}:
+    if _sync_engine.dialect.name == "sqlite":
+        event.listen(_sync_engine, "connect", set_sqlite_pragmas)
+    if QUERY_STATS_ENABLED:
+        instrument_engine(_sync_engine)
+# expire_on_commit=False keeps committed objects readable without an implicit (blocking) refresh
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
-fh = logging.FileHandler("QED.log")
-fh.setLevel(logging.ERROR)
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG)
-formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-fh.setFormatter(formatter)
-ch.setFormatter(formatter)
+# Configure logging: records go through a bounded queue to one writer thread, so the
+# request path never waits on stdout or the log file (a full queue drops records)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG").upper()
+LOG_STREAM_LEVEL = os.getenv("LOG_STREAM_LEVEL", "DEBUG").upper()
+LOG_FILE = os.getenv("LOG_FILE", "QED.log")
+LOG_FILE_LEVEL = os.getenv("LOG_FILE_LEVEL", "ERROR").upper()
+# json or text (the previous "time - name - level - message" lines)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# per-event sampling for records logged with extra={"event": ...}: "N" keeps every Nth,
+# "N/s" keeps at most N per second
+LOG_SAMPLING = parse_mapping(os.getenv("LOG_SAMPLING", "ip_info.created=10/s,ip_info.failed=10/s,short_code.conflict=10/s"))
+# levels of other loggers, e.g. "uvicorn.access=WARNING,sqlalchemy.engine=INFO"
+LOG_LEVELS = parse_mapping(os.getenv("LOG_LEVELS", ""))
 
-logger.addHandler(fh)
-logger.addHandler(ch)
+logger, logging_pipeline = configure_logging(
+    "app",
+    level=LOG_LEVEL,
+    stream_level=LOG_STREAM_LEVEL,
+    file_path=LOG_FILE,
+    file_level=LOG_FILE_LEVEL,
+    fmt=LOG_FORMAT,
+    queue_size=LOG_QUEUE_SIZE,
+    sampling=LOG_SAMPLING,
+    levels=LOG_LEVELS,
+)
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    # FastAPI caches dependencies per request, so the validation middlewares and the
+    # services of one request share this session and at most one pooled connection
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
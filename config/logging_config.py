@@ -0,0 +1,154 @@
+from datetime import datetime, timezone
+import atexit
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import threading
+import time
+
+# Attributes every LogRecord has; anything else on a record came from extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    # Applies to records logged with extra={"event": name}. A rule "N" keeps every Nth
+    # record of the event, "N/s" keeps at most N per second; the next record let through
+    # carries the number skipped before it as "suppressed".
+    def __init__(self, rules):
+        super().__init__()
+        self.rules = {event: self._parse(rule) for event, rule in rules.items()}
+        self._state = {}
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    @staticmethod
+    def _parse(rule):
+        if rule.endswith("/s"):
+            return "rate", float(rule[:-2])
+        return "every", int(rule)
+
+    def filter(self, record):
+        event = getattr(record, "event", None)
+        rule = self.rules.get(event)
+        if rule is None:
+            return True
+        kind, value = rule
+        with self._lock:
+            # [window start or counter, records let through in the window, skipped since the last one let through]
+            state = self._state.setdefault(event, [0.0, 0, 0])
+            if kind == "every":
+                state[0] += 1
+                keep = state[0] % value == 1 or value <= 1
+            else:
+                now = time.monotonic()
+                if now - state[0] >= 1:
+                    state[0], state[1] = now, 0
+                keep = state[1] < value
+                if keep:
+                    state[1] += 1
+            if not keep:
+                state[2] += 1
+                self.suppressed += 1
+                return False
+            if state[2]:
+                record.suppressed = state[2]
+                state[2] = 0
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    # Hands records to the writer thread without waiting: a full queue drops the record
+    # instead of stalling the request or background thread that logged it
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # the message is resolved now, in case its arguments change before the writer
+        # thread gets to it; formatting happens on the writer thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LoggingPipeline:
+    def __init__(self, handler, listener, sampling):
+        self.handler = handler
+        self.listener = listener
+        self.sampling = sampling
+
+    def stop(self):
+        # flushes whatever is still queued
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def stats(self):
+        return {
+            "queued": self.handler.queue.qsize(),
+            "max_size": self.handler.queue.maxsize,
+            "dropped": self.handler.dropped,
+            "suppressed": self.sampling.suppressed,
+        }
+
+
+def parse_mapping(value):
+    # "a=1,b=2" -> {"a": "1", "b": "2"}
+    pairs = (item.split("=", 1) for item in value.split(",") if "=" in item)
+    return {key.strip(): setting.strip() for key, setting in pairs}
+
+
+def configure_logging(name, level, stream_level, file_path, file_level, fmt, queue_size, sampling, levels):
+    formatter = JSONFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = []
+    stream_handler = logging.StreamHandler()
+    stream_handler.setLevel(stream_level)
+    handlers.append(stream_handler)
+    if file_path:
+        file_handler = logging.FileHandler(file_path)
+        file_handler.setLevel(file_level)
+        handlers.append(file_handler)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    sampling_filter = SamplingFilter(sampling)
+    queue_handler = NonBlockingQueueHandler(queue.Queue(queue_size))
+    queue_handler.addFilter(sampling_filter)
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    logger.addHandler(queue_handler)
+    for logger_name, logger_level in levels.items():
+        logging.getLogger(logger_name).setLevel(logger_level.upper())
+
+    pipeline = LoggingPipeline(queue_handler, listener, sampling_filter)
+    atexit.register(pipeline.stop)
+    return logger, pipeline
@@ -0,0 +1,178 @@
+from bisect import bisect_left
+import threading
+import time
+
+# Minimal Prometheus text-format metrics. Each thread updates its own shard without
+# taking a lock (the event loop thread is the only writer of its shard), and /metrics
+# sums the shards when scraped, so instrumenting the redirect path costs a list update.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Sharded:
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = [0] * self._size
+            # only taken once per thread, when its shard is created
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def _totals(self):
+        with self._lock:
+            shards = list(self._shards)
+        return [sum(values) for values in zip(*shards)] if shards else [0] * self._size
+
+
+class _CounterChild(_Sharded):
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount=1):
+        self._shard()[0] += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self._totals()[0]
+
+
+class _HistogramChild(_Sharded):
+    # shard layout: one slot per bucket (non-cumulative), then +Inf, then the sum
+    def __init__(self, buckets):
+        super().__init__(len(buckets) + 2)
+        self._buckets = buckets
+
+    def observe(self, value):
+        shard = self._shard()
+        shard[bisect_left(self._buckets, value)] += 1
+        shard[-1] += value
+
+    def time(self):
+        return _Timer(self)
+
+    def samples(self, name, labels):
+        totals = self._totals()
+        cumulative = 0
+        for bound, count in zip((*self._buckets, "+Inf"), totals[:-1]):
+            cumulative += count
+            yield f"{name}_bucket", {**labels, "le": str(bound)}, cumulative
+        yield f"{name}_count", labels, cumulative
+        yield f"{name}_sum", labels, totals[-1]
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._start)
+
+
+class _Metric:
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._new_child()
+            self._children[()] = self._default
+        (registry or REGISTRY).register(self)
+
+    def labels(self, **labels):
+        # resolve children once at import time on hot paths; this lookup is a dict get
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def collect(self):
+        for key, child in list(self._children.items()):
+            yield from child.samples(self.name, dict(zip(self.labelnames, key)))
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+
+class CallbackMetric:
+    # reads values from an existing stats() dict at scrape time, so components that
+    # already count for /stats are not counted twice
+    def __init__(self, name, documentation, type, callback, registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.type = type
+        self.callback = callback
+        (registry or REGISTRY).register(self)
+
+    def collect(self):
+        yield self.name, {}, self.callback()
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.collect():
+                if labels:
+                    rendered = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+                    lines.append(f"{name}{{{rendered}}} {_format(value)}")
+                else:
+                    lines.append(f"{name} {_format(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
@@ -0,0 +1,69 @@
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+# Queue pools that also record how long checkouts wait for a free connection
+class _TimedPoolMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._metrics_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._metrics_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+    def recreate(self):
+        # dispose() swaps in a fresh pool; keep the counters across it
+        pool = super().recreate()
+        pool.checkouts, pool.timeouts = self.checkouts, self.timeouts
+        pool.wait_total, pool.wait_max = self.wait_total, self.wait_max
+        return pool
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            # negative while the pool has not opened pool_size connections yet
+            "overflow": pool.overflow(),
+            "max_overflow": pool._max_overflow,
+        })
+    if isinstance(pool, _TimedPoolMixin):
+        stats.update({
+            "checkouts": pool.checkouts,
+            "timeouts": pool.timeouts,
+            "wait_total_ms": round(pool.wait_total * 1000, 3),
+            "wait_avg_ms": round(pool.wait_total * 1000 / pool.checkouts, 3) if pool.checkouts else 0.0,
+            "wait_max_ms": round(pool.wait_max * 1000, 3),
+        })
+    return stats
@@ -0,0 +1,92 @@
+from contextvars import ContextVar
+from functools import lru_cache
+import re
+import time
+
+from sqlalchemy import event
+
+# Statistics of the request being handled; unset in background threads, whose statements
+# are not counted
+current_query_stats = ContextVar("current_query_stats", default=None)
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"\?|\$\d+|%\(\w+\)s|%s|(?<![:\w]):\w+")
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(statement):
+    # one shape per query: literals and driver placeholders become ?, IN lists collapse
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    statement = _STRING.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _PLACEHOLDER.sub("?", statement)
+    return _PLACEHOLDER_LIST.sub("?, ...", statement)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.slowest_statement = None
+        self.statements = {}
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.slowest:
+            self.slowest = elapsed
+            self.slowest_statement = statement
+        entry = self.statements.get(statement)
+        if entry is None:
+            self.statements[statement] = [1, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+
+    def server_timing(self, elapsed):
+        return (
+            f'db;dur={self.total * 1000:.2f};desc="{self.count} queries", '
+            f"db-slowest;dur={self.slowest * 1000:.2f}, "
+            f"app;dur={elapsed * 1000:.2f}"
+        )
+
+    def summary(self):
+        return {
+            "queries": self.count,
+            "db_ms": round(self.total * 1000, 3),
+            "slowest_ms": round(self.slowest * 1000, 3),
+            "slowest_sql": normalize_sql(self.slowest_statement) if self.slowest_statement else None,
+        }
+
+    def normalized_statements(self):
+        # statements differing only in literals are merged, so an N+1 shows up as one line with count N
+        merged = {}
+        for statement, (count, elapsed) in self.statements.items():
+            entry = merged.setdefault(normalize_sql(statement), [0, 0.0])
+            entry[0] += count
+            entry[1] += elapsed
+        return [
+            {"sql": sql, "count": count, "total_ms": round(elapsed * 1000, 3)}
+            for sql, (count, elapsed) in sorted(merged.items(), key=lambda item: -item[1][1])
+        ]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_query_stats.get() is not None:
+        context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_query_stats.get()
+    started = getattr(context, "_query_started", None)
+    if stats is not None and started is not None:
+        stats.record(statement, time.perf_counter() - started)
+
+
+def instrument_engine(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
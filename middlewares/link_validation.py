@@ -1,26 +1,75 @@
 from fastapi import Depends, HTTPException, Request
-from config.config import get_db
+from sqlalchemy import select
+from config.config import get_db, AsyncSessionLocal
 from models.models import Link as LinkModel
+from services.cache import CachedLink, link_cache
+from services.link_filter import link_filter
 
-def validate_link_middleware(request: Request, db=Depends(get_db)):
+LINK_NOT_FOUND = "Link not found or does not belong to the user"
+
+async def validate_link_middleware(request: Request, db=Depends(get_db)):
     link_id = request.path_params.get('link_id', '')
     short_url = request.path_params.get('short_url', '')
     user_id = False
     if request.get("state", False) and request.get("state").get("user", False):
         user_id = request.state.user.id
-    query = db.query(LinkModel).filter(LinkModel.expired == False)
+    if short_url and not link_id and not user_id:
+        return await resolve_short_url(short_url, db)
+    query = select(LinkModel).filter(LinkModel.expired == False)
     if user_id:
         query = query.filter(LinkModel.user_id == user_id)
     if link_id:
-        query = query.filter(LinkModel.id == link_id)
+        # path params arrive as strings; asyncpg will not compare them to integer columns
+        if not str(link_id).isdigit():
+            raise HTTPException(status_code=404, detail=LINK_NOT_FOUND)
+        query = query.filter(LinkModel.id == int(link_id))
     elif short_url:
         query = query.filter(LinkModel.short_url == short_url)
     else:
         raise HTTPException(status_code=400, detail="Neither link ID nor short URL provided")
 
-    link = query.first()
+    link = (await db.scalars(query.limit(1))).first()
 
     if not link:
-        raise HTTPException(status_code=404, detail="Link not found or does not belong to the user")
-    
+        raise HTTPException(status_code=404, detail=LINK_NOT_FOUND)
+
+    return link
+
+async def resolve_short_url(short_url, db=None):
+    link, _ = await find_short_url(short_url, db)
+
+    if not link or link.expired:
+        raise HTTPException(status_code=404, detail=LINK_NOT_FOUND)
+
     return link
+
+async def find_short_url(short_url, db=None):
+    # (link or None, whether the link cache answered), for the redirect latency metrics
+    link = link_cache.get(short_url)
+    if link is not None:
+        return link, True
+    return await load_short_url(short_url, db), False
+
+async def load_short_url(short_url, db=None):
+    # after a cache miss: the link filter, then the database. Returns None for unknown codes.
+    if not link_filter.might_contain(short_url):
+        return None
+    if db is None:
+        # the redirect fast path only opens a session when the cache misses
+        async with AsyncSessionLocal() as db:
+            row = await fetch_link_row(short_url, db)
+    else:
+        row = await fetch_link_row(short_url, db)
+    if not row:
+        link_filter.record_false_positive()
+        return None
+    link = CachedLink(row.id, row.long_url, bool(row.expired))
+    link_cache.set(short_url, link)
+    return link
+
+async def fetch_link_row(short_url, db):
+    return (await db.execute(
+        select(LinkModel.id, LinkModel.long_url, LinkModel.expired).filter(
+            LinkModel.short_url == short_url
+        ).limit(1)
+    )).first()
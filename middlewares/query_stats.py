@@ -0,0 +1,54 @@
+import time
+
+from config.config import logger, SLOW_REQUEST_QUERIES, SLOW_REQUEST_MS
+from config.query_stats import QueryStats, current_query_stats
+
+
+class QueryStatsMiddleware:
+    # Collects the statements each request runs through the engine hooks in
+    # config/query_stats.py, reports them in a Server-Timing header and logs requests over
+    # SLOW_REQUEST_QUERIES queries or SLOW_REQUEST_MS with their normalized SQL.
+    def __init__(self, app, slow_queries=SLOW_REQUEST_QUERIES, slow_ms=SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_queries = slow_queries
+        self.slow_ms = slow_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = QueryStats()
+        token = current_query_stats.set(stats)
+        start = time.perf_counter()
+        status = None
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = stats.server_timing(time.perf_counter() - start).encode("latin-1")
+                message = {**message, "headers": [*message.get("headers", ()), (b"server-timing", header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_query_stats.reset(token)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if stats.count > self.slow_queries or elapsed_ms > self.slow_ms:
+                self._log_slow_request(scope, status, elapsed_ms, stats)
+
+    def _log_slow_request(self, scope, status, elapsed_ms, stats):
+        request = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "status": status,
+            "duration_ms": round(elapsed_ms, 3),
+            **stats.summary(),
+        }
+        statements = stats.normalized_statements()
+        lines = "\n".join(f"  {entry['count']}x {entry['total_ms']}ms {entry['sql']}" for entry in statements)
+        logger.warning(
+            f"Slow request {request['method']} {request['path']}: {request['duration_ms']}ms, "
+            f"{request['queries']} queries, {request['db_ms']}ms in the database\n{lines}",
+            extra={"event": "request.slow", "request": request, "statements": statements},
+        )
@@ -0,0 +1,75 @@
+import json
+from urllib.parse import quote
+
+import time
+
+from config.metrics import Counter, Histogram
+from middlewares.link_validation import LINK_NOT_FOUND, find_short_url
+from services.click_ingestion import click_pipeline
+from services.link_service import redirect_target
+
+NOT_FOUND_BODY = json.dumps({"detail": LINK_NOT_FOUND}, separators=(",", ":")).encode()
+
+REDIRECT_DURATION = Histogram(
+    "redirect_duration_seconds", "Time to answer a redirect, by whether the link cache had the code", ["cache"]
+)
+REDIRECT_DURATION_HIT = REDIRECT_DURATION.labels(cache="hit")
+REDIRECT_DURATION_MISS = REDIRECT_DURATION.labels(cache="miss")
+REDIRECT_NOT_FOUND = Counter("redirect_not_found_total", "Redirects answered 404 for unknown or deleted codes")
+
+
+class RedirectFastPathMiddleware:
+    # Answers GET /{short_url} straight from ASGI, ahead of routing and dependency
+    # injection: link cache, then link filter, then one query on a session opened only on
+    # a cache miss. Responses match the redirect_to_long_url route, which still serves
+    # the path when REDIRECT_FAST_PATH is off.
+    def __init__(self, app):
+        self.app = app
+        self.reserved = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            return await self.app(scope, receive, send)
+        short_url = scope["path"][1:]
+        if not short_url or "/" in short_url:
+            return await self.app(scope, receive, send)
+        if self.reserved is None:
+            # single-segment routes such as /docs and /openapi.json
+            self.reserved = {
+                route.path[1:] for route in scope["app"].routes
+                if route.path.count("/") == 1 and "{" not in route.path
+            }
+        if short_url in self.reserved:
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        link, cache_hit = await find_short_url(short_url)
+        duration = REDIRECT_DURATION_HIT if cache_hit else REDIRECT_DURATION_MISS
+        if not link or link.expired:
+            REDIRECT_NOT_FOUND.inc()
+            await send({
+                "type": "http.response.start",
+                "status": 404,
+                "headers": [(b"content-length", str(len(NOT_FOUND_BODY)).encode()), (b"content-type", b"application/json")],
+            })
+            await send({"type": "http.response.body", "body": NOT_FOUND_BODY})
+            return
+
+        user_agent, ip_address = "unknown", None
+        for name, value in scope["headers"]:
+            if name == b"user-agent":
+                user_agent = value.decode("latin-1")
+            elif name == b"cf-connecting-ip":
+                ip_address = value.decode("latin-1")
+        if not ip_address and scope.get("client"):
+            ip_address = scope["client"][0]
+        await click_pipeline.enqueue(link.id, ip_address, user_agent)
+
+        location = quote(redirect_target(link.long_url), safe=":/%#?=@[]!$&'()*+,;")
+        await send({
+            "type": "http.response.start",
+            "status": 307,
+            "headers": [(b"content-length", b"0"), (b"location", location.encode("latin-1"))],
+        })
+        await send({"type": "http.response.body", "body": b""})
+        duration.observe(time.perf_counter() - start)
@@ -1,15 +1,14 @@
-from fastapi import Depends, Request, HTTPException
-from config.config import get_db
-from services.auth_service import AuthService
+from fastapi import Request, HTTPException
+from services.auth_service import decode_access_token
 
-async def validate_user_middleware(request: Request, db = Depends(get_db)):
+async def validate_user_middleware(request: Request):
+    # the token alone identifies the user; no users query per authenticated request
     try:
         token = request.headers.get("Authorization")   
         if not token:
             raise HTTPException(status_code=401, detail="Authorization token missing")
         token = token.split(" ")[1]
-        auth_service = AuthService(db)
-        user = auth_service.get_current_user(token=token)
+        user = decode_access_token(token)
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
     
@@ -0,0 +1,51 @@
+from sqlalchemy import literal_column
+from sqlalchemy.exc import CompileError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.types import DateTime
+
+# strftime formats that truncate an SQLite timestamp to the start of a bucket;
+# week buckets start on Monday, matching date_trunc('week', ...) on PostgreSQL
+_SQLITE_BUCKETS = {
+    "minute": "strftime('%Y-%m-%d %H:%M:00', {expr})",
+    "hour": "strftime('%Y-%m-%d %H:00:00', {expr})",
+    "day": "strftime('%Y-%m-%d 00:00:00', {expr})",
+    "week": "strftime('%Y-%m-%d 00:00:00', {expr}, 'weekday 0', '-6 days')",
+    "month": "strftime('%Y-%m-01 00:00:00', {expr})",
+}
+
+
+class date_bucket(FunctionElement):
+    # date_bucket(Click.timestamp, "hour") truncates a timestamp to its bucket start in
+    # whatever dialect the statement is compiled for
+    type = DateTime()
+    name = "date_bucket"
+    inherit_cache = True
+
+    def __init__(self, expr, unit):
+        if unit not in _SQLITE_BUCKETS:
+            raise ValueError(f"Unknown unit {unit!r}")
+        # the unit is a literal rather than a bind so each unit gets its own compiled SQL
+        super().__init__(literal_column(f"'{unit}'"), expr)
+
+
+def _unit_and_expr(element, compiler, **kw):
+    unit_clause, expr = element.clauses.clauses
+    return unit_clause.name.strip("'"), compiler.process(expr, **kw)
+
+
+@compiles(date_bucket, "postgresql")
+def _compile_date_bucket_postgresql(element, compiler, **kw):
+    unit, expr = _unit_and_expr(element, compiler, **kw)
+    return f"date_trunc('{unit}', {expr})"
+
+
+@compiles(date_bucket, "sqlite")
+def _compile_date_bucket_sqlite(element, compiler, **kw):
+    unit, expr = _unit_and_expr(element, compiler, **kw)
+    return _SQLITE_BUCKETS[unit].format(expr=expr)
+
+
+@compiles(date_bucket)
+def _compile_date_bucket(element, compiler, **kw):
+    raise CompileError(f"date_bucket is not supported on {compiler.dialect.name}")
@@ -0,0 +1,88 @@
+from contextlib import contextmanager
+
+from sqlalchemy import select, text
+from sqlalchemy.schema import CreateIndex
+
+from config.config import logger, CLICK_PARTITION_MONTHS_AHEAD
+from models.models import Base, SchemaMigration
+from models.partitions import partition_clicks
+from services.rollup_service import backfill_rollups
+
+# create_all() only creates missing tables, so indexes added to existing tables are
+# applied here. Migrations run once, in order, and are recorded in schema_migrations.
+# Every uvicorn worker runs them at import, so the whole run holds a database-wide lock.
+
+# pg_advisory_xact_lock key, any constant shared by all workers
+MIGRATION_LOCK_KEY = 727_001
+
+
+def create_indexes(*names):
+    def migrate(connection):
+        indexes = {index.name: index for table in Base.metadata.sorted_tables for index in table.indexes}
+        for name in names:
+            connection.execute(CreateIndex(indexes[name], if_not_exists=True))
+    return migrate
+
+
+def drop_indexes(*names):
+    def migrate(connection):
+        for name in names:
+            connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    return migrate
+
+
+def partition_clicks_table(connection):
+    if connection.dialect.name != "postgresql":
+        return
+    partition_clicks(connection, CLICK_PARTITION_MONTHS_AHEAD)
+    # the old table's indexes were dropped with it; created on the parent, they cascade to every partition
+    create_indexes("ix_clicks_id", "ix_clicks_link_id_timestamp")(connection)
+
+
+MIGRATIONS = [
+    ("0001_analytics_indexes", create_indexes(
+        "ix_clicks_link_id_timestamp",
+        "ix_links_long_url_user_id",
+        "ix_links_user_id_active",
+        "ix_ip_info_click_id_country",
+    )),
+    ("0002_partition_clicks", partition_clicks_table),
+    # the hour and day expression indexes only served rollup rebuilds, which read every
+    # click anyway, and cost every click insert two more index updates
+    ("0003_drop_bucket_indexes", drop_indexes("ix_clicks_link_id_hour", "ix_clicks_link_id_day")),
+    ("0004_backfill_rollups", backfill_rollups),
+]
+
+
+@contextmanager
+def migration_lock(engine):
+    # One transaction that only one process at a time can be in: an advisory lock on
+    # PostgreSQL, BEGIN EXCLUSIVE on SQLite (whose driver would otherwise issue a plain BEGIN)
+    with engine.connect() as connection:
+        if connection.dialect.name == "sqlite":
+            connection.execution_options(isolation_level="AUTOCOMMIT")
+            connection.exec_driver_sql("BEGIN EXCLUSIVE")
+            try:
+                yield connection
+            except BaseException:
+                connection.exec_driver_sql("ROLLBACK")
+                raise
+            connection.exec_driver_sql("COMMIT")
+            return
+        with connection.begin():
+            if connection.dialect.name == "postgresql":
+                connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            yield connection
+
+
+def run_migrations(engine):
+    with migration_lock(engine) as connection:
+        # applied and pending versions are read under the lock, after any concurrent run committed
+        Base.metadata.create_all(bind=connection, checkfirst=True)
+        applied = set(connection.execute(select(SchemaMigration.version)).scalars())
+        for version, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            migrate(connection)
+            connection.execute(SchemaMigration.__table__.insert().values(version=version))
+            logger.info(f"Applied schema migration {version}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean
+from sqlalchemy import BigInteger, Column, Integer, String, ForeignKey, DateTime, Boolean, Index
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
@@ -26,6 +26,14 @@ class Link(Base):
     owner = relationship("User", back_populates="links")
     expired = Column(Boolean, default=False)
 
+    __table_args__ = (
+        # shorten_url dedup lookup
+        Index('ix_links_long_url_user_id', long_url, user_id),
+        # get_user_active_links, only active rows are indexed
+        Index('ix_links_user_id_active', user_id, postgresql_where=expired == False, sqlite_where=expired == False),
+    )
+
+# range partitioned by month on timestamp on PostgreSQL, see models/partitions.py
 class Click(Base):
     __tablename__ = 'clicks'
     id = Column(Integer, primary_key=True, index=True)
@@ -35,6 +43,11 @@ class Click(Base):
     user_agent = Column(String)
     link_id = Column(Integer, ForeignKey('links.id'))
 
+    __table_args__ = (
+        # every per-link analytics query filters on link_id plus a timestamp range
+        Index('ix_clicks_link_id_timestamp', link_id, timestamp),
+    )
+
 
 class IPInfo(Base):
     __tablename__ = 'ip_info'
@@ -47,4 +60,40 @@ class IPInfo(Base):
     org = Column(String)
     postal = Column(String)
     timezone = Column(String)
+    # the foreign key is dropped on PostgreSQL, where clicks is partitioned
     click_id = Column(Integer, ForeignKey('clicks.id'), unique=True)
+
+    # covers the clicks -> ip_info join of clicks_by_country without touching the table
+    __table_args__ = (
+        Index('ix_ip_info_click_id_country', click_id, country),
+    )
+
+
+class ClickRollup(Base):
+    __tablename__ = 'click_rollups'
+    link_id = Column(Integer, ForeignKey('links.id'), primary_key=True)
+    # minute, hour or day
+    granularity = Column(String, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    clicks = Column(Integer, nullable=False, default=0)
+
+
+class ShortCodeSequence(Base):
+    __tablename__ = 'short_code_sequences'
+    name = Column(String, primary_key=True)
+    # first value of the next block to be leased
+    next_value = Column(BigInteger, nullable=False)
+
+
+# logged-out tokens, shared by every worker until the token would have expired anyway
+class RevokedToken(Base):
+    __tablename__ = 'revoked_tokens'
+    jti = Column(String, primary_key=True)
+    # the token's exp claim, in unix seconds
+    expires_at = Column(BigInteger, nullable=False, index=True)
+
+
+class SchemaMigration(Base):
+    __tablename__ = 'schema_migrations'
+    version = Column(String, primary_key=True)
+    applied_at = Column(DateTime, default=datetime.now)
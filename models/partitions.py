@@ -0,0 +1,105 @@
+from datetime import datetime
+import re
+
+from sqlalchemy import text
+
+# On PostgreSQL, clicks is range partitioned by month on timestamp, one partition per month
+# named clicks_YYYY_MM plus clicks_default for rows outside them. Partitioned tables need the
+# partition key in their primary key, so it is (id, timestamp), and ip_info.click_id can no
+# longer reference clicks.id. SQLite keeps the plain table.
+
+DEFAULT_PARTITION = "clicks_default"
+_PARTITION_NAME = re.compile(r"^clicks_(\d{4})_(\d{2})$")
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"clicks_{month:%Y_%m}"
+
+
+def partition_month(name):
+    match = _PARTITION_NAME.match(name)
+    return datetime(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def is_partitioned(connection):
+    if connection.dialect.name != "postgresql":
+        return False
+    return connection.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('clicks')")).scalar() == "p"
+
+
+def list_partitions(connection):
+    # {month: name} of the monthly partitions; the default partition is not included
+    names = connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = to_regclass('clicks')"
+    )).scalars()
+    return dict(sorted((partition_month(name), name) for name in names if partition_month(name)))
+
+
+def create_month_partition(connection, month):
+    # Rows of the month that already landed in the default partition are moved into the new
+    # table before it is attached, otherwise attaching would fail
+    name, start, end = partition_name(month), month, add_months(month, 1)
+    bounds = {"start": start, "end": end}
+    connection.execute(text(f"CREATE TABLE {name} (LIKE clicks INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    connection.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), bounds)
+    connection.execute(text(
+        f"ALTER TABLE clicks ATTACH PARTITION {name} FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    return name
+
+
+def drop_month_partition(connection, name):
+    # ip_info rows of the dropped clicks would be orphaned, there is no foreign key to cascade
+    connection.execute(text(f"DELETE FROM ip_info WHERE click_id IN (SELECT id FROM {name})"))
+    connection.execute(text(f"ALTER TABLE clicks DETACH PARTITION {name}"))
+    connection.execute(text(f"DROP TABLE {name}"))
+
+
+def partition_clicks(connection, months_ahead):
+    # Converts the plain clicks table created by create_all() into a partitioned one and
+    # copies its rows over; a no-op on SQLite or when it is already partitioned
+    if connection.dialect.name != "postgresql" or is_partitioned(connection):
+        return
+    connection.execute(text("ALTER TABLE ip_info DROP CONSTRAINT IF EXISTS ip_info_click_id_fkey"))
+    connection.execute(text("ALTER TABLE clicks RENAME TO clicks_unpartitioned"))
+    connection.execute(text("ALTER INDEX clicks_pkey RENAME TO clicks_unpartitioned_pkey"))
+    connection.execute(text(
+        "CREATE TABLE clicks ("
+        "id INTEGER NOT NULL DEFAULT nextval('clicks_id_seq'), "
+        "ip VARCHAR, "
+        "timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+        "user_agent VARCHAR, "
+        "link_id INTEGER REFERENCES links (id), "
+        "PRIMARY KEY (id, timestamp)"
+        ") PARTITION BY RANGE (timestamp)"
+    ))
+    # the id sequence belonged to the old table and would be dropped with it
+    connection.execute(text("ALTER SEQUENCE clicks_id_seq OWNED BY clicks.id"))
+    connection.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF clicks DEFAULT"))
+
+    first = connection.execute(text("SELECT min(timestamp) FROM clicks_unpartitioned")).scalar()
+    month = month_start(first or datetime.now())
+    last = add_months(month_start(datetime.now()), months_ahead)
+    while month <= last:
+        create_month_partition(connection, month)
+        month = add_months(month, 1)
+    # a click without a timestamp cannot be routed to a partition; it goes to the default one
+    connection.execute(text(
+        "INSERT INTO clicks (id, ip, timestamp, user_agent, link_id) "
+        "SELECT id, ip, COALESCE(timestamp, 'epoch'), user_agent, link_id FROM clicks_unpartitioned"
+    ))
+    connection.execute(text("DROP TABLE clicks_unpartitioned"))
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException, Depends, status, Query, Response, Request
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
 from models.models import User as UserModel, Link as LinkModel, Click as ClickModel
@@ -10,6 +10,8 @@ from schemas.Schemas import (
 )
 from config.dependencies import  get_auth_service
 from services.auth_service import AuthService
+from services.password_hasher import PasswordHasherBusy
+from middlewares.user_validation import validate_user_middleware
 from config.config import oauth2_scheme, SECRET_KEY, ALGORITHM, get_db
 
 router = APIRouter()
@@ -18,11 +20,13 @@ router = APIRouter()
 async def register_user_route(
     user: UserBody,
     auth_service: AuthService = Depends(get_auth_service),
-     db: Session = Depends(get_db),
+     db: AsyncSession = Depends(get_db),
 ):
     try:
-        new_user = auth_service.register_user(user)
+        new_user = await auth_service.register_user(user)
         return new_user
+    except PasswordHasherBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -30,15 +34,26 @@ async def register_user_route(
 async def authenticate(
     formdata: OAuth2PasswordRequestForm = Depends(),
     auth_service: AuthService = Depends(get_auth_service),
-     db: Session = Depends(get_db),
+     db: AsyncSession = Depends(get_db),
 ):
     
     try:
         user  = UserBody(username=formdata.username, password=formdata.password)
-        token = auth_service.authenticate_user(user)
+        token = await auth_service.authenticate_user(user)
         return token
+    except PasswordHasherBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
 
 
 
+
+@router.post("/logout")
+async def logout(
+    token: str = Depends(oauth2_scheme),
+    user = Depends(validate_user_middleware),
+    auth_service: AuthService = Depends(get_auth_service),
+):
+    await auth_service.revoke_token(user)
+    return {"message": "Successfully logged out"}
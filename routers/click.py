@@ -1,10 +1,10 @@
 from fastapi import APIRouter, HTTPException, Depends, status, Query, Response, Request
-from sqlalchemy.orm import Session
 from fastapi.responses import RedirectResponse
 from datetime import datetime
 from models.models import User as UserModel, Link as LinkModel, Click as ClickModel
 from config.dependencies import get_click_service
 from config.config import oauth2_scheme
+from config.metrics import Histogram
 from services.click_service import ClickService
 from middlewares.link_validation import validate_link_middleware 
 from middlewares.user_validation import validate_user_middleware
@@ -21,28 +21,34 @@ from schemas.Schemas import (
 
 router = APIRouter()
 
+CLICK_UNITS = ["minute", "hour", "day", "week", "month"]
+ANALYTICS_DURATION = Histogram(
+    "analytics_duration_seconds", "Time spent in ClickService per analytics endpoint and unit", ["endpoint", "unit"]
+)
+
 @router.get("/api/bitlinks/{link_id}/clicks", response_model=ClicksSummary)
 async def get_clicks(
     link_id: int,
     token: str = Depends(oauth2_scheme),
     user = Depends(validate_user_middleware), 
     link = Depends(validate_link_middleware),  
-    unit: str = Query("day", enum=["minute", "hour", "day", "week", "month"]),
+    unit: str = Query("day", enum=CLICK_UNITS),
     click_service: ClickService = Depends(get_click_service),
 ):
-       
-    if unit == "minute":
-        return click_service.clicks_by_minute(link_id)
-    elif unit == "hour":
-        return click_service.clicks_by_hour(link_id)
-    elif unit == "day":
-        return click_service.clicks_by_day(link_id)
-    elif unit == "week":
-        return click_service.clicks_by_week(link_id)
-    elif unit == "month":
-        return click_service.clicks_by_month(link_id)
-    else:
-        raise HTTPException(status_code=400, detail="Invalid unit specified")
+    # unit comes from the query string; keep unknown values out of the label set
+    with ANALYTICS_DURATION.labels(endpoint="clicks", unit=unit if unit in CLICK_UNITS else "invalid").time():
+        if unit == "minute":
+            return await click_service.clicks_by_minute(link_id)
+        elif unit == "hour":
+            return await click_service.clicks_by_hour(link_id)
+        elif unit == "day":
+            return await click_service.clicks_by_day(link_id)
+        elif unit == "week":
+            return await click_service.clicks_by_week(link_id)
+        elif unit == "month":
+            return await click_service.clicks_by_month(link_id)
+        else:
+            raise HTTPException(status_code=400, detail="Invalid unit specified")
     
 @router.get("/api/bitlinks/{link_id}/countries", response_model=ClicksSummaryByCountry)
 async def get_clicks_by_country(
@@ -51,5 +57,9 @@ async def get_clicks_by_country(
     user = Depends(validate_user_middleware), 
     link = Depends(validate_link_middleware),  
     click_service: ClickService = Depends(get_click_service),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    limit: Optional[int] = Query(None, ge=1),
 ):
-   return click_service.clicks_by_country(link_id)
\ No newline at end of file
+    with ANALYTICS_DURATION.labels(endpoint="countries", unit="").time():
+        return await click_service.clicks_by_country(link_id, start, end, limit)
\ No newline at end of file
@@ -1,10 +1,12 @@
 from fastapi import APIRouter, HTTPException, Depends, status, Query, Response, Request
-from sqlalchemy.orm import Session
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 from datetime import datetime
+from collections import Counter
+import json
 from models.models import User as UserModel, Link as LinkModel, Click as ClickModel
 from config.dependencies import get_link_service
 from services.link_service import LinkService
+from services import click_export
 from middlewares.link_validation import validate_link_middleware 
 from middlewares.user_validation import validate_user_middleware
 from fastapi import BackgroundTasks
@@ -16,7 +18,7 @@ from schemas.Schemas import (
     ShortenLinkRequest
 )
 
-from config.config import oauth2_scheme
+from config.config import oauth2_scheme, BULK_SHORTEN_MAX_ITEMS
 router = APIRouter()
 
 
@@ -28,10 +30,72 @@ async def shorten_link(
     link_service: LinkService = Depends(get_link_service),
 ):
     try:
-        return link_service.shorten_url(body, user)
+        return await link_service.shorten_url(body, user)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-seq")
+
+
+async def ndjson_items(request):
+    # parse the body line by line as it arrives; lines that are not JSON come back as invalid items
+    buffer = b""
+    async for data in request.stream():
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield parse_ndjson_line(line)
+    if buffer.strip():
+        yield parse_ndjson_line(buffer)
+
+
+def parse_ndjson_line(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+async def json_items(items):
+    for item in items:
+        yield item
+
+
+@router.post("/shorten/bulk")
+async def shorten_links_bulk(
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+    user = Depends(validate_user_middleware),
+    link_service: LinkService = Depends(get_link_service),
+):
+    # Accepts a JSON array of ShortenLinkRequest objects, or one object per line with an NDJSON content type
+    if request.headers.get("content-type", "").startswith(NDJSON_CONTENT_TYPES):
+        items = ndjson_items(request)
+    else:
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        if not isinstance(body, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        if len(body) > BULK_SHORTEN_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"At most {BULK_SHORTEN_MAX_ITEMS} links per request")
+        items = json_items(body)
+
+    results, truncated = await link_service.shorten_urls(items, user)
+    summary = Counter(result["status"] for result in results)
+    return {
+        "total": len(results),
+        "created": summary["created"],
+        "existing": summary["existing"],
+        "conflict": summary["conflict"],
+        "invalid": summary["invalid"],
+        # NDJSON bodies stop being read after BULK_SHORTEN_MAX_ITEMS lines
+        "truncated": truncated,
+        "results": results,
+    }
+
 @router.delete("/api/bitlinks/{link_id}")
 async def delete_bitlink(
     link_id: int,
@@ -41,7 +105,7 @@ async def delete_bitlink(
     link_service: LinkService = Depends(get_link_service),
 ):
     try:
-        link_service.delete_link(link)
+        await link_service.delete_link(link)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     return {"message": "Link successfully deleted"}
@@ -54,17 +118,40 @@ async def unique_clicks(
     user = Depends(validate_user_middleware), 
     link = Depends(validate_link_middleware),  
     link_service: LinkService = Depends(get_link_service),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    count_only: bool = Query(False),
 ):
     try:   
-        unique_clicks_info = link_service.get_unique_clicks(link_id)
+        total, unique_clicks_info = await link_service.get_unique_clicks(link_id, offset, limit, count_only)
+        if count_only:
+            return {"total_unique_clicks": total}
 
         return {
             "unique_clicks": unique_clicks_info,
-            "total_unique_clicks": len(unique_clicks_info)
+            "total_unique_clicks": total
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/api/bitlinks/{link_id}/clicks/export")
+async def export_clicks(
+    link_id: int,
+    token: str = Depends(oauth2_scheme),
+    user = Depends(validate_user_middleware),
+    link = Depends(validate_link_middleware),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+):
+    # Raw clicks with their IP info, streamed as they are read; see services/click_export.py
+    return StreamingResponse(
+        click_export.export_clicks(link_id, format, start, end),
+        media_type=click_export.EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="link-{link_id}-clicks.{format}"'},
+    )
+
+
 @router.get("/api/bitlinks/active")
 async def get_links_active( 
     token: str = Depends(oauth2_scheme),                    
@@ -72,7 +159,7 @@ async def get_links_active(
     link_service: LinkService = Depends(get_link_service),   
 ):
     try:
-        links = link_service.get_user_active_links(user)
+        links = await link_service.get_user_active_links(user)
         return links
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,36 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from config.config import async_engine, logging_pipeline
+from config.metrics import REGISTRY, CallbackMetric
+from config.pool import pool_stats
+from services.cache import link_cache
+from services.click_archive import click_archive
+from services.click_ingestion import click_pipeline
+from services.ip_enrichment import ip_enrichment_worker
+from services.link_filter import link_filter
+
+router = APIRouter()
+
+# Components that already keep counters for /stats are read when scraped
+CallbackMetric("clicks_enqueued_total", "Clicks accepted by the ingestion pipeline", "counter", lambda: click_pipeline.enqueued)
+CallbackMetric("clicks_written_total", "Clicks flushed to the clicks table", "counter", lambda: click_pipeline.written)
+CallbackMetric("clicks_dropped_total", "Clicks dropped by the drop_oldest overflow policy", "counter", lambda: click_pipeline.dropped)
+CallbackMetric("clicks_spilled_total", "Clicks spilled to disk on queue overflow", "counter", lambda: click_pipeline.spilled)
+CallbackMetric("clicks_archived_total", "Clicks moved to the Parquet archive", "counter", lambda: click_archive.archived)
+CallbackMetric("click_queue_depth", "Clicks waiting to be flushed", "gauge", lambda: click_pipeline.stats()["queued"])
+CallbackMetric("ip_enrichment_queue_depth", "Clicks waiting for IP enrichment", "gauge", lambda: ip_enrichment_worker.stats()["queued"])
+CallbackMetric("ip_enrichment_lookups_total", "IP info provider lookups", "counter", lambda: ip_enrichment_worker.lookups)
+CallbackMetric("ip_enrichment_failures_total", "Failed IP info lookups", "counter", lambda: ip_enrichment_worker.failures)
+CallbackMetric("ip_enrichment_dropped_total", "Clicks dropped by a full enrichment queue", "counter", lambda: ip_enrichment_worker.dropped)
+CallbackMetric("link_cache_hits_total", "Short code cache hits", "counter", lambda: link_cache.hits)
+CallbackMetric("link_cache_misses_total", "Short code cache misses", "counter", lambda: link_cache.misses)
+CallbackMetric("link_filter_rejected_total", "Unknown short codes answered by the link filter", "counter", lambda: link_filter.rejected)
+CallbackMetric("log_records_dropped_total", "Log records dropped by a full logging queue", "counter", lambda: logging_pipeline.handler.dropped)
+CallbackMetric("log_records_sampled_out_total", "Log records skipped by per-event sampling", "counter", lambda: logging_pipeline.sampling.suppressed)
+CallbackMetric("db_pool_checked_out", "Request pool connections in use", "gauge", lambda: pool_stats(async_engine).get("checked_out", 0))
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,69 @@
+from fastapi import APIRouter
+from config.config import async_engine, engine, logging_pipeline
+from config.pool import pool_stats
+from services.cache import link_cache
+from services.token_denylist import token_denylist
+from services.click_archive import click_archive
+from services.click_ingestion import click_pipeline
+from services.click_partitions import click_partition_manager
+from services.ip_enrichment import ip_enrichment_worker
+from services.link_filter import link_filter
+from services.password_hasher import password_hasher
+from services.short_code_allocator import short_code_allocator
+
+router = APIRouter()
+
+
+@router.get("/link-cache")
+async def get_link_cache_stats():
+    return link_cache.stats()
+
+
+@router.get("/click-pipeline")
+async def get_click_pipeline_stats():
+    return click_pipeline.stats()
+
+
+@router.get("/ip-enrichment")
+async def get_ip_enrichment_stats():
+    return ip_enrichment_worker.stats()
+
+
+@router.get("/pool")
+async def get_pool_stats():
+    return {"request": pool_stats(async_engine), "background": pool_stats(engine)}
+
+
+@router.get("/revoked-tokens")
+async def get_revoked_token_stats():
+    return token_denylist.stats()
+
+
+@router.get("/password-hasher")
+async def get_password_hasher_stats():
+    return password_hasher.stats()
+
+
+@router.get("/short-codes")
+async def get_short_code_stats():
+    return short_code_allocator.stats()
+
+
+@router.get("/link-filter")
+async def get_link_filter_stats():
+    return link_filter.stats()
+
+
+@router.get("/click-archive")
+async def get_click_archive_stats():
+    return click_archive.stats()
+
+
+@router.get("/click-partitions")
+def get_click_partition_stats():
+    return click_partition_manager.stats()
+
+
+@router.get("/logging")
+async def get_logging_stats():
+    return logging_pipeline.stats()
@@ -0,0 +1,21 @@
+import argparse
+
+from services.ip_enrichment import ip_enrichment_worker
+
+
+def main():
+    parser = argparse.ArgumentParser(description="enrich clicks that have no ip_info row with the configured geo-IP backend")
+    parser.add_argument("--batch-size", type=int, default=1000, help="clicks read and enriched per round")
+    args = parser.parse_args()
+
+    ip_enrichment_worker.start()
+    try:
+        total = ip_enrichment_worker.backfill(args.batch_size)
+    finally:
+        ip_enrichment_worker.stop()
+    stats = ip_enrichment_worker.stats()
+    print(f"backfilled {total} clicks: {stats['written']} written, {stats['failures']} failed, {stats['lookups']} lookups")
+
+
+if __name__ == "__main__":
+    main()
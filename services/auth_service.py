@@ -1,56 +1,90 @@
 from datetime import datetime
+from collections import namedtuple
+import uuid
 from fastapi import HTTPException, Depends, status
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
-from datetime import timedelta
+from datetime import timedelta, timezone
 from models.models import User
 from schemas.Schemas import UserBody
-from config.config import SECRET_KEY, ALGORITHM, oauth2_scheme
+from config.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, oauth2_scheme
+from services.token_denylist import token_denylist
+from services.password_hasher import password_hasher
+
+# What an access token proves about its bearer, without reading the users table
+TokenUser = namedtuple("TokenUser", ["id", "username", "jti", "expires_at"])
+
+_REQUIRED_CLAIMS = {"require_sub": True, "require_exp": True, "require_iat": True, "require_jti": True}
+
+
+def create_access_token(user):
+    issued_at = datetime.now(timezone.utc)
+    payload = {
+        "sub": str(user.id),
+        "username": user.username,
+        "iat": issued_at,
+        "exp": issued_at + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+        "jti": uuid.uuid4().hex,
+    }
+    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def decode_access_token(token):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options=_REQUIRED_CLAIMS)
+        user = TokenUser(int(payload["sub"]), payload.get("username"), payload["jti"], payload["exp"])
+    except (JWTError, ValueError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    if token_denylist.is_revoked(user.jti):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+        )
+    return user
+
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 class AuthService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
 
-    def register_user(self,user: UserBody) -> User:
-        db_user = self.db.query(User).filter(User.username == user.username).first()
+    async def register_user(self,user: UserBody) -> User:
+        db_user = await self.get_user_by_username(user.username)
         if db_user:
             raise ValueError("username already registered")
         
-        hashed_password = pwd_context.hash(user.password)
+        hashed_password = await password_hasher.hash(user.password)
         new_user = User(username=user.username, password=hashed_password)
         self.db.add(new_user)
-        self.db.commit()
-        self.db.refresh(new_user)
+        await self.db.commit()
+        await self.db.refresh(new_user)
         return new_user
 
-    def authenticate_user(self,user: UserBody):
-        db_user = self.db.query(User).filter(User.username == user.username).first()
-        if not db_user or not self.verify_password(user.password, db_user.password):
+    async def authenticate_user(self,user: UserBody):
+        db_user = await self.get_user_by_username(user.username)
+        if not db_user or not await self.verify_password(user.password, db_user):
             raise ValueError("Invalid credentials")
         
-        token_payload = {"username": user.username}
-        token = jwt.encode(token_payload, SECRET_KEY, algorithm=ALGORITHM)
+        token = create_access_token(db_user)
         
         return {"access_token": token, "token_type": "bearer", "user_id": db_user.id, "username": db_user.username}
 
-    def verify_password(self,plain_password: str, hashed_password: str) -> bool:
-        return pwd_context.verify(plain_password, hashed_password)
+    async def verify_password(self,plain_password: str, db_user: User) -> bool:
+        valid, new_hash = await password_hasher.verify(plain_password, db_user.password)
+        if valid and new_hash:
+            # BCRYPT_ROUNDS changed since this hash was made
+            db_user.password = new_hash
+            await self.db.commit()
+        return valid
+
+    async def get_user_by_username(self, username):
+        return (await self.db.scalars(select(User).filter(User.username == username).limit(1))).first()
 
     def get_current_user(self,token: str = Depends(oauth2_scheme)):
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            username = payload.get("username")
-            user = self.db.query(User).filter(User.username == username).first()   
-            if username is None or user is None:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Could not validate credentials",
-                ) 
-            return user
-        except JWTError as e:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail=str(e)
-            )
+        return decode_access_token(token)
+
+    async def revoke_token(self, user: TokenUser):
+        await token_denylist.revoke(self.db, user.jti, user.expires_at)
@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+# Bucket boundaries are naive datetimes in server local time, the same clock
+# Click.timestamp is written with, for every unit.
+UNITS = ("minute", "hour", "day", "week", "month")
+
+_STEPS = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+}
+
+
+def truncate(value, unit):
+    if unit == "minute":
+        return value.replace(second=0, microsecond=0)
+    if unit == "hour":
+        return value.replace(minute=0, second=0, microsecond=0)
+    if unit == "day":
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit == "week":
+        return truncate(value, "day") - timedelta(days=value.weekday())
+    if unit == "month":
+        return truncate(value, "day").replace(day=1)
+    raise ValueError(f"Unknown unit {unit!r}")
+
+
+def next_bucket(bucket, unit):
+    if unit == "month":
+        if bucket.month == 12:
+            return bucket.replace(year=bucket.year + 1, month=1)
+        return bucket.replace(month=bucket.month + 1)
+    return bucket + _STEPS[unit]
+
+
+def fill_series(rows, start_date, end_date, unit):
+    # rows are (timestamp, clicks) sorted ascending, at the requested unit or any finer one.
+    # Walks buckets and rows together once and returns a dense [(bucket, clicks)] newest first.
+    rows = iter(rows)
+    row = next(rows, None)
+    current = truncate(start_date, unit)
+    last = truncate(end_date, unit)
+    series = []
+    while current <= last:
+        following = next_bucket(current, unit)
+        clicks = 0
+        while row is not None and row[0] < following:
+            if row[0] >= current:
+                clicks += row[1]
+            row = next(rows, None)
+        series.append((current, clicks))
+        current = following
+    series.reverse()
+    return series
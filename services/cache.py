@@ -0,0 +1,69 @@
+from collections import OrderedDict, namedtuple
+import threading
+import time
+
+from config.config import LINK_CACHE_SIZE, LINK_CACHE_TTL
+
+CachedLink = namedtuple("CachedLink", ["id", "long_url", "expired"])
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# short_url -> CachedLink, consulted by the redirect path before the database
+link_cache = TTLCache(LINK_CACHE_SIZE, LINK_CACHE_TTL)
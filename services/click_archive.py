@@ -0,0 +1,253 @@
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timedelta
+import heapq
+import itertools
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import delete, select
+
+from config.config import (
+    logger,
+    SessionLocal,
+    CLICK_ARCHIVE_PATH,
+    CLICK_ARCHIVE_AFTER_DAYS,
+    CLICK_ARCHIVE_BATCH_SIZE,
+    CLICK_ARCHIVE_INTERVAL,
+    CLICK_ARCHIVE_COMPRESSION,
+)
+from models.models import Click as ClickModel, IPInfo as IPInfoModel
+from services.periodic import PeriodicTask
+
+IP_INFO_FIELDS = ("city", "region", "country", "loc", "org", "postal", "timezone")
+
+# one row per click with its IP info denormalized in; enriched is false for clicks that
+# never got an ip_info row
+SCHEMA = pa.schema(
+    [
+        ("click_id", pa.int64()),
+        ("link_id", pa.int64()),
+        ("timestamp", pa.timestamp("us")),
+        ("ip", pa.string()),
+        ("user_agent", pa.string()),
+        ("enriched", pa.bool_()),
+        *((field, pa.string()) for field in IP_INFO_FIELDS),
+    ]
+)
+# files are sorted by (link_id, timestamp), so row group statistics let a per-link read
+# skip most of a month
+ROW_GROUP_SIZE = 64 * 1024
+
+
+def month_key(value):
+    return value.strftime("%Y-%m")
+
+
+def first_timestamp(path):
+    # earliest click in a file from its row group statistics, without reading any rows
+    metadata = pq.ParquetFile(path).metadata
+    column = SCHEMA.get_field_index("timestamp")
+    minimums = []
+    for index in range(metadata.num_row_groups):
+        statistics = metadata.row_group(index).column(column).statistics
+        if statistics is None or not statistics.has_min_max:
+            return datetime.min
+        minimums.append(statistics.min)
+    return min(minimums, default=datetime.min)
+
+
+class ClickArchive:
+    # Parquet files partitioned by month (path/month=YYYY-MM/part-<first click id>.parquet).
+    # Reads prune by month from the directory names before opening any file.
+    def __init__(self, path, session_factory=SessionLocal, after_days=CLICK_ARCHIVE_AFTER_DAYS,
+                 batch_size=CLICK_ARCHIVE_BATCH_SIZE, compression=CLICK_ARCHIVE_COMPRESSION):
+        self.path = path
+        self.session_factory = session_factory
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.compression = compression
+        self.archived = 0
+        self.last_cutoff = None
+        self.last_duration = None
+
+    def months(self, start_date=None, end_date=None):
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return []
+        first = month_key(start_date) if start_date else None
+        last = month_key(end_date) if end_date else None
+        months = sorted(name[len("month="):] for name in names if name.startswith("month="))
+        return [month for month in months if (first is None or month >= first) and (last is None or month <= last)]
+
+    def files(self, months):
+        files = []
+        for month in months:
+            directory = os.path.join(self.path, f"month={month}")
+            files.extend(os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.endswith(".parquet"))
+        return files
+
+    def scan(self, link_id=None, start_date=None, end_date=None, months=None):
+        # (dataset, filter) over the matching months, or None when none are archived
+        files = self.files(self.months(start_date, end_date) if months is None else months)
+        if not files:
+            return None
+        expression = None
+        for condition in (
+            ds.field("link_id") == link_id if link_id is not None else None,
+            ds.field("timestamp") >= pa.scalar(start_date, pa.timestamp("us")) if start_date else None,
+            ds.field("timestamp") <= pa.scalar(end_date, pa.timestamp("us")) if end_date else None,
+        ):
+            if condition is not None:
+                expression = condition if expression is None else expression & condition
+        return ds.dataset(files, schema=SCHEMA, format="parquet"), expression
+
+    def read(self, columns, link_id=None, start_date=None, end_date=None, months=None):
+        scan = self.scan(link_id, start_date, end_date, months)
+        if scan is None:
+            return SCHEMA.empty_table().select(columns)
+        dataset, expression = scan
+        return dataset.to_table(columns=columns, filter=expression)
+
+    def batches(self, columns, link_id=None, start_date=None, end_date=None, batch_size=ROW_GROUP_SIZE):
+        # record batches read lazily, file by file in month order, for exports
+        scan = self.scan(link_id, start_date, end_date)
+        if scan is None:
+            return iter(())
+        dataset, expression = scan
+        return dataset.to_batches(columns=columns, filter=expression, batch_size=batch_size)
+
+    def country_counts(self, link_id, start_date=None, end_date=None):
+        table = self.read(["country"], link_id, start_date, end_date)
+        if not table.num_rows:
+            return Counter()
+        grouped = table.group_by("country").aggregate([([], "count_all")])
+        return Counter(dict(zip(grouped["country"].to_pylist(), grouped["count_all"].to_pylist())))
+
+    def link_clicks(self, link_id, batch_size=ROW_GROUP_SIZE):
+        # All of a link's archived clicks in (timestamp, click_id) order, read lazily. Each
+        # file is sorted by (link_id, timestamp) with ties in id order, so a month is a
+        # merge of its files. A file is only opened once the merge reaches its earliest
+        # timestamp; archive runs write consecutive time ranges, so few are open at once.
+        for month in self.months():
+            pending = deque(sorted((first_timestamp(path), path) for path in self.files([month])))
+            heap = []
+            order = itertools.count()
+
+            def advance(clicks):
+                click = next(clicks, None)
+                if click is not None:
+                    heapq.heappush(heap, ((click["timestamp"], click["click_id"]), next(order), click, clicks))
+
+            while heap or pending:
+                while pending and (not heap or pending[0][0] <= heap[0][0][0]):
+                    advance(self._file_link_clicks(pending.popleft()[1], link_id, batch_size))
+                if heap:
+                    _, _, click, clicks = heapq.heappop(heap)
+                    yield click
+                    advance(clicks)
+
+    def _file_link_clicks(self, path, link_id, batch_size):
+        # row groups whose link_id range excludes the link are skipped; the rest are decoded
+        # one batch at a time, which a dataset scan with a filter does not guarantee
+        parquet = pq.ParquetFile(path)
+        column = SCHEMA.get_field_index("link_id")
+        row_groups = []
+        for index in range(parquet.metadata.num_row_groups):
+            statistics = parquet.metadata.row_group(index).column(column).statistics
+            if statistics is None or not statistics.has_min_max or statistics.min <= link_id <= statistics.max:
+                row_groups.append(index)
+        columns = ["link_id", "click_id", "timestamp", "ip", "user_agent", "enriched", *IP_INFO_FIELDS]
+        for batch in parquet.iter_batches(batch_size=batch_size, row_groups=row_groups, columns=columns):
+            yield from batch.filter(pc.equal(batch["link_id"], link_id)).to_pylist()
+
+    def bucket_counts(self, granularity):
+        # per (link_id, bucket start) counts of every archived click, for rollup rebuilds
+        files = self.files(self.months())
+        counts = Counter()
+        if not files:
+            return counts
+        for batch in ds.dataset(files, schema=SCHEMA, format="parquet").to_batches(columns=["link_id", "timestamp"]):
+            table = pa.table({"link_id": batch["link_id"], "bucket": pc.floor_temporal(batch["timestamp"], unit=granularity)})
+            grouped = table.group_by(["link_id", "bucket"]).aggregate([([], "count_all")])
+            for link_id, bucket, clicks in zip(*(grouped[name].to_pylist() for name in ("link_id", "bucket", "count_all"))):
+                counts[(link_id, bucket)] += clicks
+        return counts
+
+    def archive_clicks(self, now=None):
+        cutoff = (now or datetime.now()) - timedelta(days=self.after_days)
+        start = time.perf_counter()
+        total = 0
+        db = self.session_factory()
+        try:
+            while True:
+                rows = db.execute(
+                    select(
+                        ClickModel.id.label("click_id"),
+                        ClickModel.link_id,
+                        ClickModel.timestamp,
+                        ClickModel.ip,
+                        ClickModel.user_agent,
+                        (IPInfoModel.id != None).label("enriched"),
+                        *(getattr(IPInfoModel, field) for field in IP_INFO_FIELDS),
+                    ).outerjoin(
+                        IPInfoModel, IPInfoModel.click_id == ClickModel.id
+                    ).filter(
+                        ClickModel.timestamp < cutoff
+                    ).order_by(ClickModel.id).limit(self.batch_size)
+                ).all()
+                if not rows:
+                    break
+                self._write([{**row._asdict(), "enriched": bool(row.enriched)} for row in rows])
+                # the batch is exactly the archivable clicks up to its last id; the files are
+                # in place before the rows are deleted, so a failure in between is retried
+                # with the same first ids and overwrites them
+                archived = (ClickModel.id <= rows[-1].click_id) & (ClickModel.timestamp < cutoff)
+                db.execute(delete(IPInfoModel).where(IPInfoModel.click_id.in_(select(ClickModel.id).where(archived))))
+                db.execute(delete(ClickModel).where(archived))
+                db.commit()
+                total += len(rows)
+                self.archived += len(rows)
+        finally:
+            db.close()
+        self.last_cutoff = cutoff
+        self.last_duration = time.perf_counter() - start
+        if total:
+            logger.info(f"Archived {total} clicks older than {cutoff} in {self.last_duration:.2f}s")
+        return total
+
+    def _write(self, rows):
+        by_month = defaultdict(list)
+        for row in rows:
+            by_month[month_key(row["timestamp"])].append(row)
+        for month, month_rows in by_month.items():
+            month_rows.sort(key=lambda row: (row["link_id"], row["timestamp"]))
+            directory = os.path.join(self.path, f"month={month}")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"part-{min(row['click_id'] for row in month_rows)}.parquet")
+            table = pa.Table.from_pylist(month_rows, schema=SCHEMA)
+            pq.write_table(table, path + ".tmp", compression=self.compression, row_group_size=ROW_GROUP_SIZE)
+            os.replace(path + ".tmp", path)
+
+    def stats(self):
+        months = self.months()
+        files = self.files(months)
+        return {
+            "months": len(months),
+            "first_month": months[0] if months else None,
+            "last_month": months[-1] if months else None,
+            "files": len(files),
+            "bytes": sum(os.path.getsize(path) for path in files),
+            "archived": self.archived,
+            "after_days": self.after_days,
+            "last_cutoff": self.last_cutoff,
+            "last_duration": self.last_duration,
+        }
+
+
+click_archive = ClickArchive(CLICK_ARCHIVE_PATH)
+click_archiver = PeriodicTask("click-archiver", CLICK_ARCHIVE_INTERVAL, click_archive.archive_clicks, run_immediately=True)
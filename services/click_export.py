@@ -0,0 +1,79 @@
+import asyncio
+import csv
+from datetime import datetime
+import io
+import json
+
+from sqlalchemy import select
+
+from config.config import AsyncSessionLocal, CLICK_EXPORT_CHUNK_SIZE
+from models.models import Click as ClickModel, IPInfo as IPInfoModel
+from services.click_archive import click_archive, IP_INFO_FIELDS
+
+EXPORT_FIELDS = ("click_id", "timestamp", "ip", "user_agent", *IP_INFO_FIELDS)
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def encode_ndjson(rows):
+    return "".join(json.dumps({field: export_value(row[field]) for field in EXPORT_FIELDS}) + "\n" for row in rows)
+
+
+def encode_csv(rows, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_FIELDS)
+    writer.writerows([export_value(row[field]) for field in EXPORT_FIELDS] for row in rows)
+    return buffer.getvalue()
+
+
+async def archived_click_batches(link_id, start_date, end_date, chunk_size):
+    # the archive scan is blocking, each batch is pulled on a worker thread
+    batches = click_archive.batches(list(EXPORT_FIELDS), link_id, start_date, end_date, batch_size=chunk_size)
+    while True:
+        batch = await asyncio.to_thread(next, batches, None)
+        if batch is None:
+            return
+        if batch.num_rows:
+            yield batch.to_pylist()
+
+
+async def table_click_batches(db, link_id, start_date, end_date, chunk_size):
+    query = select(
+        ClickModel.id.label("click_id"),
+        ClickModel.timestamp,
+        ClickModel.ip,
+        ClickModel.user_agent,
+        *(getattr(IPInfoModel, field) for field in IP_INFO_FIELDS),
+    ).outerjoin(
+        IPInfoModel, IPInfoModel.click_id == ClickModel.id
+    ).filter(ClickModel.link_id == link_id)
+    if start_date:
+        query = query.filter(ClickModel.timestamp >= start_date)
+    if end_date:
+        query = query.filter(ClickModel.timestamp <= end_date)
+    # stream() runs on a server-side cursor; yield_per bounds the rows held at once
+    result = await db.stream(
+        query.order_by(ClickModel.timestamp, ClickModel.id).execution_options(yield_per=chunk_size)
+    )
+    async for partition in result.mappings().partitions():
+        yield partition
+
+
+async def export_clicks(link_id, fmt="ndjson", start_date=None, end_date=None,
+                        chunk_size=CLICK_EXPORT_CHUNK_SIZE, session_factory=AsyncSessionLocal):
+    # Yields the link's clicks joined with their IP info, archived ones first, one encoded
+    # chunk per batch so memory does not grow with the number of clicks. The request's
+    # session is closed before a streamed body is sent, so the export opens its own.
+    encode = encode_csv if fmt == "csv" else encode_ndjson
+    if fmt == "csv":
+        yield encode_csv([], header=True)
+    async for rows in archived_click_batches(link_id, start_date, end_date, chunk_size):
+        yield encode(rows)
+    async with session_factory() as db:
+        async for rows in table_click_batches(db, link_id, start_date, end_date, chunk_size):
+            yield encode(rows)
@@ -0,0 +1,325 @@
+import asyncio
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+import fcntl
+import json
+import os
+import threading
+import time
+
+from sqlalchemy import insert
+
+from config.config import (
+    logger,
+    SessionLocal,
+    CLICK_QUEUE_SIZE,
+    CLICK_BATCH_SIZE,
+    CLICK_FLUSH_INTERVAL_MS,
+    CLICK_OVERFLOW_POLICY,
+    CLICK_BLOCK_TIMEOUT,
+    CLICK_SPILL_PATH,
+)
+from models.models import Click as ClickModel
+from services.ip_enrichment import ip_enrichment_worker
+from services.rollup_service import RollupService
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+SPILL_REPLAY_INTERVAL = 30
+
+
+class ClickIngestionPipeline:
+    def __init__(
+        self,
+        session_factory,
+        max_size=CLICK_QUEUE_SIZE,
+        batch_size=CLICK_BATCH_SIZE,
+        flush_interval_ms=CLICK_FLUSH_INTERVAL_MS,
+        overflow_policy=CLICK_OVERFLOW_POLICY,
+        block_timeout=CLICK_BLOCK_TIMEOUT,
+        spill_path=CLICK_SPILL_PATH,
+        on_flush=None,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown click overflow policy {overflow_policy!r}")
+        self.session_factory = session_factory
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.spill_path = spill_path
+        self.on_flush = on_flush
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        # (loop, future) of enqueue calls waiting for room under the block policy
+        self._room_waiters = []
+        self._thread = None
+        self._stopping = False
+        self._next_replay = 0
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.failed_flushes = 0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="click-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=30):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            self._wake_room_waiters()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        # Whatever is still queued (thread never started or DB unreachable)
+        # goes to the spill file so the next process replays it.
+        with self._cond:
+            remaining = list(self._queue)
+            self._queue.clear()
+        if remaining:
+            self._spill(remaining)
+
+    async def enqueue(self, link_id, ip, user_agent, timestamp=None):
+        # Called on the event loop: waiting for room and writing the spill file never block
+        # it. A full queue under the block policy is waited on with a future the flusher
+        # thread resolves, and spilled records are written on a worker thread.
+        record = {
+            "link_id": link_id,
+            "ip": ip,
+            "user_agent": user_agent,
+            "timestamp": timestamp or datetime.now(),
+        }
+        if self._offer(record):
+            return
+        if self.overflow_policy == "block":
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.block_timeout
+            while True:
+                with self._cond:
+                    if len(self._queue) < self.max_size or self._stopping:
+                        self._append(record)
+                        return
+                    waiter = loop.create_future()
+                    self._room_waiters.append((loop, waiter))
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(waiter, remaining)
+                except asyncio.TimeoutError:
+                    break
+        # spill policy, or block policy that timed out
+        await asyncio.to_thread(self._spill, [record])
+
+    def _offer(self, record):
+        # appends unless the queue is full and the policy has to wait or spill
+        with self._cond:
+            if len(self._queue) >= self.max_size:
+                if self.overflow_policy != "drop_oldest":
+                    return False
+                self._queue.popleft()
+                self.dropped += 1
+            self._append(record)
+        return True
+
+    def _append(self, record):
+        self._queue.append(record)
+        self.enqueued += 1
+        if len(self._queue) >= self.batch_size:
+            self._cond.notify_all()
+
+    def _wake_room_waiters(self):
+        waiters, self._room_waiters = self._room_waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, waiter)
+            except RuntimeError:
+                # the waiter's loop is closed
+                pass
+
+    def flush(self):
+        with self._cond:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            self._cond.notify_all()
+            if batch:
+                self._wake_room_waiters()
+        if batch:
+            self._write(batch)
+        return len(batch)
+
+    def stats(self):
+        return {
+            "queued": len(self._queue),
+            "max_size": self.max_size,
+            "overflow_policy": self.overflow_policy,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "failed_flushes": self.failed_flushes,
+        }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._stopping and len(self._queue) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                stopping = self._stopping
+            while self.flush():
+                if not stopping and len(self._queue) < self.batch_size:
+                    break
+            if stopping:
+                return
+            if not self._queue and time.monotonic() >= self._next_replay:
+                self._next_replay = time.monotonic() + SPILL_REPLAY_INTERVAL
+                try:
+                    self._replay_spill()
+                except Exception as e:
+                    # the file is left in place and retried on the next interval
+                    logger.error(f"Error replaying spilled clicks from {self.spill_path}. Error: {e}")
+
+    def _write(self, batch):
+        db = self.session_factory()
+        try:
+            # (id, ip) pairs: rows come back in any order, which lets SQLite batch the
+            # insert instead of running one statement per row to keep parameter order
+            clicks = db.execute(insert(ClickModel).returning(ClickModel.id, ClickModel.ip), batch).all()
+            RollupService(db).record_clicks(batch)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.failed_flushes += 1
+            logger.error(f"Error writing {len(batch)} clicks, spilling to {self.spill_path}. Error: {e}")
+            self._spill(batch)
+            return False
+        finally:
+            db.close()
+
+        self.written += len(batch)
+        if self.on_flush:
+            try:
+                self.on_flush([tuple(click) for click in clicks])
+            except Exception as e:
+                logger.error(f"Error in click flush callback. Error: {e}")
+        return True
+
+    def _spill(self, records):
+        # every worker shares spill_path; the lock keeps appends whole and away from a rename
+        with file_lock(self.spill_path + ".lock"):
+            with open(self.spill_path, "a") as f:
+                for record in records:
+                    f.write(json.dumps({**record, "timestamp": record["timestamp"].isoformat()}) + "\n")
+        self.spilled += len(records)
+
+    def _replay_spill(self):
+        # One worker at a time replays; the others skip until the next interval. The byte
+        # offset reached is saved after each committed batch, so a replay interrupted by a
+        # crash resumes after the last batch it wrote instead of inserting it again.
+        replay_path = self.spill_path + ".replay"
+        offset_path = replay_path + ".offset"
+        with file_lock(replay_path + ".lock", blocking=False) as owned:
+            if not owned:
+                return
+            with file_lock(self.spill_path + ".lock"):
+                if not os.path.exists(replay_path):
+                    if not os.path.exists(self.spill_path):
+                        return
+                    os.replace(self.spill_path, replay_path)
+                    remove_if_exists(offset_path)
+            offset = read_offset(offset_path)
+
+            batch = []
+            ok = True
+            with open(replay_path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    offset += len(line)
+                    record = self._parse_spilled(line)
+                    if record is not None:
+                        batch.append(record)
+                    if len(batch) >= self.batch_size:
+                        # failed batches were re-spilled by _write, so progress moves on either way
+                        ok = self._write(batch) and ok
+                        write_offset(offset_path, offset)
+                        batch = []
+            if batch:
+                ok = self._write(batch) and ok
+            os.remove(replay_path)
+            remove_if_exists(offset_path)
+        if ok:
+            logger.info(f"Replayed spilled clicks from {self.spill_path}")
+
+    def _parse_spilled(self, line):
+        # a line cut short by a crash mid-write, or otherwise unreadable, is moved aside
+        if not line.strip():
+            return None
+        try:
+            record = json.loads(line)
+            record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+            return record
+        except (ValueError, KeyError, TypeError) as e:
+            with open(self.spill_path + ".rejected", "ab") as f:
+                f.write(line if line.endswith(b"\n") else line + b"\n")
+            logger.error(f"Skipped unreadable spilled click, kept in {self.spill_path}.rejected. Error: {e}")
+            return None
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    # an flock shared by every process on the host; yields whether it was acquired
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def read_offset(path):
+    try:
+        with open(path) as f:
+            return int(f.read() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def write_offset(path, offset):
+    with open(path + ".tmp", "w") as f:
+        f.write(str(offset))
+    os.replace(path + ".tmp", path)
+
+
+def remove_if_exists(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _resolve(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def enrich_clicks(clicks):
+    ip_enrichment_worker.submit_many(clicks)
+
+
+click_pipeline = ClickIngestionPipeline(SessionLocal, on_flush=enrich_clicks)
@@ -0,0 +1,127 @@
+from datetime import datetime
+import time
+
+from sqlalchemy import column, delete, select, table as sa_table, text
+
+from config.config import (
+    logger,
+    engine,
+    CLICK_PARTITION_MONTHS_AHEAD,
+    CLICK_RETENTION_MONTHS,
+    CLICK_PARTITION_MAINTENANCE_INTERVAL,
+)
+from models.models import Click as ClickModel, IPInfo as IPInfoModel
+from models.partitions import (
+    DEFAULT_PARTITION,
+    add_months,
+    create_month_partition,
+    drop_month_partition,
+    is_partitioned,
+    list_partitions,
+    month_start,
+)
+from services.periodic import PeriodicTask
+
+
+class ClickPartitionManager:
+    # Keeps monthly partitions of clicks ready CLICK_PARTITION_MONTHS_AHEAD months in advance
+    # and drops the ones past CLICK_RETENTION_MONTHS. On a plain clicks table (SQLite)
+    # retention deletes the expired rows instead.
+    def __init__(self, engine, months_ahead=CLICK_PARTITION_MONTHS_AHEAD, retention_months=CLICK_RETENTION_MONTHS):
+        self.engine = engine
+        self.months_ahead = months_ahead
+        self.retention_months = retention_months
+        self.created = 0
+        self.dropped = 0
+        self.deleted = 0
+        self.last_duration = None
+
+    def retention_cutoff(self, now=None):
+        if not self.retention_months:
+            return None
+        return add_months(month_start(now or datetime.now()), -self.retention_months)
+
+    def maintain(self, now=None):
+        now = now or datetime.now()
+        start = time.perf_counter()
+        with self.engine.connect() as connection:
+            partitioned = is_partitioned(connection)
+        if partitioned:
+            self.create_partitions(now)
+            self.drop_expired_partitions(now)
+        else:
+            self.delete_expired_clicks(now)
+        self.last_duration = time.perf_counter() - start
+
+    def create_partitions(self, now):
+        first = month_start(now)
+        with self.engine.connect() as connection:
+            existing = list_partitions(connection)
+        for offset in range(self.months_ahead + 1):
+            month = add_months(first, offset)
+            if month in existing:
+                continue
+            # one transaction per partition; ATTACH takes a short lock on clicks
+            with self.engine.begin() as connection:
+                name = create_month_partition(connection, month)
+            self.created += 1
+            logger.info(f"Created click partition {name}")
+
+    def drop_expired_partitions(self, now):
+        cutoff = self.retention_cutoff(now)
+        if cutoff is None:
+            return
+        with self.engine.connect() as connection:
+            expired = [name for month, name in list_partitions(connection).items() if add_months(month, 1) <= cutoff]
+        for name in expired:
+            with self.engine.begin() as connection:
+                drop_month_partition(connection, name)
+            self.dropped += 1
+            logger.info(f"Dropped click partition {name} older than {cutoff:%Y-%m}")
+        # rows routed to the default partition expire too
+        with self.engine.begin() as connection:
+            self.delete_expired_rows(connection, DEFAULT_PARTITION, cutoff)
+
+    def delete_expired_clicks(self, now):
+        cutoff = self.retention_cutoff(now)
+        if cutoff is None:
+            return
+        with self.engine.begin() as connection:
+            self.delete_expired_rows(connection, ClickModel.__tablename__, cutoff)
+
+    def delete_expired_rows(self, connection, table, cutoff):
+        clicks = sa_table(table, column("id"), column("timestamp"))
+        expired = clicks.c.timestamp < cutoff
+        connection.execute(delete(IPInfoModel).where(IPInfoModel.click_id.in_(select(clicks.c.id).where(expired))))
+        deleted = connection.execute(delete(clicks).where(expired)).rowcount
+        self.deleted += deleted
+        if deleted:
+            logger.info(f"Deleted {deleted} clicks from {table} older than {cutoff:%Y-%m}")
+
+    def stats(self):
+        with self.engine.connect() as connection:
+            partitioned = is_partitioned(connection)
+            partitions = list_partitions(connection) if partitioned else {}
+            # planner estimates, so this stays cheap on large partitions
+            rows = dict(connection.execute(text(
+                "SELECT relname, reltuples::bigint FROM pg_class WHERE relname = ANY(:names)"
+            ), {"names": list(partitions.values())}).all()) if partitions else {}
+        return {
+            "partitioned": partitioned,
+            "partitions": [
+                {"name": name, "month": f"{month:%Y-%m}", "estimated_rows": max(rows.get(name, 0), 0)}
+                for month, name in partitions.items()
+            ],
+            "months_ahead": self.months_ahead,
+            "retention_months": self.retention_months,
+            "created": self.created,
+            "dropped": self.dropped,
+            "deleted": self.deleted,
+            "last_duration": self.last_duration,
+        }
+
+
+click_partition_manager = ClickPartitionManager(engine)
+click_partition_maintainer = PeriodicTask(
+    "click-partition-maintainer", CLICK_PARTITION_MAINTENANCE_INTERVAL, click_partition_manager.maintain, run_immediately=True
+)
@@ -0,0 +1,215 @@
+from bisect import bisect_right
+import heapq
+from array import array
+from collections import namedtuple
+import csv
+import ipaddress
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+from config.config import logger, GEOIP_DATABASE_PATH, GEOIP_RELOAD_INTERVAL, GEOIP_CACHE_PATH
+
+MAGIC = b"GEOIPDB1"
+# magic, ipv4 range count, ipv6 range count, locations offset, locations length
+HEADER = struct.Struct("<8sIIQQ")
+LOCATION_FIELDS = ("country", "region", "city", "loc", "org", "postal", "timezone")
+
+_State = namedtuple("_State", ["mtime", "v4_starts", "v4_ends", "v4_locs", "v6_starts", "v6_ends", "v6_locs", "locations"])
+
+
+# Sequence view over fixed-width big-endian keys, so bisect can search IPv6 ranges in place
+class _PackedKeys:
+    def __init__(self, buf, offset, width, count):
+        self.buf = buf
+        self.offset = offset
+        self.width = width
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        start = self.offset + i * self.width
+        return self.buf[start:start + self.width]
+
+
+def _u32_array(buf, offset, count):
+    view = memoryview(buf)[offset:offset + 4 * count]
+    if sys.byteorder == "little":
+        return view.cast("I")
+    values = array("I", view)
+    values.byteswap()
+    return values
+
+
+def _read_ranges(csv_path):
+    v4, v6 = [], []
+    with open(csv_path, newline="") as f:
+        for row in csv.DictReader(f):
+            if row.get("network"):
+                network = ipaddress.ip_network(row["network"], strict=False)
+                start, end = network[0], network[-1]
+            else:
+                start, end = ipaddress.ip_address(row["start_ip"]), ipaddress.ip_address(row["end_ip"])
+            location = tuple(row.get(field) or None for field in LOCATION_FIELDS)
+            (v4 if start.version == 4 else v6).append((int(start), int(end), location))
+    return v4, v6
+
+
+def flatten_ranges(ranges):
+    # Lookups bisect on range starts, so ranges must not overlap. Nested networks (a /24
+    # inside its /16) are split into disjoint pieces, each address keeping the location of
+    # the narrowest range that covers it; between equal ranges the later row wins.
+    ranges = sorted(ranges, key=lambda r: r[0])
+    points = sorted({start for start, _, _ in ranges} | {end + 1 for _, end, _ in ranges})
+    active, flat, i = [], [], 0
+    for left, right in zip(points, points[1:]):
+        while i < len(ranges) and ranges[i][0] <= left:
+            start, end, location = ranges[i]
+            heapq.heappush(active, (end - start, -i, end, location))
+            i += 1
+        while active and active[0][2] < left:
+            heapq.heappop(active)
+        if not active:
+            continue
+        location = active[0][3]
+        if flat and flat[-1][1] == left - 1 and flat[-1][2] == location:
+            flat[-1] = (flat[-1][0], right - 1, location)
+        else:
+            flat.append((left, right - 1, location))
+    return flat
+
+
+def build_database(csv_path, output_path):
+    v4, v6 = (flatten_ranges(ranges) for ranges in _read_ranges(csv_path))
+    locations, location_index = [], {}
+    for _, _, location in v4 + v6:
+        if location not in location_index:
+            location_index[location] = len(locations)
+            locations.append(location)
+
+    v4_starts = array("I", (start for start, _, _ in v4))
+    v4_ends = array("I", (end for _, end, _ in v4))
+    v4_locs = array("I", (location_index[location] for _, _, location in v4))
+    v6_locs = array("I", (location_index[location] for _, _, location in v6))
+    if sys.byteorder != "little":
+        for values in (v4_starts, v4_ends, v4_locs, v6_locs):
+            values.byteswap()
+    body = b"".join([
+        v4_starts.tobytes(),
+        v4_ends.tobytes(),
+        v4_locs.tobytes(),
+        b"".join(start.to_bytes(16, "big") for start, _, _ in v6),
+        b"".join(end.to_bytes(16, "big") for _, end, _ in v6),
+        v6_locs.tobytes(),
+    ])
+    location_blob = json.dumps(locations).encode()
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(v4), len(v6), HEADER.size + len(body), len(location_blob)))
+        f.write(body)
+        f.write(location_blob)
+    os.replace(tmp_path, output_path)
+    return len(v4), len(v6)
+
+
+class GeoIPDatabase:
+    def __init__(self, path=GEOIP_DATABASE_PATH, reload_interval=GEOIP_RELOAD_INTERVAL, cache_path=GEOIP_CACHE_PATH):
+        self.path = path
+        self.cache_path = cache_path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._next_check = time.monotonic() + reload_interval
+        self._state = self._load()
+
+    def lookup(self, ip):
+        self._maybe_reload()
+        state = self._state
+        address = ipaddress.ip_address(ip)
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if address.version == 4:
+            value = int(address)
+            i = bisect_right(state.v4_starts, value) - 1
+            if i < 0 or value > state.v4_ends[i]:
+                return None
+            location = state.locations[state.v4_locs[i]]
+        else:
+            key = address.packed
+            i = bisect_right(state.v6_starts, key) - 1
+            if i < 0 or key > state.v6_ends[i]:
+                return None
+            location = state.locations[state.v6_locs[i]]
+        return dict(zip(LOCATION_FIELDS, location))
+
+    def reload(self):
+        with self._lock:
+            self._state = self._load()
+            logger.info(f"Loaded geo-IP database {self.path}")
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.reload_interval
+        try:
+            if os.stat(self.path).st_mtime != self._state.mtime:
+                self.reload()
+        except Exception as e:
+            logger.error(f"Error reloading geo-IP database {self.path}. Error: {e}")
+
+    def _load(self):
+        mtime = os.stat(self.path).st_mtime
+        binary_path = self.path
+        if self.path.endswith(".csv"):
+            binary_path = self.cache_path or self.path + ".bin"
+            if not os.path.exists(binary_path) or os.stat(binary_path).st_mtime < mtime:
+                build_database(self.path, binary_path)
+
+        with open(binary_path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, v4_count, v6_count, locations_offset, locations_length = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{binary_path} is not a geo-IP database")
+
+        offset = HEADER.size
+        v4_starts = _u32_array(buf, offset, v4_count)
+        v4_ends = _u32_array(buf, offset + 4 * v4_count, v4_count)
+        v4_locs = _u32_array(buf, offset + 8 * v4_count, v4_count)
+        offset += 12 * v4_count
+        v6_starts = _PackedKeys(buf, offset, 16, v6_count)
+        v6_ends = _PackedKeys(buf, offset + 16 * v6_count, 16, v6_count)
+        v6_locs = _u32_array(buf, offset + 32 * v6_count, v6_count)
+        locations = [tuple(location) for location in json.loads(buf[locations_offset:locations_offset + locations_length])]
+        return _State(mtime, v4_starts, v4_ends, v4_locs, v6_starts, v6_ends, v6_locs, locations)
+
+
+class OfflineGeoIPBackend:
+    rate_limited = False
+
+    def __init__(self, database=None):
+        self.database = database or get_geoip_database()
+
+    async def lookup(self, ip):
+        location = self.database.lookup(ip) or {}
+        return {"ip": ip, **{field: location.get(field) for field in LOCATION_FIELDS}}
+
+
+_database = None
+_database_lock = threading.Lock()
+
+
+def get_geoip_database():
+    global _database
+    if _database is None:
+        with _database_lock:
+            if _database is None:
+                _database = GeoIPDatabase()
+    return _database
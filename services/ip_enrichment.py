@@ -0,0 +1,306 @@
+import asyncio
+import threading
+import time
+
+import httpx
+from sqlalchemy import insert, select
+
+from config.config import (
+    logger,
+    SessionLocal,
+    IPINFO_URL,
+    IPINFO_TOKEN,
+    IPINFO_TIMEOUT,
+    IPINFO_WORKERS,
+    IPINFO_RATE_LIMIT,
+    IPINFO_CACHE_SIZE,
+    IPINFO_CACHE_TTL,
+    IPINFO_QUEUE_SIZE,
+    IPINFO_BATCH_SIZE,
+    IPINFO_FLUSH_INTERVAL_MS,
+    GEOIP_BACKEND,
+)
+from models.models import Click as ClickModel, IPInfo as IPInfoModel
+from services.cache import TTLCache
+from services.geoip_database import OfflineGeoIPBackend
+
+IP_INFO_FIELDS = ("ip", "city", "region", "country", "loc", "org", "postal", "timezone")
+
+
+def parse_ip_info(data):
+    return {field: data.get(field) for field in IP_INFO_FIELDS}
+
+
+class AsyncRateLimiter:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + 1 / self.rate
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class HTTPGeoIPBackend:
+    def __init__(self, url=IPINFO_URL, token=IPINFO_TOKEN, timeout=IPINFO_TIMEOUT, max_connections=IPINFO_WORKERS):
+        self.url = url
+        self.params = {"token": token} if token else None
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._client = None
+
+    async def open(self):
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+        )
+
+    async def close(self):
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    async def lookup(self, ip):
+        response = await self._client.get(self.url.format(ip=ip), params=self.params)
+        if response.status_code != 200:
+            raise ValueError(f"ip info provider returned {response.status_code}")
+        return parse_ip_info(response.json())
+
+
+def create_geoip_backend(name=GEOIP_BACKEND):
+    if name == "offline":
+        return OfflineGeoIPBackend()
+    if name == "http":
+        return HTTPGeoIPBackend()
+    raise ValueError(f"Unknown geo-IP backend {name!r}")
+
+
+class IPEnrichmentWorker:
+    def __init__(
+        self,
+        session_factory,
+        backend=None,
+        workers=IPINFO_WORKERS,
+        rate_limit=IPINFO_RATE_LIMIT,
+        cache_size=IPINFO_CACHE_SIZE,
+        cache_ttl=IPINFO_CACHE_TTL,
+        queue_size=IPINFO_QUEUE_SIZE,
+        batch_size=IPINFO_BATCH_SIZE,
+        flush_interval_ms=IPINFO_FLUSH_INTERVAL_MS,
+    ):
+        self.session_factory = session_factory
+        self.backend = backend or create_geoip_backend()
+        self.workers = workers
+        self.rate_limit = rate_limit
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._queue = None
+        self._inflight = {}
+        self._pending = []
+        self._pending_full = None
+        self._stopping = None
+
+        self.submitted = 0
+        self.dropped = 0
+        self.lookups = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.written = 0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._run, name="ip-enrichment", daemon=True)
+        self._thread.start()
+        self._ready.wait(10)
+
+    def stop(self, timeout=30):
+        if not self._thread:
+            return
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, click_id, ip):
+        if not self._loop:
+            self.dropped += 1
+            return
+        self._loop.call_soon_threadsafe(self._put, click_id, ip)
+
+    def submit_many(self, clicks):
+        if not self._loop:
+            self.dropped += len(clicks)
+            return
+        self._loop.call_soon_threadsafe(self._put_many, clicks)
+
+    def backfill(self, batch_size=1000):
+        # Enriches clicks that never got an ip_info row through the same cache, coalescing,
+        # rate limit and batched writes as new clicks. Runs in the caller's thread, batch by
+        # batch, against a started worker; failed lookups are skipped, not retried.
+        total = 0
+        last_id = 0
+        while True:
+            with self.session_factory() as db:
+                clicks = db.execute(
+                    select(ClickModel.id, ClickModel.ip).outerjoin(
+                        IPInfoModel, IPInfoModel.click_id == ClickModel.id
+                    ).filter(IPInfoModel.id == None, ClickModel.id > last_id).order_by(ClickModel.id).limit(batch_size)
+                ).all()
+            if not clicks:
+                return total
+            last_id = clicks[-1].id
+            asyncio.run_coroutine_threadsafe(self._enrich_all(clicks), self._loop).result()
+            total += len(clicks)
+            logger.info(f"Backfilled IPInfo for {total} clicks")
+
+    async def _enrich_all(self, clicks):
+        # waits for room in the queue instead of dropping, then for every lookup and write
+        for click_id, ip in clicks:
+            await self._queue.put((click_id, ip))
+            self.submitted += 1
+        await self._queue.join()
+        await self._flush()
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "inflight": len(self._inflight),
+            "pending_writes": len(self._pending),
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "lookups": self.lookups,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "written": self.written,
+            "cache": self.cache.stats(),
+        }
+
+    async def lookup(self, ip):
+        info = self.cache.get(ip)
+        if info is not None:
+            return info
+        future = self._inflight.get(ip)
+        if future is not None:
+            self.coalesced += 1
+            return await future
+
+        future = self._loop.create_future()
+        self._inflight[ip] = future
+        try:
+            await self._rate_limiter.acquire()
+            self.lookups += 1
+            info = await self.backend.lookup(ip)
+            self.cache.set(ip, info)
+            future.set_result(info)
+            return info
+        except Exception as e:
+            future.set_exception(e)
+            # retrieved here so waiters-less failures don't warn about never-retrieved exceptions
+            future.exception()
+            raise
+        finally:
+            del self._inflight[ip]
+
+    def _put(self, click_id, ip):
+        try:
+            self._queue.put_nowait((click_id, ip))
+            self.submitted += 1
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def _put_many(self, clicks):
+        for click_id, ip in clicks:
+            self._put(click_id, ip)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._main())
+        finally:
+            self._loop.close()
+            self._loop = None
+
+    async def _main(self):
+        self._queue = asyncio.Queue(self.queue_size)
+        self._pending_full = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._rate_limiter = AsyncRateLimiter(self.rate_limit if getattr(self.backend, "rate_limited", True) else 0)
+        if hasattr(self.backend, "open"):
+            await self.backend.open()
+        workers = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        writer = asyncio.create_task(self._write_loop())
+        self._ready.set()
+
+        await self._stopping.wait()
+        await self._queue.join()
+        for task in workers + [writer]:
+            task.cancel()
+        await asyncio.gather(*workers, writer, return_exceptions=True)
+        await self._flush()
+        await self._loop.shutdown_default_executor()
+        if hasattr(self.backend, "close"):
+            await self.backend.close()
+
+    async def _work(self):
+        while True:
+            click_id, ip = await self._queue.get()
+            try:
+                info = await self.lookup(ip)
+                self._pending.append({**info, "ip": ip, "click_id": click_id})
+                if len(self._pending) >= self.batch_size:
+                    self._pending_full.set()
+            except Exception as e:
+                self.failures += 1
+                logger.info(
+                    f"Error creating IPInfo for click_id {click_id} with ip {ip}. Error: {e}",
+                    extra={"event": "ip_info.failed", "click_id": click_id, "ip": ip},
+                )
+            finally:
+                self._queue.task_done()
+
+    async def _write_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._pending_full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._pending_full.clear()
+            await self._flush()
+
+    async def _flush(self):
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        await self._loop.run_in_executor(None, self._write_rows, rows)
+
+    def _write_rows(self, rows):
+        db = self.session_factory()
+        try:
+            db.execute(insert(IPInfoModel), rows)
+            db.commit()
+            self.written += len(rows)
+            logger.info(f"IPInfo created successfully for {len(rows)} clicks", extra={"event": "ip_info.created", "clicks": len(rows)})
+        except Exception as e:
+            db.rollback()
+            self.failures += len(rows)
+            logger.error(f"Error writing IPInfo for {len(rows)} clicks. Error: {e}")
+        finally:
+            db.close()
+
+
+ip_enrichment_worker = IPEnrichmentWorker(SessionLocal)
@@ -0,0 +1,291 @@
+from array import array
+from collections import deque
+import random
+import threading
+import time
+
+from sqlalchemy import func, select
+
+from config.config import (
+    logger,
+    SessionLocal,
+    LINK_FILTER_ENABLED,
+    LINK_FILTER_CAPACITY,
+    LINK_FILTER_REFRESH_INTERVAL,
+    LINK_FILTER_REBUILD_INTERVAL,
+    LINK_FILTER_REFRESH_OVERLAP,
+)
+from models.models import Link as LinkModel
+from services.periodic import PeriodicTask
+
+BUCKET_SIZE = 4
+FINGERPRINT_BITS = 16
+MAX_KICKS = 500
+# rebuild larger before inserts start failing; cuckoo filters with 4-slot buckets fill to ~95%
+MAX_LOAD_FACTOR = 0.9
+
+_MASK64 = (1 << 64) - 1
+
+
+class CuckooFilter:
+    # 16-bit fingerprints in buckets of 4 slots, each key having two candidate buckets.
+    # Keys use the process-local str hash, so a filter is never shared between processes.
+    def __init__(self, capacity):
+        buckets = 1
+        while buckets * BUCKET_SIZE * MAX_LOAD_FACTOR < capacity:
+            buckets *= 2
+        self.buckets = buckets
+        self._index_mask = buckets - 1
+        # fingerprint 0 marks an empty slot
+        self._slots = array("H", bytes(2 * buckets * BUCKET_SIZE))
+        # a fingerprint left homeless by the last failed insert; once set the filter is full
+        self._victim = None
+        self.count = 0
+        self.full = False
+
+    def _locate(self, key):
+        h = hash(key) & _MASK64
+        fingerprint = (h >> (64 - FINGERPRINT_BITS)) or 1
+        index = h & self._index_mask
+        return fingerprint, index, self._alt_index(index, fingerprint)
+
+    def _alt_index(self, index, fingerprint):
+        # XOR with a function of the fingerprint alone, so applying it twice returns the first bucket
+        return (index ^ ((fingerprint * 0x5BD1E995) >> 7)) & self._index_mask
+
+    def _put(self, index, fingerprint):
+        start = index * BUCKET_SIZE
+        for slot in range(start, start + BUCKET_SIZE):
+            if not self._slots[slot]:
+                self._slots[slot] = fingerprint
+                return True
+        return False
+
+    def _has(self, index, fingerprint):
+        start = index * BUCKET_SIZE
+        return fingerprint in self._slots[start:start + BUCKET_SIZE]
+
+    def add(self, key):
+        if self._victim is not None:
+            self.full = True
+            return False
+        fingerprint, i1, i2 = self._locate(key)
+        self.count += 1
+        if self._put(i1, fingerprint) or self._put(i2, fingerprint):
+            return True
+        index = random.choice((i1, i2))
+        for _ in range(MAX_KICKS):
+            slot = index * BUCKET_SIZE + random.randrange(BUCKET_SIZE)
+            fingerprint, self._slots[slot] = self._slots[slot], fingerprint
+            index = self._alt_index(index, fingerprint)
+            if self._put(index, fingerprint):
+                return True
+        self._victim = (index, fingerprint)
+        return True
+
+    def __contains__(self, key):
+        if self.full:
+            # keys were dropped, so a miss is no longer definite
+            return True
+        fingerprint, i1, i2 = self._locate(key)
+        if self._has(i1, fingerprint) or self._has(i2, fingerprint):
+            return True
+        return self._victim is not None and self._victim[1] == fingerprint and self._victim[0] in (i1, i2)
+
+    def discard(self, key):
+        # only safe for keys that were added: removing a fingerprint another key shares
+        # would turn that key into a false negative
+        fingerprint, i1, i2 = self._locate(key)
+        if self._victim is not None and self._victim[1] == fingerprint and self._victim[0] in (i1, i2):
+            self._victim = None
+            self.count -= 1
+            return True
+        for index in (i1, i2):
+            start = index * BUCKET_SIZE
+            for slot in range(start, start + BUCKET_SIZE):
+                if self._slots[slot] == fingerprint:
+                    self._slots[slot] = 0
+                    self.count -= 1
+                    if self._victim is not None:
+                        index, fingerprint = self._victim
+                        self._victim = None
+                        self._put(index, fingerprint) or self._put(self._alt_index(index, fingerprint), fingerprint)
+                    return True
+        return False
+
+    @property
+    def load_factor(self):
+        return self.count / (self.buckets * BUCKET_SIZE)
+
+    def false_positive_rate(self):
+        # a lookup compares against up to 2 * BUCKET_SIZE occupied slots
+        return 1 - (1 - 2 ** -FINGERPRINT_BITS) ** (2 * BUCKET_SIZE * self.load_factor)
+
+    def stats(self):
+        return {
+            "count": self.count,
+            "buckets": self.buckets,
+            "slots": self.buckets * BUCKET_SIZE,
+            "fingerprint_bits": FINGERPRINT_BITS,
+            "load_factor": round(self.load_factor, 4),
+            "memory_bytes": self._slots.itemsize * len(self._slots),
+            "estimated_false_positive_rate": self.false_positive_rate(),
+            "full": self.full,
+        }
+
+
+class LinkFilter:
+    # Membership filter over the short_url of every active link, so GET /{short_url} can
+    # answer 404 for unknown codes without a query. A full rebuild from the database runs
+    # at startup and every rebuild_interval; in between, links created by other workers are
+    # picked up by id every refresh_interval, and this process's own shorten and delete
+    # calls update it directly, so another worker's new link can be rejected here for at
+    # most refresh_interval. Misses never query the database. Errors only ever go towards
+    # "maybe present": until the first build finishes, or if the filter fills up, every
+    # lookup falls through to the DB.
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        enabled=LINK_FILTER_ENABLED,
+        capacity=LINK_FILTER_CAPACITY,
+        refresh_interval=LINK_FILTER_REFRESH_INTERVAL,
+        rebuild_interval=LINK_FILTER_REBUILD_INTERVAL,
+        refresh_overlap=LINK_FILTER_REFRESH_OVERLAP,
+    ):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.capacity = capacity
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.refresh_overlap = refresh_overlap
+        self._filter = None
+        self._lock = threading.Lock()
+        # short codes added while a rebuild is reading the table
+        self._replay = None
+        # ids at or above high_water - refresh_overlap already in the filter. Ids can
+        # commit out of order, so each refresh rescans that window and skips these.
+        self._recent = set()
+        self.high_water = 0
+        self._rebuilt_at = 0.0
+        self.rebuilds = 0
+        self.refreshes = 0
+        self.lookups = 0
+        self.rejected = 0
+        self.false_positives = 0
+        self._task = PeriodicTask("link-filter", refresh_interval, self.refresh, run_immediately=True)
+
+    def start(self):
+        if self.enabled:
+            self._task.start()
+
+    def stop(self):
+        self._task.stop()
+
+    def might_contain(self, short_url):
+        # answered from memory alone; the database is only read by the periodic refresh
+        if self._filter is None:
+            return True
+        with self._lock:
+            self.lookups += 1
+            if short_url in self._filter:
+                return True
+            self.rejected += 1
+            return False
+
+    def record_false_positive(self):
+        if self._filter is not None:
+            self.false_positives += 1
+
+    def add(self, short_url, link_id=None):
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append(short_url)
+            if self._filter is not None:
+                self._filter.add(short_url)
+                if link_id is not None:
+                    self._recent.add(link_id)
+                    self.high_water = max(self.high_water, link_id)
+
+    def discard(self, short_url):
+        # a rebuild in progress may already have read the link, so it stays a false positive
+        # in the new filter until the next rebuild
+        with self._lock:
+            if self._filter is not None:
+                self._filter.discard(short_url)
+
+    def refresh(self):
+        due = time.monotonic() - self._rebuilt_at >= self.rebuild_interval
+        current = self._filter
+        if current is None or due or current.full or current.load_factor > MAX_LOAD_FACTOR:
+            self.rebuild()
+        else:
+            self._refresh_new_links()
+
+    def rebuild(self):
+        start = time.perf_counter()
+        with self._lock:
+            self._replay = []
+        try:
+            with self.session_factory() as db:
+                count = db.scalar(select(func.count()).select_from(LinkModel).filter(LinkModel.expired == False))
+                new_filter = CuckooFilter(max(self.capacity, 2 * count))
+                recent = deque(maxlen=self.refresh_overlap)
+                rows = db.execute(
+                    select(LinkModel.id, LinkModel.short_url)
+                    .filter(LinkModel.expired == False)
+                    .order_by(LinkModel.id)
+                    .execution_options(yield_per=10000)
+                )
+                for link_id, short_url in rows:
+                    new_filter.add(short_url)
+                    recent.append(link_id)
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+        with self._lock:
+            for short_url in self._replay:
+                new_filter.add(short_url)
+            self._replay = None
+            self._filter = new_filter
+            self.high_water = max(self.high_water, recent[-1] if recent else 0)
+            self._recent = {link_id for link_id in recent if link_id > self.high_water - self.refresh_overlap}
+            self._rebuilt_at = time.monotonic()
+            self.rebuilds += 1
+        logger.info(f"Link filter rebuilt with {new_filter.count} links in {time.perf_counter() - start:.2f}s")
+
+    def _refresh_new_links(self):
+        with self.session_factory() as db:
+            rows = db.execute(
+                select(LinkModel.id, LinkModel.short_url)
+                .filter(LinkModel.id > self.high_water - self.refresh_overlap, LinkModel.expired == False)
+            ).all()
+        with self._lock:
+            for link_id, short_url in rows:
+                if link_id not in self._recent:
+                    self._filter.add(short_url)
+                    self._recent.add(link_id)
+                    self.high_water = max(self.high_water, link_id)
+            self._recent = {link_id for link_id in self._recent if link_id > self.high_water - self.refresh_overlap}
+            self.refreshes += 1
+
+    def stats(self):
+        negatives = self.rejected + self.false_positives
+        stats = {
+            "enabled": self.enabled,
+            "ready": self._filter is not None,
+            "lookups": self.lookups,
+            "rejected": self.rejected,
+            "false_positives": self.false_positives,
+            # share of unknown codes that still reached the database
+            "observed_false_positive_rate": self.false_positives / negatives if negatives else 0.0,
+            "rebuilds": self.rebuilds,
+            "refreshes": self.refreshes,
+            "high_water": self.high_water,
+        }
+        if self._filter is not None:
+            stats.update(self._filter.stats())
+        return stats
+
+
+link_filter = LinkFilter()
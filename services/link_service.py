@@ -1,3 +1,4 @@
+import asyncio
 from requests import Session
 import requests
 from fastapi import HTTPException, Depends, status
@@ -5,97 +6,247 @@ from jose import JWTError, jwt
 import string
 import random
 from models.models import Link, User, IPInfo as IPInfoModel, Link as LinkModel, Click as ClickModel
-from sqlalchemy.orm import Session
-from config.config import logger ,get_db, REDIRECT_URL
+from sqlalchemy.ext.asyncio import AsyncSession
+from config.config import logger ,get_db, REDIRECT_URL, UNIQUE_CLICKS_CHUNK_SIZE, SHORT_CODE_MAX_ATTEMPTS, BULK_SHORTEN_CHUNK_SIZE, BULK_SHORTEN_MAX_ITEMS
 from datetime import timedelta ,datetime
-from sqlalchemy import  func
-from services.ip_info_service import IPInfoService
+from itertools import islice
+from sqlalchemy import  func, insert, select
+from sqlalchemy.exc import IntegrityError
+from pydantic import ValidationError
+from schemas.Schemas import ShortenLinkRequest
+from services.cache import link_cache
+from services.click_archive import click_archive, IP_INFO_FIELDS
+from services.link_filter import link_filter
+from services.click_ingestion import click_pipeline
+from services.short_code_allocator import short_code_allocator
+
+def redirect_target(long_url):
+    if not long_url.startswith(("http://", "https://")):
+        long_url = "http://" + long_url
+    return long_url
+
+
+def click_info(click):
+    # archived clicks and table rows carry the same keys: ip, user_agent, timestamp,
+    # enriched and the IP info fields
+    info = {"ip": click["ip"], "user_agent": click["user_agent"], "timestamp": click["timestamp"]}
+    if not click["enriched"]:
+        return {**info, "error": "No IP info found"}
+    return {**info, **{field: click[field] for field in IP_INFO_FIELDS}}
+
 
 class LinkService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
-        self.ip_info_service = IPInfoService(db)
         
-    def get_unique_clicks(self, link_id: int):
-        clicks = self.db.query(ClickModel).filter(ClickModel.link_id == link_id).all()
-        unique_combinations = {}
-        unique_clicks_info = []
-        
-        for click in clicks:
-            combination = (click.ip, click.user_agent)
-            ip_info = self.ip_info_service.get_click_ip_info(click.id)
-            if combination not in unique_combinations:
-                unique_combinations[combination] = click.timestamp
-                    
-                unique_clicks_info.append({
-                    "ip": click.ip,
-                    "user_agent": click.user_agent,
-                    "timestamp": click.timestamp,
-                    **ip_info
-                })
-            else:
-                if click.timestamp > unique_combinations[combination] + timedelta(hours=12):
-                    unique_combinations[combination] = click.timestamp
-                    
-                    unique_clicks_info.append({
-                        "ip": click.ip,
-                        "user_agent": click.user_agent,
-                        "timestamp": click.timestamp,
-                        **ip_info
-                    })
-        return unique_clicks_info
+    async def get_unique_clicks(self, link_id: int, offset: int = 0, limit: int = None, count_only: bool = False):
+        # One pass over clicks in timestamp order: a (ip, user_agent) pair counts again
+        # once 12 hours have passed since the last time it was counted. Archived clicks
+        # come first, then the clicks still in the table; both are streamed in chunks and
+        # only the requested page is kept.
+        window = timedelta(hours=12)
+        last_counted = {}
+        total = 0
+        page = []
+
+        def visit(ip, user_agent, timestamp, click):
+            nonlocal total
+            combination = (ip, user_agent)
+            counted_at = last_counted.get(combination)
+            if counted_at is not None and timestamp <= counted_at + window:
+                return
+            last_counted[combination] = timestamp
+            if not count_only and total >= offset and (limit is None or len(page) < limit):
+                page.append(click)
+            total += 1
+
+        # the archive is read on a worker thread, a chunk at a time
+        archived = click_archive.link_clicks(link_id, batch_size=UNIQUE_CLICKS_CHUNK_SIZE)
+        while chunk := await asyncio.to_thread(lambda: list(islice(archived, UNIQUE_CLICKS_CHUNK_SIZE))):
+            for click in chunk:
+                visit(click["ip"], click["user_agent"], click["timestamp"], click)
+
+        clicks = await self.db.stream(
+            select(
+                ClickModel.id, ClickModel.ip, ClickModel.user_agent, ClickModel.timestamp,
+                (IPInfoModel.id != None).label("enriched"),
+                *(getattr(IPInfoModel, field) for field in IP_INFO_FIELDS),
+            ).outerjoin(
+                IPInfoModel, IPInfoModel.click_id == ClickModel.id
+            ).filter(
+                ClickModel.link_id == link_id
+            ).order_by(
+                ClickModel.timestamp, ClickModel.id
+            ).execution_options(yield_per=UNIQUE_CLICKS_CHUNK_SIZE)
+        )
+        async for click in clicks:
+            visit(click.ip, click.user_agent, click.timestamp, click._mapping)
+
+        if count_only:
+            return total, []
+        return total, [click_info(click) for click in page]
         
   
-    def is_link_exist(self, short_url):
-        return self.db.query(Link).filter(Link.short_url == short_url).first()
-    
-    def generate_short_url(self,length=7):
-        characters = string.ascii_letters + string.digits
-        return ''.join(random.choice(characters) for i in range(length))
-
-    def create_unique_short_url(self):
-        tries = 0
-        max_tries = 2
-        url_length = 7
-
-        while tries < max_tries:
-            short_url = self.generate_short_url(url_length)
-            existing_link = self.is_link_exist(short_url)
-
-            if not existing_link:
-                return short_url
-            tries += 1
-            
-        return self.generate_short_url(url_length + 1)
+    async def is_link_exist(self, short_url):
+        return (await self.db.scalars(select(Link).filter(Link.short_url == short_url).limit(1))).first()
     
-    def get_user_active_links(self, user):
-        query = self.db.query(LinkModel).filter(LinkModel.owner == user, LinkModel.expired == False)    
-        return query.all()
+    async def get_user_active_links(self, user):
+        query = select(LinkModel).filter(LinkModel.user_id == user.id, LinkModel.expired == False)    
+        return (await self.db.scalars(query)).all()
 
-    def redirect_to_url(self,link, request, background_tasks):
+    async def redirect_to_url(self,link, request):
         long_url = link.long_url
         user_agent = request.headers.get("user-agent", "unknown")
         ip_address = request.headers.get("CF-Connecting-IP", None)
         if not ip_address:
             ip_address = request.client.host
-        click = ClickModel(link_id=link.id, user_agent=user_agent, ip=ip_address)
-        self.db.add(click)
-        self.db.commit()
-        background_tasks.add_task(self.ip_info_service.write_ip_info, click.id, ip_address)
-        
-        if not long_url.startswith(("http://", "https://")):
-            long_url = "http://" + long_url
+        # written in batches by the flusher thread, which also triggers IP enrichment
+        await click_pipeline.enqueue(link.id, ip_address, user_agent)
+
+        return redirect_target(long_url)
    
-    def delete_link(self, link):
+    async def delete_link(self, link):
         link.expired = True
-        self.db.commit()
+        await self.db.commit()
+        link_cache.invalidate(link.short_url)
+        link_filter.discard(link.short_url)
     
-    def shorten_url(self, body, user):
+    async def shorten_urls(self, items, user, chunk_size=BULK_SHORTEN_CHUNK_SIZE, max_items=BULK_SHORTEN_MAX_ITEMS):
+        # items is an async iterable of raw request dicts, consumed chunk by chunk so a
+        # streamed body is never held in memory at once. Returns one result per item, in order.
+        results = []
+        chunk = []
+        truncated = False
+        async for item in items:
+            if len(results) + len(chunk) >= max_items:
+                truncated = True
+                break
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                results.extend(await self._shorten_chunk(chunk, user, len(results)))
+                chunk = []
+        if chunk:
+            results.extend(await self._shorten_chunk(chunk, user, len(results)))
+        return results, truncated
+
+    async def _shorten_chunk(self, items, user, offset):
+        results = [None] * len(items)
+        bodies = {}
+        for i, item in enumerate(items):
+            try:
+                bodies[i] = ShortenLinkRequest.model_validate(item)
+            except ValidationError as e:
+                error = "; ".join(f"{'.'.join(map(str, err['loc'])) or 'item'}: {err['msg']}" for err in e.errors())
+                results[i] = {"index": offset + i, "status": "invalid", "error": error}
+
+        # one IN query for links this user already shortened, one for taken custom back halves
+        existing = {}
+        long_urls = {body.long_url for body in bodies.values()}
+        if long_urls:
+            for link in await self.db.scalars(
+                select(LinkModel).filter(LinkModel.user_id == user.id, LinkModel.long_url.in_(long_urls))
+            ):
+                existing.setdefault(link.long_url, link)
+        customs = {body.custom_back_half for body in bodies.values() if body.custom_back_half and body.long_url not in existing}
+        taken = set(await self.db.scalars(select(LinkModel.short_url).filter(LinkModel.short_url.in_(customs)))) if customs else set()
+
+        # long_url -> indices of the items asking for it; the first one creates the link
+        pending = {}
+        for i, body in bodies.items():
+            if body.long_url in existing:
+                results[i] = self._bulk_result(offset + i, "existing", existing[body.long_url])
+            elif body.long_url in pending:
+                pending[body.long_url].append(i)
+            elif body.custom_back_half and body.custom_back_half in taken:
+                results[i] = {"index": offset + i, "status": "conflict", "error": "Custom short URL already exists"}
+            else:
+                if body.custom_back_half:
+                    taken.add(body.custom_back_half)
+                pending[body.long_url] = [i]
+
+        creating = [bodies[indices[0]] for indices in pending.values()]
+        codes = iter(await short_code_allocator.allocate_many(sum(1 for body in creating if not body.custom_back_half)))
+        rows = [
+            {
+                "bitlink": f"{REDIRECT_URL}/{short_url}",
+                "user_id": user.id,
+                "expired": False,
+                "long_url": body.long_url,
+                "title": body.title,
+                "short_url": short_url,
+            }
+            for body in creating
+            for short_url in [body.custom_back_half or next(codes)]
+        ]
+        created = await self._insert_links(rows, creating)
+
+        for indices, row, link in zip(pending.values(), rows, created):
+            for position, i in enumerate(indices):
+                if link is None:
+                    results[i] = {"index": offset + i, "status": "conflict", "error": "Custom short URL already exists"}
+                else:
+                    results[i] = self._bulk_result(offset + i, "created" if position == 0 else "existing", link)
+            if link is not None:
+                link_cache.invalidate(link.short_url)
+                link_filter.add(link.short_url, link.id)
+        return results
+
+    async def _insert_links(self, rows, bodies):
+        # Returns a Link per row, or None for a custom back half taken in the meantime
+        if not rows:
+            return []
+        statement = insert(LinkModel).returning(
+            LinkModel.id, LinkModel.bitlink, LinkModel.title, LinkModel.long_url, LinkModel.short_url,
+            LinkModel.created_at,
+        )
+        try:
+            # executemany with RETURNING is sent as multi-row INSERT ... VALUES statements. Rows
+            # are matched back by short_url: sort_by_parameter_order would make SQLite fall
+            # back to one INSERT per row.
+            created = {link.short_url: link for link in (await self.db.execute(statement, rows)).all()}
+            await self.db.commit()
+            return [created[row["short_url"]] for row in rows]
+        except IntegrityError:
+            await self.db.rollback()
+
+        # a code was taken concurrently: insert row by row, replacing generated codes that conflict
+        created = []
+        for row, body in zip(rows, bodies):
+            link = None
+            for attempt in range(SHORT_CODE_MAX_ATTEMPTS):
+                try:
+                    async with self.db.begin_nested():
+                        link = (await self.db.execute(statement, [row])).one()
+                    break
+                except IntegrityError:
+                    if body.custom_back_half:
+                        break
+                    short_code_allocator.conflicts += 1
+                    short_url = await short_code_allocator.allocate()
+                    row = {**row, "short_url": short_url, "bitlink": f"{REDIRECT_URL}/{short_url}"}
+            created.append(link)
+        await self.db.commit()
+        return created
+
+    def _bulk_result(self, index, status, link):
+        return {
+            "index": index,
+            "status": status,
+            "link": link.bitlink,
+            "title": link.title,
+            "long_url": link.long_url,
+            "id": link.id,
+            "created_at": link.created_at,
+        }
+
+    async def shorten_url(self, body, user):
         title = body.title
         long_url = body.long_url
         custom_balk_half = body.custom_back_half
         
-        link = self.db.query(LinkModel).filter(LinkModel.long_url == long_url, LinkModel.user_id == user.id).first()
+        link = (await self.db.scalars(
+            select(LinkModel).filter(LinkModel.long_url == long_url, LinkModel.user_id == user.id).limit(1)
+        )).first()
         if link:
             return {
                 "link": link.bitlink, 
@@ -106,21 +257,32 @@ class LinkService:
                 }
     
         if custom_balk_half:
-            short_url = custom_balk_half
-            if self.is_link_exist(short_url):
+            if await self.is_link_exist(custom_balk_half):
                 raise HTTPException(status_code=409, detail="Custom short URL already exists")
-        
-        else:
-            short_url = self.create_unique_short_url()
-        
-        bitlink = f'{REDIRECT_URL}/{short_url}'
 
-        new_link = LinkModel(
-            bitlink=bitlink, owner=user, expired=False, long_url=long_url, title=title, short_url=short_url
-        )
-        self.db.add(new_link)
-        self.db.commit()
-        self.db.refresh(new_link)
+        # the unique index on short_url is the collision check; a conflicting generated
+        # code (random mode, or a custom back half that happens to match) is replaced
+        for attempt in range(SHORT_CODE_MAX_ATTEMPTS):
+            short_url = custom_balk_half or await short_code_allocator.allocate()
+            bitlink = f'{REDIRECT_URL}/{short_url}'
+            new_link = LinkModel(
+                bitlink=bitlink, user_id=user.id, expired=False, long_url=long_url, title=title, short_url=short_url
+            )
+            self.db.add(new_link)
+            try:
+                await self.db.commit()
+                break
+            except IntegrityError:
+                await self.db.rollback()
+                if custom_balk_half:
+                    raise HTTPException(status_code=409, detail="Custom short URL already exists")
+                short_code_allocator.conflicts += 1
+                logger.info(f"Short code {short_url} already taken, allocating another", extra={"event": "short_code.conflict"})
+        else:
+            raise HTTPException(status_code=503, detail="Could not allocate a unique short URL")
+        await self.db.refresh(new_link)
+        link_cache.invalidate(short_url)
+        link_filter.add(short_url, new_link.id)
 
         return {
                 "link": bitlink, 
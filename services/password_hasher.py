@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+
+from passlib.context import CryptContext
+
+from config.config import BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_SIZE
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+# bcrypt releases the GIL while hashing, so a small thread pool keeps it off the event loop
+# without the pickling overhead of a process pool. Calls beyond queue_size are refused
+# instead of piling up behind a login burst.
+class PasswordHasher:
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=PASSWORD_HASH_WORKERS, queue_size=PASSWORD_HASH_QUEUE_SIZE):
+        self.rounds = rounds
+        self.workers = workers
+        self.queue_size = queue_size
+        # min and max pinned to the configured cost, so hashes made with any other cost need an update
+        self.context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,
+            bcrypt__max_rounds=rounds,
+        )
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hasher")
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    async def hash(self, password):
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password, hashed):
+        # returns (valid, new_hash); new_hash is set when the stored hash used another cost factor
+        valid, new_hash = await self._run(self.context.verify_and_update, password, hashed)
+        if new_hash:
+            self.rehashed += 1
+        return valid, new_hash
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.queue_size:
+            self.rejected += 1
+            raise PasswordHasherBusy("Too many concurrent password checks, retry shortly")
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def stats(self):
+        return {
+            "rounds": self.rounds,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            # calls running or waiting for a worker
+            "pending": self.pending,
+            "queued": max(0, self.pending - self.workers),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,38 @@
+import threading
+
+from config.config import logger
+
+
+class PeriodicTask:
+    def __init__(self, name, interval, fn, run_immediately=False):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self.run_immediately = run_immediately
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=30):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        if self.run_immediately:
+            self._run_once()
+        while not self._stop.wait(self.interval):
+            self._run_once()
+
+    def _run_once(self):
+        try:
+            self.fn()
+        except Exception as e:
+            logger.error(f"Error running periodic task {self.name}. Error: {e}")
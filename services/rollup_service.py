@@ -0,0 +1,157 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, exists, func, select, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from config.config import logger, SessionLocal, ROLLUP_MINUTE_RETENTION_MINUTES, ROLLUP_COMPACTION_INTERVAL
+from models.expressions import date_bucket
+from models.models import Click as ClickModel, ClickRollup
+from services.bucketing import truncate
+from services.click_archive import click_archive
+from services.periodic import PeriodicTask
+
+_UPSERT_INSERTS = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}
+
+
+class RollupService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def record_clicks(self, clicks):
+        # Ingestion only touches minute buckets; compact() folds them into hours and days later
+        counts = Counter(
+            (click["link_id"], truncate(click["timestamp"], "minute")) for click in clicks
+        )
+        self._increment("minute", counts)
+
+    def compaction_cutoff(self, now=None):
+        now = now or datetime.now()
+        return truncate(now - timedelta(minutes=ROLLUP_MINUTE_RETENTION_MINUTES), "minute")
+
+    def compact(self, now=None):
+        cutoff = self.compaction_cutoff(now)
+        table = ClickRollup.__table__
+        # DELETE ... RETURNING takes the rows and their counts atomically, so increments
+        # racing with compaction land either in the folded totals or in a fresh minute row
+        folded = self.db.execute(
+            delete(table).where(
+                table.c.granularity == "minute",
+                table.c.bucket_start < cutoff,
+            ).returning(table.c.link_id, table.c.bucket_start, table.c.clicks)
+        ).all()
+        hours, days = Counter(), Counter()
+        for link_id, bucket_start, clicks in folded:
+            hours[(link_id, truncate(bucket_start, "hour"))] += clicks
+            days[(link_id, truncate(bucket_start, "day"))] += clicks
+        self._increment("hour", hours)
+        self._increment("day", days)
+        self.db.commit()
+        if folded:
+            logger.info(f"Compacted {len(folded)} minute rollups older than {cutoff}")
+        return len(folded)
+
+    def series(self, link_id, granularity, start_date, end_date):
+        rows = self.db.execute(series_query(link_id, granularity, start_date, end_date)).all()
+        return merge_series(rows, granularity)
+
+    def is_backfilled(self):
+        has_clicks = self.db.query(exists().where(ClickModel.id != None)).scalar()
+        has_rollups = self.db.query(exists().where(ClickRollup.link_id != None)).scalar()
+        return has_rollups or not has_clicks
+
+    def rebuild(self, now=None):
+        # Aggregation runs in the database with dialect-specific bucketing. It reads every
+        # click, so clicks carries no bucketed indexes that each insert would have to update
+        if self.db.get_bind().dialect.name == "postgresql":
+            # Flushes wait until the rebuild commits, then add their clicks on top. A flush
+            # already holding the table is waited for and its clicks are read below.
+            self.db.execute(text("LOCK TABLE click_rollups IN EXCLUSIVE MODE"))
+        cutoff = self.compaction_cutoff(now)
+        minutes = self._bucket_counts("minute", ClickModel.timestamp >= cutoff)
+        # archived clicks are all older than the cutoff and only left in the archive
+        hours = self._bucket_counts("hour", ClickModel.timestamp < cutoff) + click_archive.bucket_counts("hour")
+        days = self._bucket_counts("day", ClickModel.timestamp < cutoff) + click_archive.bucket_counts("day")
+
+        self.db.execute(delete(ClickRollup.__table__))
+        self._increment("minute", minutes)
+        self._increment("hour", hours)
+        self._increment("day", days)
+        self.db.commit()
+        logger.info(f"Rebuilt click rollups: {len(minutes)} minute, {len(hours)} hour, {len(days)} day buckets")
+
+    def _bucket_counts(self, granularity, *filters):
+        bucket = date_bucket(ClickModel.timestamp, granularity)
+        rows = self.db.query(
+            ClickModel.link_id, bucket, func.count()
+        ).filter(*filters).group_by(ClickModel.link_id, bucket).all()
+        return Counter({(link_id, bucket_start): clicks for link_id, bucket_start, clicks in rows})
+
+    def _increment(self, granularity, counts):
+        if not counts:
+            return
+        rows = [
+            {"link_id": link_id, "granularity": granularity, "bucket_start": bucket_start, "clicks": clicks}
+            for (link_id, bucket_start), clicks in counts.items()
+        ]
+        dialect_insert = _UPSERT_INSERTS.get(self.db.get_bind().dialect.name)
+        if dialect_insert is None:
+            self._increment_generic(rows)
+            return
+        stmt = dialect_insert(ClickRollup.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["link_id", "granularity", "bucket_start"],
+            set_={"clicks": ClickRollup.__table__.c.clicks + stmt.excluded.clicks},
+        )
+        self.db.execute(stmt, rows)
+
+    def _increment_generic(self, rows):
+        for row in rows:
+            rollup = self.db.get(ClickRollup, (row["link_id"], row["granularity"], row["bucket_start"]))
+            if rollup:
+                rollup.clicks += row["clicks"]
+            else:
+                self.db.add(ClickRollup(**row))
+        self.db.flush()
+
+
+def series_query(link_id, granularity, start_date, end_date):
+    # Buckets of the requested granularity plus minute buckets not compacted yet
+    granularities = ["minute"] if granularity == "minute" else [granularity, "minute"]
+    return select(
+        ClickRollup.bucket_start, ClickRollup.clicks
+    ).filter(
+        ClickRollup.link_id == link_id,
+        ClickRollup.granularity.in_(granularities),
+        ClickRollup.bucket_start >= truncate(start_date, granularity),
+        ClickRollup.bucket_start <= end_date,
+    )
+
+
+def merge_series(rows, granularity):
+    buckets = Counter()
+    for bucket_start, clicks in rows:
+        buckets[truncate(bucket_start, granularity)] += clicks
+    return sorted(buckets.items())
+
+
+def backfill_rollups(connection):
+    # Existing deployments have clicks but no rollups yet. Runs as a migration, so once and
+    # under the migration lock, on the migration's connection and transaction.
+    with Session(bind=connection) as db:
+        rollup_service = RollupService(db)
+        if not rollup_service.is_backfilled():
+            rollup_service.rebuild()
+
+
+def compact_rollups():
+    db = SessionLocal()
+    try:
+        RollupService(db).compact()
+    finally:
+        db.close()
+
+
+rollup_compactor = PeriodicTask("rollup-compactor", ROLLUP_COMPACTION_INTERVAL, compact_rollups)
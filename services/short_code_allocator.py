@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import hmac
+import secrets
+import string
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+
+from config.config import (
+    sequence_engine,
+    SHORT_CODE_ALLOCATOR,
+    SHORT_CODE_KEY,
+    SHORT_CODE_LENGTH,
+    SHORT_CODE_BLOCK_SIZE,
+)
+from models.models import ShortCodeSequence
+
+BASE62 = string.digits + string.ascii_letters
+
+ROUNDS = 4
+
+
+def derive_round_keys(key):
+    # Round keys of the Feistel permutation that scrambles counter values. Anyone holding
+    # them can map codes back to counter values and enumerate every issued code, so they
+    # come from a secret. Changing it on a live deployment maps new counter values onto
+    # codes that were already issued; the unique index turns those into conflicts.
+    if not key:
+        raise ValueError("SHORT_CODE_KEY must be set to use the counter short code allocator")
+    return tuple(hmac.new(key.encode(), f"short-code-round-{i}".encode(), hashlib.sha256).digest() for i in range(ROUNDS))
+
+
+def round_function(key, value):
+    return int.from_bytes(hashlib.blake2b(value.to_bytes(8, "little"), key=key, digest_size=8).digest(), "little")
+
+
+def permute(value, space, round_keys):
+    # A Feistel network is a bijection on [0, 2**bits); cycle walking (re-applying it until
+    # the result falls inside the space) restricts it to a bijection on [0, space)
+    half_bits = ((space - 1).bit_length() + 1) // 2
+    mask = (1 << half_bits) - 1
+    while True:
+        left, right = value >> half_bits, value & mask
+        for key in round_keys:
+            left, right = right, left ^ (round_function(key, right) & mask)
+        value = (left << half_bits) | right
+        if value < space:
+            return value
+
+
+def encode_base62(value, length):
+    chars = []
+    for _ in range(length):
+        value, remainder = divmod(value, 62)
+        chars.append(BASE62[remainder])
+    return "".join(reversed(chars))
+
+
+class CounterAllocator:
+    # Each process leases SHORT_CODE_BLOCK_SIZE counter values at a time with one
+    # UPDATE ... RETURNING on short_code_sequences, then hands them out without touching
+    # the database. Blocks never overlap across workers, and the keyed permutation keeps
+    # consecutive codes from looking sequential or being guessable from one another.
+    name = "counter"
+
+    def __init__(self, engine=sequence_engine, length=SHORT_CODE_LENGTH, block_size=SHORT_CODE_BLOCK_SIZE, sequence="links",
+                 key=SHORT_CODE_KEY):
+        self.round_keys = derive_round_keys(key)
+        self.engine = engine
+        self.length = length
+        self.block_size = block_size
+        self.sequence = sequence
+        self.space = 62 ** length
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+        self.allocated = 0
+        self.leases = 0
+        self.conflicts = 0
+
+    async def allocate(self):
+        return (await self.allocate_many(1))[0]
+
+    async def allocate_many(self, count):
+        codes = []
+        while len(codes) < count:
+            if self._next >= self._end:
+                async with self._lock:
+                    if self._next >= self._end:
+                        self._next, self._end = await self._lease(max(self.block_size, count - len(codes)))
+            start = self._next
+            stop = min(self._end, start + count - len(codes))
+            self._next = stop
+            codes.extend(self.encode(value) for value in range(start, stop))
+        self.allocated += len(codes)
+        return codes
+
+    def encode(self, value):
+        if value >= self.space:
+            raise OverflowError(f"short code space of length {self.length} is exhausted")
+        return encode_base62(permute(value, self.space, self.round_keys), self.length)
+
+    async def _lease(self, size):
+        table = ShortCodeSequence.__table__
+        while True:
+            async with self.engine.begin() as connection:
+                end = (await connection.execute(
+                    update(table)
+                    .where(table.c.name == self.sequence)
+                    .values(next_value=table.c.next_value + size)
+                    .returning(table.c.next_value)
+                )).scalar()
+            if end is not None:
+                self.leases += 1
+                return end - size, end
+            try:
+                async with self.engine.begin() as connection:
+                    await connection.execute(insert(table).values(name=self.sequence, next_value=0))
+            except IntegrityError:
+                # another worker created the sequence first
+                pass
+
+    def stats(self):
+        return {
+            "allocator": self.name,
+            "length": self.length,
+            "block_size": self.block_size,
+            "allocated": self.allocated,
+            "leases": self.leases,
+            "conflicts": self.conflicts,
+            "remaining_in_block": self._end - self._next,
+        }
+
+
+class RandomAllocator:
+    # Codes come from secrets; uniqueness is left to the unique index on links.short_url,
+    # and callers draw a new code when an insert conflicts.
+    name = "random"
+
+    def __init__(self, length=SHORT_CODE_LENGTH):
+        self.length = length
+        self.allocated = 0
+        self.conflicts = 0
+
+    async def allocate(self):
+        return (await self.allocate_many(1))[0]
+
+    async def allocate_many(self, count):
+        self.allocated += count
+        return ["".join(secrets.choice(BASE62) for _ in range(self.length)) for _ in range(count)]
+
+    def stats(self):
+        return {
+            "allocator": self.name,
+            "length": self.length,
+            "allocated": self.allocated,
+            "conflicts": self.conflicts,
+        }
+
+
+def create_allocator(name=SHORT_CODE_ALLOCATOR, **kwargs):
+    if name == "counter":
+        return CounterAllocator(**kwargs)
+    if name == "random":
+        return RandomAllocator(**kwargs)
+    raise ValueError(f"Unknown short code allocator {name!r}")
+
+
+short_code_allocator = create_allocator()
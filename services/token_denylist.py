@@ -0,0 +1,76 @@
+import threading
+import time
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config.config import logger, SessionLocal, TOKEN_DENYLIST_REFRESH_INTERVAL
+from models.models import RevokedToken
+from services.periodic import PeriodicTask
+
+_INSERTS = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}
+
+
+# Revoked token ids, each kept until the token would have expired anyway. The
+# revoked_tokens table is shared by all workers; each one checks tokens against an
+# in-memory copy, which its own logouts update at once and which picks up other workers'
+# logouts every refresh_interval. Unlike TTLCache there is no size bound, since evicting
+# an entry would make a revoked token valid again.
+class TokenDenylist:
+    def __init__(self, session_factory=SessionLocal, refresh_interval=TOKEN_DENYLIST_REFRESH_INTERVAL):
+        self.session_factory = session_factory
+        self.refresh_interval = refresh_interval
+        self._revoked = {}
+        self._lock = threading.Lock()
+        self.refreshes = 0
+        self.purged = 0
+        self._task = PeriodicTask("token-denylist", refresh_interval, self.refresh, run_immediately=True)
+
+    def start(self):
+        self._task.start()
+
+    def stop(self):
+        self._task.stop()
+
+    async def revoke(self, db: AsyncSession, jti, expires_at: float):
+        expires_at = int(expires_at)
+        if expires_at <= time.time():
+            return
+        stmt = _INSERTS[db.get_bind().dialect.name](RevokedToken.__table__).values(jti=jti, expires_at=expires_at)
+        # the same token logged out twice, possibly on two workers
+        await db.execute(stmt.on_conflict_do_nothing(index_elements=["jti"]))
+        await db.commit()
+        self._remember({jti: expires_at})
+
+    def is_revoked(self, jti):
+        expires_at = self._revoked.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    def refresh(self):
+        now = int(time.time())
+        with self.session_factory() as db:
+            purged = db.execute(delete(RevokedToken).where(RevokedToken.expires_at <= now)).rowcount
+            db.commit()
+            rows = db.execute(select(RevokedToken.jti, RevokedToken.expires_at).where(RevokedToken.expires_at > now)).all()
+        # merged rather than replaced: a logout on this worker that committed after the
+        # select above must not disappear until the next refresh
+        self._remember(dict(rows))
+        self.refreshes += 1
+        self.purged += purged
+        if purged:
+            logger.info(f"Purged {purged} expired revoked tokens")
+
+    def _remember(self, revoked):
+        now = time.time()
+        with self._lock:
+            merged = {key: exp for key, exp in self._revoked.items() if exp > now}
+            merged.update(revoked)
+            self._revoked = merged
+
+    def stats(self):
+        return {"size": len(self._revoked), "refreshes": self.refreshes, "purged": self.purged}
+
+
+token_denylist = TokenDenylist()
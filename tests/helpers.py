@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+import random
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from config.config import async_database_url
+from models.models import Base, User as UserModel, Link as LinkModel, Click as ClickModel, IPInfo as IPInfoModel
+
+COUNTRIES = ["US", "DE", "GB", "FR", "IN", "BR", "JP"]
+
+
+def create_session_factory(database_url):
+    engine = create_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def create_async_session_factory(database_url):
+    engine = create_async_engine(async_database_url(database_url))
+    return engine, async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+
+def seed_links(db, users=1, links_per_user=1, prefix="test"):
+    user_rows = [{"username": f"{prefix}-user-{i}", "password": "x"} for i in range(users)]
+    user_ids = db.execute(insert(UserModel).returning(UserModel.id, sort_by_parameter_order=True), user_rows).scalars().all()
+    link_rows = [
+        {
+            "bitlink": f"http://localhost:8000/t{user_id}x{i}",
+            "short_url": f"t{user_id}x{i}",
+            "long_url": f"example.com/{user_id}/{i}",
+            "title": f"test {i}",
+            "user_id": user_id,
+            "expired": False,
+            "created_at": datetime.now(),
+        }
+        for user_id in user_ids
+        for i in range(links_per_user)
+    ]
+    link_ids = db.execute(insert(LinkModel).returning(LinkModel.id, sort_by_parameter_order=True), link_rows).scalars().all()
+    db.commit()
+    return user_ids, link_ids
+
+
+def seed_clicks(db, link_id, clicks, days=45, distinct_ips=500, with_ip_info=True, seed=0):
+    rng = random.Random(seed)
+    now = datetime.now()
+    ips = [f"10.0.{i // 256}.{i % 256}" for i in range(distinct_ips)]
+    rows = [
+        {
+            "link_id": link_id,
+            "ip": rng.choice(ips),
+            "user_agent": f"test-agent-{rng.randrange(10)}",
+            "timestamp": now - timedelta(seconds=rng.randrange(days * 86400)),
+        }
+        for _ in range(clicks)
+    ]
+    ids = db.execute(insert(ClickModel).returning(ClickModel.id, sort_by_parameter_order=True), rows).scalars().all()
+    if with_ip_info:
+        db.execute(insert(IPInfoModel), [
+            {"click_id": click_id, "ip": row["ip"], "country": rng.choice(COUNTRIES), "city": "test"}
+            for click_id, row in zip(ids, rows)
+        ])
+    db.commit()
+    return ids
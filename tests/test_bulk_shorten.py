@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+
+from models.models import Link as LinkModel, User as UserModel
+from services.link_service import LinkService
+from tests.helpers import create_async_session_factory, create_session_factory, seed_links
+
+
+@pytest.fixture(scope="module")
+def sessions(database_url):
+    engine, Session = create_session_factory(database_url)
+    # asyncpg connections stay tied to the loop that opened them, so every test shares one
+    async_engine, AsyncSession = create_async_session_factory(database_url)
+    loop = asyncio.new_event_loop()
+    yield Session, AsyncSession, loop
+    loop.run_until_complete(async_engine.dispose())
+    loop.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def user(sessions, request):
+    Session, _, _ = sessions
+    with Session() as db:
+        (user_id,), (link_id,) = seed_links(db, prefix=request.node.name)
+        return db.get(UserModel, user_id), db.get(LinkModel, link_id)
+
+
+def shorten(sessions, user, items, **kwargs):
+    _, AsyncSession, loop = sessions
+
+    async def stream():
+        for item in items:
+            yield item
+
+    async def run():
+        async with AsyncSession() as db:
+            return await LinkService(db).shorten_urls(stream(), user, **kwargs)
+    return loop.run_until_complete(run())
+
+
+def user_links(sessions, user):
+    Session, _, _ = sessions
+    with Session() as db:
+        return db.scalar(select(func.count()).select_from(LinkModel).filter(LinkModel.user_id == user.id))
+
+
+def test_results_keep_request_order_across_chunks(sessions, user):
+    user, link = user
+    items = [
+        {"title": "a", "long_url": "example.com/bulk/a"},
+        {"title": "existing", "long_url": link.long_url},
+        {"long_url": "example.com/bulk/no-title"},
+        {"title": "a again", "long_url": "example.com/bulk/a"},
+        {"title": "custom", "long_url": "example.com/bulk/custom", "custom_back_half": f"bulk{user.id}"},
+        {"title": "taken", "long_url": "example.com/bulk/taken", "custom_back_half": link.short_url},
+        {"title": "same custom", "long_url": "example.com/bulk/other", "custom_back_half": f"bulk{user.id}"},
+    ]
+    results, truncated = shorten(sessions, user, items, chunk_size=2)
+    assert not truncated
+    assert [result["index"] for result in results] == list(range(len(items)))
+    assert [result["status"] for result in results] == ["created", "existing", "invalid", "existing", "created", "conflict", "conflict"]
+    assert results[1]["id"] == link.id
+    assert results[3]["id"] == results[0]["id"]
+    assert "title" in results[2]["error"]
+    assert results[4]["link"].endswith(f"/bulk{user.id}")
+    assert user_links(sessions, user) == 1 + 2
+
+
+def test_duplicates_in_one_chunk_create_one_link(sessions, user):
+    user, _ = user
+    items = [{"title": f"dup {i}", "long_url": "example.com/bulk/dup"} for i in range(3)]
+    results, _ = shorten(sessions, user, items)
+    assert [result["status"] for result in results] == ["created", "existing", "existing"]
+    assert len({result["id"] for result in results}) == 1
+    assert user_links(sessions, user) == 1 + 1
+
+
+def test_streams_stop_at_max_items(sessions, user):
+    user, _ = user
+    items = [{"title": f"t{i}", "long_url": f"example.com/bulk/max/{i}"} for i in range(5)]
+    results, truncated = shorten(sessions, user, items, chunk_size=2, max_items=3)
+    assert truncated
+    assert len(results) == 3
+    assert user_links(sessions, user) == 1 + 3
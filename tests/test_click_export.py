@@ -0,0 +1,79 @@
+import asyncio
+import csv
+from datetime import datetime, timedelta
+import io
+import json
+
+import pytest
+from sqlalchemy import insert
+
+from models.models import Click as ClickModel
+from services import click_export
+from services.click_archive import ClickArchive
+from services.click_export import EXPORT_FIELDS, export_clicks
+from tests.helpers import create_async_session_factory, create_session_factory, seed_clicks, seed_links
+
+ARCHIVED_AT = datetime(2025, 3, 1)
+
+
+@pytest.fixture(scope="module")
+def exported(database_url, tmp_path_factory):
+    engine, Session = create_session_factory(database_url)
+    with Session() as db:
+        _, (link_id, other_link_id) = seed_links(db, links_per_user=2, prefix="export")
+        table_ids = seed_clicks(db, link_id, 20, days=10)
+        seed_clicks(db, other_link_id, 5, days=10)
+        # a click the enrichment worker has not reached yet
+        db.execute(insert(ClickModel), [{"link_id": link_id, "ip": "10.9.9.9", "user_agent": "ua", "timestamp": datetime.now()}])
+        db.commit()
+
+    archive = ClickArchive(str(tmp_path_factory.mktemp("archive")))
+    archive._write([
+        {"click_id": -i, "link_id": link, "timestamp": ARCHIVED_AT + timedelta(hours=i), "ip": "10.8.0.1", "user_agent": "ua",
+         "enriched": True, "city": "c", "region": None, "country": "DE", "loc": None, "org": None, "postal": None, "timezone": None}
+        for link in (link_id, other_link_id)
+        for i in range(1, 8)
+    ])
+    original, click_export.click_archive = click_export.click_archive, archive
+
+    async_engine, AsyncSession = create_async_session_factory(database_url)
+    loop = asyncio.new_event_loop()
+
+    def export(fmt="ndjson", start=None, end=None):
+        async def collect():
+            return [chunk async for chunk in export_clicks(link_id, fmt, start, end, chunk_size=4, session_factory=AsyncSession)]
+        return loop.run_until_complete(collect())
+
+    yield export, len(table_ids) + 1
+    click_export.click_archive = original
+    loop.run_until_complete(async_engine.dispose())
+    loop.close()
+    engine.dispose()
+
+
+def test_ndjson_has_archived_clicks_first_then_the_table_in_order(exported):
+    export, table_clicks = exported
+    chunks = export()
+    rows = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+    assert len(chunks) > 2
+    assert len(rows) == 7 + table_clicks
+    assert all(list(row) == list(EXPORT_FIELDS) for row in rows)
+    archived, table = rows[:7], rows[7:]
+    assert all(row["country"] == "DE" for row in archived)
+    assert [row["timestamp"] for row in archived] == sorted(row["timestamp"] for row in archived)
+    assert [row["timestamp"] for row in table] == sorted(row["timestamp"] for row in table)
+    # outer join: unenriched clicks are exported without IP info
+    assert table[-1]["ip"] == "10.9.9.9" and table[-1]["country"] is None
+
+
+def test_csv_starts_with_a_header(exported):
+    export, table_clicks = exported
+    rows = list(csv.reader(io.StringIO("".join(export("csv")))))
+    assert rows[0] == list(EXPORT_FIELDS)
+    assert len(rows) == 1 + 7 + table_clicks
+
+
+def test_time_range_applies_to_archive_and_table(exported):
+    export, _ = exported
+    rows = [json.loads(line) for chunk in export(start=ARCHIVED_AT + timedelta(hours=3), end=ARCHIVED_AT + timedelta(hours=5)) for line in chunk.splitlines()]
+    assert [row["click_id"] for row in rows] == [-3, -4, -5]
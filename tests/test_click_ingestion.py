@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime
+import json
+import threading
+
+import pytest
+from sqlalchemy import func, select
+
+from models.models import Click as ClickModel
+from services.click_ingestion import ClickIngestionPipeline, file_lock, write_offset
+from tests.helpers import create_session_factory, seed_links
+
+
+@pytest.fixture(scope="module")
+def session_factory(database_url):
+    engine, Session = create_session_factory(database_url)
+    yield Session
+    engine.dispose()
+
+
+@pytest.fixture
+def link_id(session_factory, request):
+    with session_factory() as db:
+        _, (link_id,) = seed_links(db, prefix=request.node.name)
+    return link_id
+
+
+def pipeline(session_factory, tmp_path, **kwargs):
+    return ClickIngestionPipeline(session_factory, spill_path=str(tmp_path / "clicks.spill.jsonl"), **kwargs)
+
+
+def enqueue(clicks, *records):
+    async def run():
+        for record in records:
+            await clicks.enqueue(*record)
+    asyncio.run(run())
+
+
+def stored(session_factory, link_id):
+    with session_factory() as db:
+        return db.scalar(select(func.count()).select_from(ClickModel).filter(ClickModel.link_id == link_id))
+
+
+def spilled_lines(link_id, count, start=0):
+    return [
+        json.dumps({"link_id": link_id, "ip": f"10.0.0.{i}", "user_agent": "ua", "timestamp": datetime(2026, 1, 1, 0, i).isoformat()}) + "\n"
+        for i in range(start, start + count)
+    ]
+
+
+def test_unknown_overflow_policy_is_rejected(session_factory, tmp_path):
+    with pytest.raises(ValueError):
+        pipeline(session_factory, tmp_path, overflow_policy="ignore")
+
+
+def test_drop_oldest_keeps_the_newest_clicks(session_factory, tmp_path, link_id):
+    clicks = pipeline(session_factory, tmp_path, max_size=3, overflow_policy="drop_oldest")
+    enqueue(clicks, *[(link_id, f"10.0.0.{i}", "ua") for i in range(5)])
+    assert clicks.stats()["dropped"] == 2
+    assert [record["ip"] for record in clicks._queue] == ["10.0.0.2", "10.0.0.3", "10.0.0.4"]
+    assert clicks.flush() == 3
+    assert stored(session_factory, link_id) == 3
+
+
+def test_spill_writes_overflow_to_the_spill_file(session_factory, tmp_path, link_id):
+    clicks = pipeline(session_factory, tmp_path, max_size=2, overflow_policy="spill")
+    enqueue(clicks, *[(link_id, f"10.0.0.{i}", "ua") for i in range(3)])
+    assert clicks.stats()["spilled"] == 1
+    with open(clicks.spill_path) as f:
+        assert json.loads(f.read())["ip"] == "10.0.0.2"
+
+
+def test_block_spills_only_after_the_timeout(session_factory, tmp_path, link_id):
+    clicks = pipeline(session_factory, tmp_path, max_size=1, overflow_policy="block", block_timeout=0.05)
+    enqueue(clicks, (link_id, "10.0.0.1", "ua"), (link_id, "10.0.0.2", "ua"))
+    assert clicks.stats()["spilled"] == 1
+
+    # room made by a flush on another thread wakes the waiting enqueue
+    clicks.block_timeout = 5
+    timer = threading.Timer(0.05, clicks.flush)
+    timer.start()
+    enqueue(clicks, (link_id, "10.0.0.3", "ua"))
+    timer.join()
+    assert clicks.stats()["spilled"] == 1
+    assert [record["ip"] for record in clicks._queue] == ["10.0.0.3"]
+
+
+def test_replay_writes_spilled_clicks_and_quarantines_bad_lines(session_factory, tmp_path, link_id):
+    clicks = pipeline(session_factory, tmp_path, batch_size=2)
+    lines = spilled_lines(link_id, 3) + ["not json\n"] + spilled_lines(link_id, 2, start=3) + ['{"link_id": 1, "ip": "cut sho']
+    with open(clicks.spill_path, "w") as f:
+        f.writelines(lines)
+    clicks._replay_spill()
+    assert stored(session_factory, link_id) == 5
+    with open(clicks.spill_path + ".rejected") as f:
+        assert f.read().splitlines() == ["not json", '{"link_id": 1, "ip": "cut sho']
+    assert not (tmp_path / "clicks.spill.jsonl").exists()
+    assert not (tmp_path / "clicks.spill.jsonl.replay").exists()
+    assert not (tmp_path / "clicks.spill.jsonl.replay.offset").exists()
+
+
+def test_replay_resumes_after_the_last_committed_batch(session_factory, tmp_path, link_id):
+    clicks = pipeline(session_factory, tmp_path, batch_size=2)
+    lines = spilled_lines(link_id, 5)
+    # a previous replay committed the first two lines, then the process died
+    with open(clicks.spill_path + ".replay", "w") as f:
+        f.writelines(lines)
+    write_offset(clicks.spill_path + ".replay.offset", len("".join(lines[:2]).encode()))
+    clicks._replay_spill()
+    assert stored(session_factory, link_id) == 3
+
+
+def test_replay_is_skipped_while_another_worker_replays(session_factory, tmp_path, link_id):
+    clicks = pipeline(session_factory, tmp_path)
+    with open(clicks.spill_path, "w") as f:
+        f.writelines(spilled_lines(link_id, 2))
+    with file_lock(clicks.spill_path + ".replay.lock") as owned:
+        assert owned
+        clicks._replay_spill()
+    assert stored(session_factory, link_id) == 0
+    clicks._replay_spill()
+    assert stored(session_factory, link_id) == 2
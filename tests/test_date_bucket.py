@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import literal, select
+from sqlalchemy.types import DateTime
+
+from models.expressions import date_bucket
+from services.bucketing import UNITS, truncate
+from tests.helpers import create_session_factory
+
+# date_bucket runs in SQL for rollup rebuilds and truncate runs in Python for series and
+# archived clicks; both must put every timestamp in the same bucket
+TIMESTAMPS = [
+    datetime(2024, 1, 1, 0, 0, 0),
+    datetime(2024, 2, 29, 23, 59, 59, 999999),
+    datetime(2024, 3, 10, 12, 30, 45, 123456),
+    # a Sunday and the Monday after it, either side of a week boundary
+    datetime(2024, 6, 9, 23, 59, 59),
+    datetime(2024, 6, 10, 0, 0, 0),
+    datetime(2024, 12, 31, 23, 59, 30),
+] + [datetime(2025, 1, 1, 7, 13, 29) + timedelta(days=day, minutes=37 * day) for day in range(14)]
+
+
+@pytest.fixture(scope="module")
+def engine(database_url):
+    engine, _ = create_session_factory(database_url)
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize("unit", UNITS)
+def test_date_bucket_matches_truncate(engine, unit):
+    with engine.connect() as connection:
+        for value in TIMESTAMPS:
+            bucket = connection.execute(select(date_bucket(literal(value, DateTime()), unit))).scalar()
+            # SQLite returns the strftime text, which the DateTime type does not parse back
+            if isinstance(bucket, str):
+                bucket = datetime.fromisoformat(bucket)
+            assert bucket == truncate(value, unit), f"{unit} bucket of {value}"
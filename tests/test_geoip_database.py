@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from services.geoip_database import GeoIPDatabase, flatten_ranges
+
+ROWS = [
+    # nested networks, listed from the widest
+    ("10.0.0.0/8", "", "", "A"),
+    ("10.1.0.0/16", "", "", "B"),
+    ("10.1.2.0/24", "", "", "C"),
+    # ranges overlapping without nesting
+    ("", "20.0.0.0", "20.0.0.99", "D"),
+    ("", "20.0.0.50", "20.0.0.199", "E"),
+    ("2001:db8::/32", "", "", "F"),
+    ("2001:db8:1::/48", "", "", "G"),
+]
+
+
+@pytest.fixture
+def database(tmp_path):
+    csv_path = tmp_path / "geoip.csv"
+    with open(csv_path, "w") as f:
+        f.write("network,start_ip,end_ip,country\n")
+        f.writelines(",".join(row) + "\n" for row in ROWS)
+    return GeoIPDatabase(str(csv_path), cache_path=str(tmp_path / "cache" / "geoip.bin"))
+
+
+@pytest.mark.parametrize("ip, country", [
+    ("10.0.0.1", "A"),
+    ("10.1.0.1", "B"),
+    ("10.1.2.255", "C"),
+    ("10.1.3.0", "B"),
+    ("10.255.255.255", "A"),
+    ("20.0.0.49", "D"),
+    ("20.0.0.50", "D"),
+    ("20.0.0.100", "E"),
+    ("2001:db8::1", "F"),
+    ("2001:db8:1::1", "G"),
+    ("2001:db8:2::1", "F"),
+    ("::ffff:10.1.2.3", "C"),
+])
+def test_narrowest_range_wins(database, ip, country):
+    assert database.lookup(ip)["country"] == country
+
+
+@pytest.mark.parametrize("ip", ["9.255.255.255", "11.0.0.0", "20.0.0.200", "2001:db9::1"])
+def test_addresses_outside_every_range(database, ip):
+    assert database.lookup(ip) is None
+
+
+def test_compiled_database_goes_to_the_cache_path(database, tmp_path):
+    assert os.path.exists(tmp_path / "cache" / "geoip.bin")
+    assert not os.path.exists(tmp_path / "geoip.csv.bin")
+
+
+def test_flatten_merges_adjacent_pieces_with_the_same_location():
+    location = ("X",)
+    assert flatten_ranges([(0, 9, location), (10, 19, location), (5, 6, location)]) == [(0, 19, location)]
+    assert flatten_ranges([(0, 9, ("X",)), (3, 4, ("Y",))]) == [(0, 2, ("X",)), (3, 4, ("Y",)), (5, 9, ("X",))]
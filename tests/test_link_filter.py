@@ -0,0 +1,101 @@
+import pytest
+from sqlalchemy import update
+
+from models.models import Link as LinkModel
+from services.link_filter import CuckooFilter, LinkFilter
+from tests.helpers import create_session_factory, seed_links
+
+KEYS = [f"code{i}" for i in range(5000)]
+
+
+def test_added_keys_are_always_found():
+    cuckoo = CuckooFilter(len(KEYS))
+    for key in KEYS:
+        assert cuckoo.add(key)
+    assert cuckoo.count == len(KEYS)
+    assert not cuckoo.full
+    assert all(key in cuckoo for key in KEYS)
+
+
+def test_false_positive_rate_stays_near_the_estimate():
+    cuckoo = CuckooFilter(len(KEYS))
+    for key in KEYS:
+        cuckoo.add(key)
+    unknown = [f"missing{i}" for i in range(50000)]
+    false_positives = sum(key in cuckoo for key in unknown)
+    # 16-bit fingerprints at this load estimate about 0.01%
+    assert cuckoo.false_positive_rate() < 0.001
+    assert false_positives / len(unknown) < 0.001
+
+
+def test_discard_removes_only_that_key():
+    cuckoo = CuckooFilter(len(KEYS))
+    for key in KEYS:
+        cuckoo.add(key)
+    removed = KEYS[::2]
+    for key in removed:
+        assert cuckoo.discard(key)
+    assert cuckoo.count == len(KEYS) - len(removed)
+    assert all(key in cuckoo for key in KEYS[1::2])
+    assert sum(key in cuckoo for key in removed) < 5
+
+
+def test_full_filter_answers_maybe_for_everything():
+    cuckoo = CuckooFilter(16)
+    for key in KEYS:
+        cuckoo.add(key)
+    assert cuckoo.full
+    assert "never-added" in cuckoo
+
+
+@pytest.fixture
+def session_factory(database_url):
+    engine, Session = create_session_factory(database_url)
+    yield Session
+    engine.dispose()
+
+
+@pytest.fixture
+def link_filter(session_factory):
+    return LinkFilter(session_factory, enabled=True, capacity=100, refresh_interval=1, rebuild_interval=3600, refresh_overlap=10)
+
+
+def test_misses_are_answered_before_the_first_build(link_filter):
+    assert link_filter.might_contain("anything")
+    assert link_filter.stats()["lookups"] == 0
+
+
+def test_refresh_picks_up_links_created_elsewhere(session_factory, link_filter):
+    with session_factory() as db:
+        seed_links(db, users=1, links_per_user=3, prefix="refresh")
+        codes = [link.short_url for link in db.query(LinkModel).filter(LinkModel.expired == False)]
+    link_filter.refresh()
+    assert all(link_filter.might_contain(code) for code in codes)
+    assert not link_filter.might_contain("unknown-code")
+
+    # another worker's link is rejected until the next refresh
+    with session_factory() as db:
+        _, (link_id,) = seed_links(db, users=1, links_per_user=1, prefix="elsewhere")
+        new_code = db.get(LinkModel, link_id).short_url
+    assert not link_filter.might_contain(new_code)
+    link_filter.refresh()
+    assert link_filter.might_contain(new_code)
+    assert link_filter.stats()["refreshes"] == 1
+
+
+def test_rebuild_leaves_out_expired_links(session_factory, link_filter):
+    with session_factory() as db:
+        _, link_ids = seed_links(db, users=1, links_per_user=2, prefix="expired")
+        expired = db.get(LinkModel, link_ids[0]).short_url
+        db.execute(update(LinkModel).where(LinkModel.id == link_ids[0]).values(expired=True))
+        db.commit()
+    link_filter.rebuild()
+    assert not link_filter.might_contain(expired)
+
+
+def test_local_add_and_discard_apply_at_once(link_filter):
+    link_filter.rebuild()
+    link_filter.add("local-code", link_id=10**9)
+    assert link_filter.might_contain("local-code")
+    link_filter.discard("local-code")
+    assert not link_filter.might_contain("local-code")
@@ -0,0 +1,124 @@
+import asyncio
+from datetime import datetime, timedelta
+import re
+
+import pytest
+from sqlalchemy import event, text
+
+from middlewares.link_validation import resolve_short_url
+from models.migrations import run_migrations
+from models.models import Link as LinkModel, User as UserModel
+from schemas.Schemas import ShortenLinkRequest
+from services.cache import link_cache
+from services.click_service import ClickService
+from services.link_service import LinkService
+from services.rollup_service import RollupService
+from tests.helpers import create_session_factory, create_async_session_factory, seed_links, seed_clicks
+
+# Runs the hot request-path queries against a seeded database, EXPLAINs every SELECT
+# they issue and fails if any of them falls back to a full table scan.
+
+SQLITE_TABLE_SCAN = re.compile(r"^SCAN (\w+)$")
+POSTGRES_TABLE_SCAN = re.compile(r"Seq Scan on (\w+)")
+HOT_QUERIES = [
+    "redirect lookup",
+    "shorten dedup",
+    "active links",
+    "unique clicks",
+    "clicks by country",
+    "clicks by minute",
+    "clicks by hour",
+    "clicks by week",
+]
+
+
+async def hot_queries(db, user_id, link_id):
+    user = await db.get(UserModel, user_id)
+    link = await db.get(LinkModel, link_id)
+    link_service = LinkService(db)
+    click_service = ClickService(db)
+    now = datetime.now()
+    return {
+        "redirect lookup": lambda: resolve_short_url(link.short_url, db),
+        "shorten dedup": lambda: link_service.shorten_url(ShortenLinkRequest(title="t", long_url=link.long_url), user),
+        "active links": lambda: link_service.get_user_active_links(user),
+        "unique clicks": lambda: link_service.get_unique_clicks(link_id, limit=50),
+        "clicks by country": lambda: click_service.clicks_by_country(link_id, now - timedelta(days=7), now),
+        "clicks by minute": lambda: click_service.clicks_by_minute(link_id),
+        "clicks by hour": lambda: click_service.clicks_by_hour(link_id),
+        "clicks by week": lambda: click_service.clicks_by_week(link_id),
+    }
+
+
+def capture_statements(engine, fn):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        fn()
+        return statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def table_scans(connection, statement, parameters):
+    if connection.dialect.name == "sqlite":
+        plan = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+        lines = [row[-1] for row in plan]
+        scans = [m.group(1) for m in map(SQLITE_TABLE_SCAN.match, lines) if m]
+    else:
+        plan = connection.exec_driver_sql("EXPLAIN " + statement, parameters).all()
+        lines = [row[0] for row in plan]
+        scans = [m.group(1) for m in map(POSTGRES_TABLE_SCAN.search, lines) if m]
+    return scans, lines
+
+
+def explain_statements(connection, statements):
+    if connection.dialect.name == "postgresql":
+        # small seeded tables make seq scans look cheap; this asks whether an index path exists
+        connection.execute(text("SET enable_seqscan = off"))
+    return [(statement, *table_scans(connection, statement, parameters)) for statement, parameters in statements]
+
+
+async def explain(async_engine, statements):
+    async with async_engine.connect() as connection:
+        return await connection.run_sync(explain_statements, statements)
+
+
+@pytest.fixture(scope="module")
+def seeded(database_url):
+    engine, Session = create_session_factory(database_url)
+    run_migrations(engine)
+    with Session() as db:
+        user_ids, link_ids = seed_links(db, users=20, links_per_user=10)
+        seed_clicks(db, link_ids[0], 5000)
+        RollupService(db).rebuild()
+    with engine.begin() as connection:
+        connection.exec_driver_sql("ANALYZE")
+
+    # the services run on the async engine; its sync_engine emits the cursor events
+    async_engine, AsyncSession = create_async_session_factory(database_url)
+    loop = asyncio.new_event_loop()
+    db = AsyncSession()
+    queries = loop.run_until_complete(hot_queries(db, user_ids[0], link_ids[0]))
+    yield loop, async_engine, db, queries
+    loop.run_until_complete(db.close())
+    loop.run_until_complete(async_engine.dispose())
+    loop.close()
+    engine.dispose()
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_hot_query_does_not_scan_a_table(seeded, name):
+    loop, async_engine, db, queries = seeded
+    link_cache.clear()
+    statements = capture_statements(async_engine.sync_engine, lambda: loop.run_until_complete(queries[name]()))
+    loop.run_until_complete(db.commit())
+    assert statements, f"{name} ran no SELECT"
+    # captured statements use the async driver's paramstyle, so they are explained on the same engine
+    for statement, scans, plan in loop.run_until_complete(explain(async_engine, statements)):
+        assert not scans, f"full scan of {', '.join(scans)} in {' '.join(statement.split())}: {' | '.join(plan)}"
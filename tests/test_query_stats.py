@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event, text
+
+from config.query_stats import instrument_engine, normalize_sql, _after_cursor_execute, _before_cursor_execute
+from middlewares.query_stats import QueryStatsMiddleware
+from tests.helpers import create_session_factory
+
+
+@pytest.mark.parametrize("statement, normalized", [
+    ("SELECT *  FROM links\n WHERE id = 42", "SELECT * FROM links WHERE id = ?"),
+    ("SELECT * FROM users WHERE username = 'o''brien'", "SELECT * FROM users WHERE username = ?"),
+    ("SELECT * FROM clicks WHERE link_id = $1 AND ip = $2", "SELECT * FROM clicks WHERE link_id = ? AND ip = ?"),
+    ("SELECT * FROM clicks WHERE link_id = %(link_id_1)s", "SELECT * FROM clicks WHERE link_id = ?"),
+    ("SELECT * FROM ip_info WHERE click_id IN (?, ?, ?)", "SELECT * FROM ip_info WHERE click_id IN (?, ...)"),
+    # digits inside identifiers are kept
+    ("SELECT * FROM clicks_2026_03 WHERE t1.id = 7", "SELECT * FROM clicks_2026_03 WHERE t1.id = ?"),
+])
+def test_normalize_sql(statement, normalized):
+    assert normalize_sql(statement) == normalized
+
+
+@pytest.fixture
+def engine(database_url):
+    engine, _ = create_session_factory(database_url)
+    instrument_engine(engine)
+    yield engine
+    event.remove(engine, "before_cursor_execute", _before_cursor_execute)
+    event.remove(engine, "after_cursor_execute", _after_cursor_execute)
+    engine.dispose()
+
+
+def request(middleware):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/links", "headers": []}
+    asyncio.run(middleware(scope, receive, send))
+    return dict(sent[0]["headers"])
+
+
+def endpoint(engine, queries):
+    async def app(scope, receive, send):
+        with engine.connect() as connection:
+            for i in range(queries):
+                connection.execute(text(f"SELECT {i}"))
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+    return app
+
+
+def test_server_timing_counts_the_request_queries(engine):
+    headers = request(QueryStatsMiddleware(endpoint(engine, 3), slow_queries=10, slow_ms=10_000))
+    assert b'desc="3 queries"' in headers[b"server-timing"]
+
+    # statements outside a request are not counted
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    headers = request(QueryStatsMiddleware(endpoint(engine, 0), slow_queries=10, slow_ms=10_000))
+    assert b'desc="0 queries"' in headers[b"server-timing"]
+
+
+def test_slow_requests_are_logged_with_merged_statements(engine, monkeypatch):
+    logged = []
+    middleware = QueryStatsMiddleware(endpoint(engine, 5), slow_queries=4, slow_ms=10_000)
+    monkeypatch.setattr(middleware, "_log_slow_request", lambda scope, status, elapsed_ms, stats: logged.append((status, stats)))
+    request(middleware)
+    (status, stats), = logged
+    assert status == 200
+    assert stats.count == 5
+    assert stats.normalized_statements()[0]["count"] == 5
+    assert stats.summary()["slowest_sql"] == "SELECT ?"
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from services.short_code_allocator import CounterAllocator, derive_round_keys, permute
+from tests.helpers import create_async_session_factory, create_session_factory
+
+KEY = "test-key"
+
+
+@pytest.mark.parametrize("space", [62 ** 2, 1000, 7])
+def test_permute_is_a_bijection_on_the_space(space):
+    round_keys = derive_round_keys(KEY)
+    assert sorted(permute(value, space, round_keys) for value in range(space)) == list(range(space))
+
+
+def test_permutation_depends_on_the_key():
+    space = 62 ** 3
+    first = [permute(value, space, derive_round_keys(KEY)) for value in range(100)]
+    second = [permute(value, space, derive_round_keys("other-key")) for value in range(100)]
+    assert first != second
+    # consecutive counter values do not map to consecutive codes
+    assert sum(b - a == 1 for a, b in zip(first, first[1:])) < 5
+
+
+def test_counter_allocator_needs_a_key():
+    with pytest.raises(ValueError):
+        CounterAllocator(engine=None, key="")
+
+
+@pytest.fixture
+def async_engine(database_url):
+    engine, _ = create_session_factory(database_url)
+    engine.dispose()
+    async_engine, _ = create_async_session_factory(database_url)
+    yield async_engine
+    asyncio.run(async_engine.dispose())
+
+
+def test_leases_never_overlap_across_allocators(async_engine):
+    # two workers sharing one sequence, each leasing small blocks concurrently
+    workers = [CounterAllocator(engine=async_engine, length=4, block_size=7, sequence="overlap", key=KEY) for _ in range(2)]
+
+    async def allocate():
+        batches = await asyncio.gather(*(worker.allocate_many(n) for worker in workers for n in (1, 5, 20, 3)))
+        singles = [await worker.allocate() for worker in workers for _ in range(10)]
+        return [code for batch in batches for code in batch] + singles
+
+    codes = asyncio.run(allocate())
+    assert len(codes) == 2 * (1 + 5 + 20 + 3 + 10)
+    assert len(set(codes)) == len(codes)
+    assert all(len(code) == 4 for code in codes)
+    assert sum(worker.leases for worker in workers) >= 2
+
+
+def test_encode_refuses_values_past_the_space():
+    allocator = CounterAllocator(engine=None, length=1, key=KEY)
+    assert len({allocator.encode(value) for value in range(62)}) == 62
+    with pytest.raises(OverflowError):
+        allocator.encode(62)
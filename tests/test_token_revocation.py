@@ -0,0 +1,83 @@
+import asyncio
+from collections import namedtuple
+import time
+
+from fastapi import HTTPException
+import pytest
+from sqlalchemy import func, select
+
+from models.models import RevokedToken
+from services import auth_service
+from services.auth_service import create_access_token, decode_access_token
+from services.token_denylist import TokenDenylist
+from tests.helpers import create_async_session_factory, create_session_factory
+
+AccountRow = namedtuple("AccountRow", ["id", "username"])
+
+
+@pytest.fixture(scope="module")
+def sessions(database_url):
+    engine, Session = create_session_factory(database_url)
+    async_engine, AsyncSession = create_async_session_factory(database_url)
+    loop = asyncio.new_event_loop()
+    yield Session, AsyncSession, loop
+    loop.run_until_complete(async_engine.dispose())
+    loop.close()
+    engine.dispose()
+
+
+def revoke(sessions, denylist, jti, expires_at):
+    _, AsyncSession, loop = sessions
+
+    async def run():
+        async with AsyncSession() as db:
+            await denylist.revoke(db, jti, expires_at)
+    loop.run_until_complete(run())
+
+
+def stored(sessions, jti):
+    Session, _, _ = sessions
+    with Session() as db:
+        return db.scalar(select(func.count()).select_from(RevokedToken).filter(RevokedToken.jti == jti))
+
+
+def test_revoked_token_is_rejected(sessions, monkeypatch):
+    Session, _, _ = sessions
+    denylist = TokenDenylist(Session)
+    monkeypatch.setattr(auth_service, "token_denylist", denylist)
+    token = create_access_token(AccountRow(1, "logout"))
+    user = decode_access_token(token)
+    revoke(sessions, denylist, user.jti, user.expires_at)
+    with pytest.raises(HTTPException) as error:
+        decode_access_token(token)
+    assert error.value.status_code == 401
+    # other tokens of the same user stay valid
+    assert decode_access_token(create_access_token(AccountRow(1, "logout"))).id == 1
+
+
+def test_other_workers_pick_up_revocations_on_refresh(sessions):
+    Session, _, _ = sessions
+    worker, other = TokenDenylist(Session), TokenDenylist(Session)
+    revoke(sessions, worker, "shared-jti", time.time() + 60)
+    # logging out twice, here on the other worker, is not an error
+    revoke(sessions, other, "shared-jti", time.time() + 60)
+    assert worker.is_revoked("shared-jti")
+    late = TokenDenylist(Session)
+    assert not late.is_revoked("shared-jti")
+    late.refresh()
+    assert late.is_revoked("shared-jti")
+    assert stored(sessions, "shared-jti") == 1
+
+
+def test_expired_revocations_are_purged(sessions):
+    Session, _, _ = sessions
+    denylist = TokenDenylist(Session)
+    revoke(sessions, denylist, "already-expired", time.time() - 1)
+    assert stored(sessions, "already-expired") == 0
+    revoke(sessions, denylist, "short-lived", time.time() + 1)
+    assert denylist.is_revoked("short-lived")
+    time.sleep(1.1)
+    assert not denylist.is_revoked("short-lived")
+    denylist.refresh()
+    assert stored(sessions, "short-lived") == 0
+    assert denylist.stats()["purged"] >= 1